@@ -0,0 +1,170 @@
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+
+class AliasIndex:
+    """
+    实体别名的并查集
+
+    每个主实体和它的所有别名构成一个集合。合并实体时把两个集合整体合并
+    （按集合大小挂接，查找时压缩路径），被合并实体原有的别名随之指向新的主实体，
+    不会留下指向已删除实体的别名。主实体只在图谱中添加节点时创建，
+    删除节点时整个集合一并删除，因此查找结果总是图谱中存在的节点。
+    """
+
+    def __init__(self):
+        self._parent: Dict[str, str] = {}  # 名称 -> 树中的父节点
+        self._size: Dict[str, int] = {}  # 树根 -> 集合大小
+        self._label: Dict[str, str] = {}  # 树根 -> 主实体ID
+        self._root: Dict[str, str] = {}  # 主实体ID -> 树根
+        # 主实体ID -> 别名集合（不含主实体本身），即原来的 entity_aliases
+        self.members: Dict[str, Set[str]] = {}
+
+    def __contains__(self, name) -> bool:
+        return name in self._parent
+
+    def __len__(self) -> int:
+        return len(self._parent)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._parent)
+
+    def find(self, name: str) -> Optional[str]:
+        """
+        查找名称对应的主实体
+
+        Args:
+            name: 实体ID或别名
+
+        Returns:
+            Optional[str]: 主实体ID，未知名称返回 None
+        """
+        if name not in self._parent:
+            return None
+        return self._label[self._find_root(name)]
+
+    def is_main(self, name: str) -> bool:
+        """名称是否是某个集合的主实体"""
+        return name in self._root
+
+    def add_main(self, main_id: str) -> None:
+        """为新的主实体创建集合（名称已存在时不做修改）"""
+        if main_id in self._parent:
+            return
+        self._parent[main_id] = main_id
+        self._size[main_id] = 1
+        self._label[main_id] = main_id
+        self._root[main_id] = main_id
+        self.members[main_id] = set()
+
+    def union(self, main_id: str, other: str) -> None:
+        """
+        把 other 所在的集合并入 main_id 的集合，合并后 main_id 仍是主实体
+
+        Args:
+            main_id: 主实体ID
+            other: 新别名，或要并入的另一个主实体
+        """
+        self.add_main(main_id)
+        root = self._find_root(main_id)
+        main_id = self._label[root]
+
+        if other not in self._parent:
+            self._parent[other] = root
+            self._size[root] += 1
+            self.members[main_id].add(other)
+            return
+
+        other_root = self._find_root(other)
+        if other_root == root:
+            return
+        other_main = self._label.pop(other_root)
+        del self._root[other_main]
+
+        # 较小的树挂到较大的树下，主实体标签随之移到新的树根
+        if self._size[root] < self._size[other_root]:
+            root, other_root = other_root, root
+        self._parent[other_root] = root
+        self._size[root] += self._size.pop(other_root)
+        self._label.pop(other_root, None)
+        self._label[root] = main_id
+        self._root[main_id] = root
+
+        merged = self.members.pop(other_main)
+        merged.add(other_main)
+        aliases = self.members[main_id]
+        if len(aliases) < len(merged):
+            aliases, merged = merged, aliases
+        aliases |= merged
+        self.members[main_id] = aliases
+
+    def remove(self, main_id: str) -> None:
+        """删除主实体及其所有别名（不是主实体时不做修改）"""
+        root = self._root.pop(main_id, None)
+        if root is None:
+            return
+        del self._label[root]
+        del self._size[root]
+        for name in self.members.pop(main_id):
+            del self._parent[name]
+        del self._parent[main_id]
+
+    def mapping(self) -> Dict[str, str]:
+        """所有名称 -> 主实体，即原来的 alias_to_main_id，用于持久化"""
+        return {name: self.find(name) for name in self._parent}
+
+    @classmethod
+    def from_mappings(
+        cls,
+        nodes: Iterable[str],
+        entity_aliases: Dict[str, Set[str]],
+        alias_to_main_id: Dict[str, str],
+    ) -> "AliasIndex":
+        """
+        由图谱节点和保存的别名映射建立并查集
+
+        旧数据中链式合并后的别名可能指向已不存在的实体，这里沿映射追溯到
+        仍在图谱中的主实体；追溯不到的别名直接丢弃。
+
+        Args:
+            nodes: 图谱中的节点
+            entity_aliases: 主实体 -> 别名集合
+            alias_to_main_id: 别名 -> 主实体
+
+        Returns:
+            AliasIndex: 别名索引
+        """
+        index = cls()
+        for node in nodes:
+            index.add_main(node)
+
+        def resolve(name: str) -> str:
+            seen = set()
+            while name not in index._root and name not in seen:
+                target = alias_to_main_id.get(name)
+                if target is None or target == name:
+                    break
+                seen.add(name)
+                name = target
+            return name
+
+        pairs = [
+            (main_id, alias)
+            for main_id, aliases in entity_aliases.items()
+            for alias in aliases
+        ]
+        pairs.extend((main_id, alias) for alias, main_id in alias_to_main_id.items())
+        for main_id, alias in pairs:
+            main_id = resolve(main_id)
+            if index.is_main(main_id) and alias not in index:
+                index.union(main_id, alias)
+        return index
+
+    def _find_root(self, name: str) -> str:
+        """查找树根并压缩路径"""
+        parent = self._parent
+        root = name
+        while parent[root] != root:
+            root = parent[root]
+        while parent[name] != root:
+            parent[name], name = root, parent[name]
+        return root
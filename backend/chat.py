@@ -319,6 +319,13 @@ class Chat:
             
             retrieval_result = None
             used_strategy = None
+
+            # 本轮所有检索策略使用同一个知识图谱版本
+            kg = (
+                self.knowledge_retriever.snapshot()
+                if self.knowledge_retriever
+                else None
+            )
             
             for strategy in strategies:
                 self._debug_print(f"[Debug] 尝试检索策略: {strategy.name}")
@@ -327,8 +334,9 @@ class Chat:
                         mode=strategy,
                         query=query_result.query,
                         entities=query_result.entities,
+                        kg=kg,
                     )
-                    if self.knowledge_retriever
+                    if kg is not None
                     else None
                 )
                 
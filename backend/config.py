@@ -11,3 +11,27 @@ load_dotenv(env_path)
 API_BASE_URL = os.getenv("API_BASE_URL", "https://api.moonshot.cn/v1")
 API_KEY = os.getenv("API_KEY") or os.getenv("KIMI_API_KEY") or ""
 PLATFORM_NAME = {"bilibili": "B站", "weibo": "微博", "zhihu": "知乎", "default": "default"}
+
+# 嵌入模型配置
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "BAAI/bge-m3")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))  # 微批次最大文本数
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))  # 凑批等待时间
+# 持久化嵌入缓存目录，设为空字符串可关闭缓存
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(current_dir, ".embedding_cache"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))  # 缓存向量文件上限
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch / int8 / onnx
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "auto")  # auto / cpu / cuda / mps
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # CPU推理线程数，0为默认
+# 本机嵌入服务的 Unix socket，服务进程运行时各进程共用其中加载的模型
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "/tmp/free_to_debate_embedding.sock")
+ENTITY_EMBEDDING_DTYPE = os.getenv("ENTITY_EMBEDDING_DTYPE", "float32")  # 实体嵌入矩阵精度 float32 / float16
+ENTITY_SELECTOR_CACHE_MB = int(os.getenv("ENTITY_SELECTOR_CACHE_MB", "64"))  # 单实体检索过滤器缓存的内存预算
+GLOBAL_DELTA_MAX_COUNT = int(os.getenv("GLOBAL_DELTA_MAX_COUNT", "32"))  # 全局向量库增量达到该数量时合并为基础库
+ENTITY_STORE_BACKEND = os.getenv("ENTITY_STORE_BACKEND", "markdown")  # 实体内容存储 markdown / sqlite
+JOURNAL_CHECKPOINT_ITEMS = int(os.getenv("JOURNAL_CHECKPOINT_ITEMS", "20"))  # 构建知识库时每处理多少个数据项做一次完整保存
+ENTITY_CONTENT_CACHE_SIZE = int(os.getenv("ENTITY_CONTENT_CACHE_SIZE", "2048"))  # 缓存已解析内容的实体数量上限
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "5"))  # 检查知识库新发布版本的间隔（秒），0为不检查
+KB_KEEP_VERSIONS = int(os.getenv("KB_KEEP_VERSIONS", "3"))  # 每个知识库保留的服务包版本数
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))  # 实体/关系合并判断的最大并发请求数
+# 大模型合并判断结果的持久化缓存目录，设为空字符串可关闭缓存
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(current_dir, ".llm_cache"))
@@ -0,0 +1,356 @@
+import os
+import json
+import time
+import atexit
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Set
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    内容寻址的持久化嵌入缓存
+
+    以 (模型名, 是否归一化, 文本sha) 为键，向量存放在内存映射的 float32 矩阵中，
+    每一行的键和最近使用时间也保存在内存映射文件里，容量达到上限时淘汰最久未使用的条目。
+    多个进程可以同时使用同一个缓存：读取不加锁，读到的行会校验键，被其他进程
+    淘汰或正在改写的行按未命中处理；写入和淘汰只在每次写入期间持有文件锁。
+    每次写入把改动的行号追加到共享的变更日志并递增代数，其他进程发现代数变化时
+    只重新读取这些行。
+    """
+
+    KEY_BYTES = 20  # sha1 摘要长度
+    EMPTY_KEY = bytes(KEY_BYTES)
+
+    def __init__(
+        self, cache_dir: str, model_name: str, normalize: bool, max_bytes: int
+    ):
+        """
+        初始化嵌入缓存
+
+        Args:
+            cache_dir: 缓存根目录
+            model_name: 嵌入模型名称
+            normalize: 嵌入是否归一化
+            max_bytes: 向量文件的最大字节数
+        """
+        self.model_name = model_name
+        self.normalize = normalize
+        self.max_bytes = max_bytes
+
+        # 不同模型/归一化设置使用独立的命名空间目录
+        namespace = hashlib.sha1(
+            f"{model_name}\x00{int(normalize)}".encode("utf-8")
+        ).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir, namespace)
+        self.vectors_file = os.path.join(self.cache_path, "vectors.npy")
+        self.keys_file = os.path.join(self.cache_path, "keys.npy")
+        self.stamps_file = os.path.join(self.cache_path, "stamps.npy")
+        self.changes_file = os.path.join(self.cache_path, "changes.npy")
+        self.index_file = os.path.join(self.cache_path, "index.json")
+
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._keys: Optional[np.memmap] = None  # 每行的键，全零表示空行
+        self._stamps: Optional[np.memmap] = None  # 每行的最近使用时间
+        # 变更日志：第0个元素是代数（累计写入的行数），其余是环形的行号记录
+        self._changes: Optional[np.memmap] = None
+        self._keys_inode: Optional[int] = None
+        self._generation = 0  # 本进程已同步到的代数
+        self._index: Dict[bytes, int] = {}  # 键 -> 行号
+        self._slot_keys: Dict[int, bytes] = {}  # 行号 -> 键
+        self._free: Set[int] = set()  # 空行
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_path, exist_ok=True)
+        self._lock_file = open(os.path.join(self.cache_path, "lock"), "a")
+        with self._file_lock():
+            self._load()
+        atexit.register(self.flush)
+
+    def key(self, text: str) -> bytes:
+        """计算文本的缓存键"""
+        return hashlib.sha1(text.encode("utf-8")).digest()
+
+    def get_many(self, texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        批量查询缓存
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            Dict[str, np.ndarray]: 命中的 文本 -> 向量
+        """
+        found = {}
+        with self._lock:
+            missing = self._lookup(texts, found)
+            if missing and self._changed():
+                # 其他进程写入了新的条目，可能包含这些文本
+                with self._file_lock():
+                    self._sync()
+                missing = self._lookup(missing, found)
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return found
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        """
+        批量写入缓存
+
+        Args:
+            texts: 文本列表
+            vectors: 与文本一一对应的向量矩阵
+        """
+        if len(texts) == 0:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._vectors is None:
+                self._create(vectors.shape[1])
+            if vectors.shape[1] != self.dim:
+                return
+
+            now = time.time_ns()
+            pending = {}
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                slot = self._index.get(key)
+                if slot is not None:
+                    self._stamps[slot] = now
+                else:
+                    pending.setdefault(key, vector)
+            if not pending:
+                return
+
+            changed: List[int] = []
+            for (key, vector), slot in zip(
+                pending.items(), self._allocate_slots(len(pending), changed)
+            ):
+                # 先清空键再写向量，读取方不会把写了一半的行当作命中
+                self._keys[slot] = 0
+                self._vectors[slot] = vector
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._stamps[slot] = now
+                self._set_slot(slot, key)
+                changed.append(slot)
+            self._publish(changed)
+
+    def flush(self) -> None:
+        """将内存映射的修改写入磁盘"""
+        with self._lock:
+            for array in (self._vectors, self._keys, self._stamps, self._changes):
+                if array is not None:
+                    array.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """获取缓存统计信息"""
+        return {
+            "entries": len(self._index),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程的写锁，只在一次写入期间持有"""
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _lookup(self, texts: Sequence[str], found: Dict[str, np.ndarray]) -> List[str]:
+        """读取命中的向量放入 found，返回未命中的文本（调用方需持有线程锁）"""
+        missing = []
+        if self._vectors is None:
+            return list(texts)
+        now = time.time_ns()
+        for text in texts:
+            key = self.key(text)
+            slot = self._index.get(key)
+            if slot is not None:
+                vector = np.array(self._vectors[slot])
+                # 写入方先清空键再写向量，读完后键仍一致说明这一行没有被淘汰或改写
+                if self._keys[slot].tobytes() == key:
+                    self._stamps[slot] = now
+                    found[text] = vector
+                    continue
+                self._refresh_slot(slot)
+            missing.append(text)
+        return missing
+
+    def _allocate_slots(self, count: int, changed: List[int]) -> List[int]:
+        """
+        分配空行，不够时成批淘汰最久未使用的条目（调用方需持有文件锁）
+
+        Args:
+            count: 需要的行数
+            changed: 被淘汰的行号追加到这里，写入变更日志
+        """
+        if len(self._free) < count and self._slot_keys:
+            used_slots = np.fromiter(self._slot_keys, dtype=np.int64)
+            evict_count = min(
+                len(used_slots), max(count - len(self._free), self.capacity // 16)
+            )
+            oldest = used_slots[
+                np.argpartition(self._stamps[used_slots], evict_count - 1)[:evict_count]
+            ]
+            self._keys[oldest] = 0
+            for slot in oldest.tolist():
+                self._clear_slot(slot)
+                changed.append(slot)
+        return [self._free.pop() for _ in range(min(count, len(self._free)))]
+
+    def _set_slot(self, slot: int, key: bytes) -> None:
+        """记录行中的键"""
+        self._clear_slot(slot)
+        self._free.discard(slot)
+        self._slot_keys[slot] = key
+        self._index[key] = slot
+
+    def _clear_slot(self, slot: int) -> None:
+        """把行记为空行"""
+        key = self._slot_keys.pop(slot, None)
+        if key is not None and self._index.get(key) == slot:
+            del self._index[key]
+        self._free.add(slot)
+
+    def _refresh_slot(self, slot: int) -> None:
+        """按键文件中的当前内容更新一行的记录"""
+        key = self._keys[slot].tobytes()
+        if key == self.EMPTY_KEY:
+            self._clear_slot(slot)
+        else:
+            self._set_slot(slot, key)
+
+    def _changed(self) -> bool:
+        """其他进程是否写入过新的条目"""
+        return self._changes is not None and int(self._changes[0]) != self._generation
+
+    def _publish(self, slots: List[int]) -> None:
+        """把本次改动的行号追加到变更日志（调用方需持有文件锁且已同步）"""
+        size = len(self._changes) - 1
+        generation = self._generation
+        for slot in slots:
+            self._changes[1 + generation % size] = slot
+            generation += 1
+        self._changes[0] = generation
+        self._generation = generation
+
+    def _sync(self) -> None:
+        """读取其他进程改动过的行，缓存文件被重建时重新打开（调用方需持有文件锁）"""
+        try:
+            inode = os.stat(self.keys_file).st_ino
+        except OSError:
+            inode = None
+        if inode != self._keys_inode:
+            self._load()
+            return
+        if not self._changed():
+            return
+
+        generation = int(self._changes[0])
+        size = len(self._changes) - 1
+        if generation - self._generation > size:
+            # 落后太多，环形日志已被覆盖，整体重建
+            self._rebuild_index()
+        else:
+            slots = {
+                int(self._changes[1 + g % size])
+                for g in range(self._generation, generation)
+            }
+            for slot in slots:
+                self._refresh_slot(slot)
+        self._generation = generation
+
+    def _rebuild_index(self) -> None:
+        """由键文件重建 键 <-> 行号 的映射和空行集合"""
+        data = self._keys.tobytes()
+        size = self.KEY_BYTES
+        used = self._keys.any(axis=1)
+        self._slot_keys = {
+            slot: data[slot * size : (slot + 1) * size]
+            for slot in np.flatnonzero(used).tolist()
+        }
+        self._index = {key: slot for slot, key in self._slot_keys.items()}
+        self._free = set(np.flatnonzero(~used).tolist())
+
+    def _create(self, dim: int) -> None:
+        """按维度创建缓存文件（调用方需持有文件锁）"""
+        capacity = max(1, self.max_bytes // (dim * 4))
+        self._write_array(self.vectors_file, np.float32, (capacity, dim))
+        self._write_array(self.stamps_file, np.int64, (capacity,))
+        self._write_array(self.changes_file, np.int64, (capacity + 1,))
+        # 键文件最后替换，其他进程按键文件的 inode 判断缓存是否被重建
+        self._write_array(self.keys_file, np.uint8, (capacity, self.KEY_BYTES))
+        self._write_meta(dim, capacity)
+        self._load()
+
+    def _load(self) -> None:
+        """打开已有缓存（调用方需持有文件锁）"""
+        self._vectors = self._keys = self._stamps = self._changes = None
+        self._keys_inode = None
+        self._index, self._slot_keys, self._free = {}, {}, set()
+        if not (os.path.exists(self.index_file) and os.path.exists(self.vectors_file)):
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            vectors = np.load(self.vectors_file, mmap_mode="r+")
+            keys = np.load(self.keys_file, mmap_mode="r+")
+            stamps = np.load(self.stamps_file, mmap_mode="r+")
+            changes = np.load(self.changes_file, mmap_mode="r+")
+            capacity, dim = data["capacity"], data["dim"]
+            if (
+                vectors.shape != (capacity, dim)
+                or keys.shape != (capacity, self.KEY_BYTES)
+                or stamps.shape != (capacity,)
+                or changes.shape != (capacity + 1,)
+            ):
+                raise ValueError("缓存文件与索引不一致")
+
+            self.dim = dim
+            self.capacity = capacity
+            self._vectors, self._keys, self._stamps = vectors, keys, stamps
+            self._changes = changes
+            self._keys_inode = os.stat(self.keys_file).st_ino
+            self._generation = int(changes[0])
+            self._rebuild_index()
+            print(f"已加载嵌入缓存，共 {len(self._index)} 条")
+        except Exception as e:
+            print(f"加载嵌入缓存失败，将重新创建: {str(e)}")
+            self._vectors = self._keys = self._stamps = self._changes = None
+            self._keys_inode = None
+            self._index, self._slot_keys, self._free = {}, {}, set()
+
+    def _write_meta(self, dim: int, capacity: int) -> None:
+        """写入缓存的元信息"""
+        data = {
+            "model_name": self.model_name,
+            "normalize": self.normalize,
+            "dim": dim,
+            "capacity": capacity,
+        }
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_file, self.index_file)
+
+    @staticmethod
+    def _write_array(path: str, dtype, shape) -> None:
+        """写入新的全零内存映射文件后再替换，已打开旧文件的进程不受影响"""
+        tmp_file = path + ".tmp.npy"
+        array = np.lib.format.open_memmap(tmp_file, mode="w+", dtype=dtype, shape=shape)
+        array.flush()
+        del array
+        os.replace(tmp_file, path)
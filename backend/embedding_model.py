@@ -1,24 +1,530 @@
-from typing import Optional
-from langchain_community.embeddings import HuggingFaceBgeEmbeddings
+import os
+import sys
+import json
+import queue
+import socket
+import struct
+import argparse
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import EmbeddingCache
+from config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_WAIT_MS,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_MB,
+    EMBEDDING_BACKEND,
+    EMBEDDING_DEVICE,
+    EMBEDDING_THREADS,
+    EMBEDDING_SOCKET,
+)
+
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+
+# 后端一致性检查使用的样例文本
+PARITY_SAMPLES = [
+    "考研",
+    "考研还是工作",
+    "考研与就业的关系是竞争",
+    "学历贬值导致越来越多的人选择考研",
+    "话题：考研值不值得\n所有评论：\n读研三年不如工作三年\n名校硕士的起薪明显更高",
+    "Free to Debate 是一个多智能体自动辩论系统",
+]
+
+
+def detect_device() -> str:
+    """自动检测可用的推理设备"""
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+class SentenceTransformerEncoder(Embeddings):
+    """
+    基于 sentence_transformers 的本地编码器
+
+    行为与 query_instruction 为空的 HuggingFaceBgeEmbeddings 一致，
+    但可以选择 PyTorch、int8 动态量化或 ONNX Runtime 推理后端。
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        backend: str = EMBEDDING_BACKEND,
+        device: str = EMBEDDING_DEVICE,
+        threads: int = EMBEDDING_THREADS,
+        normalize: bool = True,
+    ):
+        """
+        加载编码模型
+
+        Args:
+            model_name: 模型名称
+            backend: 推理后端，torch / int8 / onnx
+            device: 推理设备，auto 表示自动检测（int8 和 onnx 固定使用 CPU）
+            threads: CPU 推理线程数，0 表示使用默认值
+            normalize: 是否归一化嵌入
+        """
+        from sentence_transformers import SentenceTransformer
+
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"不支持的嵌入后端: {backend}")
+
+        self.model_name = model_name
+        self.backend = backend
+        self.normalize = normalize
+        self.device = "cpu" if backend != "torch" else device
+        if self.device == "auto":
+            self.device = detect_device()
+
+        if backend == "onnx":
+            import onnxruntime
+
+            session_options = onnxruntime.SessionOptions()
+            if threads > 0:
+                session_options.intra_op_num_threads = threads
+            self.client = SentenceTransformer(
+                model_name,
+                device="cpu",
+                backend="onnx",
+                model_kwargs={
+                    "provider": "CPUExecutionProvider",
+                    "session_options": session_options,
+                },
+            )
+        else:
+            if threads > 0:
+                import torch
+
+                torch.set_num_threads(threads)
+            self.client = SentenceTransformer(model_name, device=self.device)
+            if backend == "int8":
+                import torch
+
+                # 对 Transformer 中的全连接层做 int8 动态量化
+                transformer = self.client[0]
+                transformer.auto_model = torch.quantization.quantize_dynamic(
+                    transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+
+        print(f"嵌入模型已加载: {model_name} (后端: {backend}, 设备: {self.device})")
+
+    @property
+    def cache_name(self) -> str:
+        """嵌入缓存使用的模型名，量化后端的结果与原模型分开缓存"""
+        return f"{self.model_name}@int8" if self.backend == "int8" else self.model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """LangChain 接口：文档嵌入"""
+        texts = [text.replace("\n", " ") for text in texts]
+        embeddings = self.client.encode(
+            texts, normalize_embeddings=self.normalize, show_progress_bar=False
+        )
+        return embeddings.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """LangChain 接口：查询嵌入"""
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingService(Embeddings):
+    """
+    批量嵌入服务
+
+    将多个线程并发提交的文本聚合成微批次交给底层模型，
+    并合并正在计算中的重复文本，避免大量 batch=1 的前向计算。
+    配置了持久化缓存时，已嵌入过的文本直接从缓存读取。
+    """
+
+    def __init__(
+        self,
+        model: Embeddings,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_wait_ms: float = EMBEDDING_BATCH_WAIT_MS,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        """
+        初始化批量嵌入服务
+
+        Args:
+            model: 底层嵌入模型
+            batch_size: 单个微批次的最大文本数
+            max_wait_ms: 凑批时等待后续请求的最长时间（毫秒）
+            cache: 可选的持久化嵌入缓存
+        """
+        self.model = model
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._pending: Dict[str, Future] = {}  # 计算中的文本 -> Future
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def embed_many(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        批量生成嵌入向量
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            np.ndarray: 形状为 (len(texts), dim) 的 float32 矩阵
+        """
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        unique_texts = list(dict.fromkeys(texts))
+        vectors = self.cache.get_many(unique_texts) if self.cache is not None else {}
+        misses = [text for text in unique_texts if text not in vectors]
+        if misses:
+            futures = self._submit(misses)
+            for text, future in futures.items():
+                vectors[text] = future.result()
+        return np.stack([vectors[text] for text in texts]).astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """LangChain 接口：文档嵌入"""
+        return self.embed_many(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """LangChain 接口：查询嵌入"""
+        return self.embed_many([text])[0].tolist()
+
+    def _submit(self, texts: Sequence[str]) -> Dict[str, Future]:
+        """提交文本，复用正在计算中的相同文本"""
+        self._ensure_worker()
+        futures: Dict[str, Future] = {}
+        with self._lock:
+            for text in texts:
+                if text in futures:
+                    continue
+                future = self._pending.get(text)
+                if future is None:
+                    future = Future()
+                    self._pending[text] = future
+                    self._queue.put(text)
+                futures[text] = future
+        return futures
+
+    def _ensure_worker(self) -> None:
+        """按需启动后台批处理线程"""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _next_batch(self) -> Optional[List[str]]:
+        """阻塞等待第一条文本，然后在时间窗口内凑满一个批次"""
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                text = (
+                    self._queue.get(timeout=timeout)
+                    if timeout > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if text is None:
+                self._queue.put(None)  # 留给下一轮退出
+                break
+            batch.append(text)
+        return batch
+
+    def _run(self) -> None:
+        """后台批处理循环"""
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            try:
+                vectors = np.asarray(
+                    self.model.embed_documents(batch), dtype=np.float32
+                )
+                results: List[Tuple[str, Optional[np.ndarray], Optional[Exception]]] = [
+                    (text, vector, None) for text, vector in zip(batch, vectors)
+                ]
+                if self.cache is not None:
+                    try:
+                        self.cache.put_many(batch, vectors)
+                    except Exception as e:
+                        print(f"写入嵌入缓存时发生错误: {str(e)}")
+            except Exception as e:
+                print(f"批量生成嵌入时发生错误: {str(e)}")
+                results = [(text, None, e) for text in batch]
+
+            with self._lock:
+                futures = [self._pending.pop(text) for text in batch]
+            for future, (_, vector, error) in zip(futures, results):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(vector)
+
+    def close(self) -> None:
+        """停止后台批处理线程"""
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+        self._worker = None
+        if self.cache is not None:
+            self.cache.flush()
+
+
+def send_message(sock: socket.socket, header: Dict[str, Any], payload: bytes = b"") -> None:
+    """发送一条 (JSON头, 二进制负载) 消息"""
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    sock.sendall(struct.pack("!II", len(header_bytes), len(payload)) + header_bytes + payload)
+
+
+def recv_message(sock: socket.socket) -> Optional[Tuple[Dict[str, Any], bytes]]:
+    """接收一条消息，连接关闭时返回 None"""
+
+    def recv_exact(size: int) -> Optional[bytes]:
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(min(size, 1 << 20))
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    sizes = recv_exact(8)
+    if sizes is None:
+        return None
+    header_size, payload_size = struct.unpack("!II", sizes)
+    header_bytes = recv_exact(header_size)
+    payload = recv_exact(payload_size) if payload_size else b""
+    if header_bytes is None or payload is None:
+        return None
+    return json.loads(header_bytes.decode("utf-8")), payload
+
+
+class EmbeddingClient(Embeddings):
+    """
+    本机嵌入服务进程的客户端
+
+    通过 Unix socket 把文本发送给 embedding_server.py，
+    由服务进程中唯一加载的模型统一批量计算。
+    """
+
+    def __init__(self, socket_path: str, model_name: str = EMBEDDING_MODEL_NAME):
+        """
+        初始化客户端
+
+        Args:
+            socket_path: 服务进程的 Unix socket 路径
+            model_name: 请求使用的模型名称
+        """
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self._local = threading.local()  # 每个线程一条连接
+
+    @classmethod
+    def connect(
+        cls, socket_path: str = EMBEDDING_SOCKET, model_name: str = EMBEDDING_MODEL_NAME
+    ) -> Optional["EmbeddingClient"]:
+        """服务进程可用时返回客户端，否则返回 None"""
+        if not socket_path or not os.path.exists(socket_path):
+            return None
+        client = cls(socket_path, model_name)
+        try:
+            client.ping()
+            return client
+        except OSError:
+            return None
+
+    def ping(self) -> None:
+        """检查服务进程是否可用"""
+        self._request({"op": "ping"})
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """LangChain 接口：文档嵌入"""
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """LangChain 接口：查询嵌入"""
+        return self.encode([text])[0].tolist()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        生成嵌入矩阵（与 SentenceTransformer.encode 的批量用法兼容）
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            np.ndarray: 形状为 (len(texts), dim) 的 float32 矩阵
+        """
+        header, payload = self._request(
+            {"op": "embed", "model": self.model_name, "texts": list(texts)}
+        )
+        return np.frombuffer(payload, dtype=np.float32).reshape(
+            header["count"], header["dim"]
+        )
+
+    def _request(self, header: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+        """发送请求并等待响应，连接断开时重连一次"""
+        for attempt in range(2):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    sock.connect(self.socket_path)
+                    self._local.sock = sock
+                send_message(sock, header)
+                response = recv_message(sock)
+                if response is None:
+                    raise ConnectionError("嵌入服务连接已关闭")
+            except OSError:
+                if sock is not None:
+                    sock.close()
+                self._local.sock = None
+                if attempt == 1:
+                    raise
+                continue
+
+            response_header, payload = response
+            if "error" in response_header:
+                raise RuntimeError(f"嵌入服务返回错误: {response_header['error']}")
+            return response_header, payload
 
 
 class EmbeddingModel:
-    _instance: Optional[HuggingFaceBgeEmbeddings] = None
+    _instance: Optional[EmbeddingService] = None
+    _lock = threading.Lock()
 
     @classmethod
-    def get_instance(cls) -> HuggingFaceBgeEmbeddings:
-        """获取嵌入模型单例"""
+    def get_instance(cls) -> EmbeddingService:
+        """获取嵌入服务单例"""
         if cls._instance is None:
-            print("初始化嵌入模型...")
-            cls._instance = HuggingFaceBgeEmbeddings(
-                model_name="BAAI/bge-m3",
-                model_kwargs={"device": "mps"},
-                encode_kwargs={"normalize_embeddings": True},
-                query_instruction="",
-            )
+            with cls._lock:
+                if cls._instance is None:
+                    client = EmbeddingClient.connect()
+                    if client is not None:
+                        # 模型和缓存都在服务进程中，本地只做微批聚合
+                        print(f"使用本机嵌入服务: {client.socket_path}")
+                        cls._instance = EmbeddingService(client)
+                    else:
+                        print("初始化嵌入模型...")
+                        model = SentenceTransformerEncoder()
+                        cls._instance = EmbeddingService(
+                            model, cache=cls._create_cache(model.cache_name)
+                        )
         return cls._instance
 
+    @staticmethod
+    def _create_cache(model_name: str) -> Optional[EmbeddingCache]:
+        """按配置创建持久化嵌入缓存"""
+        if not EMBEDDING_CACHE_DIR:
+            return None
+        try:
+            return EmbeddingCache(
+                EMBEDDING_CACHE_DIR,
+                model_name,
+                normalize=True,
+                max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+            )
+        except Exception as e:
+            print(f"嵌入缓存不可用，将直接调用模型: {str(e)}")
+            return None
+
     @classmethod
     def cleanup(cls) -> None:
         """清理嵌入模型（如果需要）"""
+        if cls._instance is not None:
+            cls._instance.close()
         cls._instance = None
+
+
+def check_parity(
+    backend: str,
+    texts: Optional[List[str]] = None,
+    threads: int = EMBEDDING_THREADS,
+    threshold: float = 0.99,
+) -> Dict[str, Any]:
+    """
+    检查指定后端与参考模型（PyTorch CPU）的嵌入一致性
+
+    Args:
+        backend: 待检查的后端
+        texts: 样例文本，默认使用 PARITY_SAMPLES
+        threads: CPU 推理线程数
+        threshold: 判定通过的最小余弦相似度
+
+    Returns:
+        Dict[str, Any]: 余弦相似度统计、两端吞吐量和是否通过
+    """
+    texts = texts or PARITY_SAMPLES
+    reference = SentenceTransformerEncoder(backend="torch", device="cpu", threads=threads)
+    candidate = SentenceTransformerEncoder(backend=backend, device="cpu", threads=threads)
+
+    def timed_embed(encoder: SentenceTransformerEncoder) -> Tuple[np.ndarray, float]:
+        encoder.embed_documents(texts[:1])  # 预热
+        start = time.perf_counter()
+        vectors = np.asarray(encoder.embed_documents(texts), dtype=np.float32)
+        return vectors, len(texts) / (time.perf_counter() - start)
+
+    ref_vectors, ref_throughput = timed_embed(reference)
+    cand_vectors, cand_throughput = timed_embed(candidate)
+
+    ref_vectors /= np.linalg.norm(ref_vectors, axis=1, keepdims=True)
+    cand_vectors /= np.linalg.norm(cand_vectors, axis=1, keepdims=True)
+    cosines = np.sum(ref_vectors * cand_vectors, axis=1)
+
+    result = {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "reference_texts_per_sec": ref_throughput,
+        "candidate_texts_per_sec": cand_throughput,
+        "passed": bool(cosines.min() >= threshold),
+    }
+    print(f"后端 '{backend}' 与参考模型的一致性:")
+    print(f"- 最小余弦相似度: {result['min_cosine']:.5f}")
+    print(f"- 平均余弦相似度: {result['mean_cosine']:.5f}")
+    print(f"- 吞吐量: 参考 {ref_throughput:.1f} 条/秒, 候选 {cand_throughput:.1f} 条/秒")
+    print(f"- 结果: {'通过' if result['passed'] else '未通过'} (阈值 {threshold})")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入后端一致性检查")
+    parser.add_argument(
+        "--backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND, help="待检查的后端"
+    )
+    parser.add_argument("--threads", type=int, default=EMBEDDING_THREADS, help="CPU推理线程数")
+    parser.add_argument("--threshold", type=float, default=0.99, help="最小余弦相似度")
+    args = parser.parse_args()
+
+    result = check_parity(args.backend, threads=args.threads, threshold=args.threshold)
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import os
+import socket
+import argparse
+import threading
+import socketserver
+from typing import Dict, Optional
+
+from embedding_cache import EmbeddingCache
+from embedding_model import (
+    EmbeddingService,
+    SentenceTransformerEncoder,
+    send_message,
+    recv_message,
+)
+from config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_SOCKET,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_MB,
+)
+
+
+class EmbeddingDaemon:
+    """本机嵌入服务：按模型名懒加载，每个模型只加载一次并由所有客户端共享"""
+
+    def __init__(self):
+        self.services: Dict[str, EmbeddingService] = {}
+        self._lock = threading.Lock()
+
+    def get_service(self, model_name: str) -> EmbeddingService:
+        """获取（必要时加载）指定模型的批量嵌入服务"""
+        service = self.services.get(model_name)
+        if service is not None:
+            return service
+        with self._lock:
+            if model_name not in self.services:
+                print(f"加载嵌入模型: {model_name}")
+                encoder = SentenceTransformerEncoder(model_name=model_name)
+                self.services[model_name] = EmbeddingService(
+                    encoder, cache=self._create_cache(encoder.cache_name)
+                )
+            return self.services[model_name]
+
+    @staticmethod
+    def _create_cache(model_name: str) -> Optional[EmbeddingCache]:
+        """按配置为模型创建持久化嵌入缓存"""
+        if not EMBEDDING_CACHE_DIR:
+            return None
+        try:
+            return EmbeddingCache(
+                EMBEDDING_CACHE_DIR,
+                model_name,
+                normalize=True,
+                max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+            )
+        except Exception as e:
+            print(f"模型 '{model_name}' 的嵌入缓存不可用: {str(e)}")
+            return None
+
+    def close(self) -> None:
+        """停止所有批处理线程并写入缓存"""
+        for service in self.services.values():
+            service.close()
+
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """处理单个客户端连接上的所有请求"""
+
+    def handle(self) -> None:
+        daemon: EmbeddingDaemon = self.server.embedding_daemon
+        while True:
+            message = recv_message(self.request)
+            if message is None:
+                return
+            header, _ = message
+
+            try:
+                if header.get("op") == "ping":
+                    send_message(self.request, {"ok": True})
+                    continue
+
+                texts = header.get("texts", [])
+                service = daemon.get_service(header.get("model") or EMBEDDING_MODEL_NAME)
+                vectors = service.embed_many(texts)
+                send_message(
+                    self.request,
+                    {"count": len(texts), "dim": int(vectors.shape[1]) if texts else 0},
+                    vectors.tobytes(),
+                )
+            except Exception as e:
+                print(f"处理嵌入请求时发生错误: {str(e)}")
+                send_message(self.request, {"error": str(e)})
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: EmbeddingDaemon):
+        self.embedding_daemon = daemon
+        super().__init__(socket_path, EmbeddingRequestHandler)
+
+
+def _remove_stale_socket(socket_path: str) -> None:
+    """删除残留的 socket 文件；若已有服务在运行则报错"""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"嵌入服务已在运行: {socket_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本机嵌入服务")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET, help="Unix socket 路径")
+    parser.add_argument(
+        "--preload",
+        nargs="*",
+        default=[EMBEDDING_MODEL_NAME],
+        help="启动时预先加载的模型",
+    )
+    args = parser.parse_args()
+
+    _remove_stale_socket(args.socket)
+    daemon = EmbeddingDaemon()
+    for model_name in args.preload:
+        daemon.get_service(model_name)
+
+    server = EmbeddingServer(args.socket, daemon)
+    os.chmod(args.socket, 0o600)
+    print(f"嵌入服务已启动: {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("正在停止嵌入服务...")
+    finally:
+        server.server_close()
+        daemon.close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
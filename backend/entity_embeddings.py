@@ -0,0 +1,334 @@
+import os
+import json
+import faiss
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import numpy as np
+
+
+class EntityEmbeddingStore(MutableMapping):
+    """
+    实体嵌入矩阵
+
+    所有实体嵌入保存在一个连续的矩阵中，另有一个 行号 -> 实体ID 的索引。
+    磁盘上是一个 .npy 文件，加载时使用内存映射；保存时只把新增或修改的行
+    原地写回文件，文件容量不足时才整体重写。
+    对外仍然表现为 {实体ID: 向量} 的字典。
+    """
+
+    GROWTH_FACTOR = 1.5  # 扩容倍数
+    SIMILARITY_BLOCK_SIZE = 1024  # 实体对相似度分块计算时每块的行数
+
+    def __init__(self, dtype: str = "float32"):
+        """
+        初始化实体嵌入矩阵
+
+        Args:
+            dtype: 存储精度，float32 或 float16
+        """
+        self.dtype = np.dtype(dtype)
+        self._matrix: Optional[np.ndarray] = None  # (容量, 维度)
+        self._ids: List[Optional[str]] = []  # 行号 -> 实体ID，None 表示空行
+        self._rows: Dict[str, int] = {}  # 实体ID -> 行号
+        self._free_rows: List[int] = []
+        self._dirty_rows: Set[int] = set()  # 上次保存后修改过的行
+        self._writable = True  # 内存映射加载后为只读，首次写入时复制到内存
+        self._index: Optional[faiss.IndexIDMap2] = None  # 行号 -> 归一化向量的内积索引
+
+    @property
+    def dim(self) -> Optional[int]:
+        """嵌入维度"""
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    def __getitem__(self, entity_id: str) -> np.ndarray:
+        return self._matrix[self._rows[entity_id]]
+
+    def __setitem__(self, entity_id: str, embedding) -> None:
+        embedding = np.asarray(embedding, dtype=self.dtype).reshape(-1)
+        if self._matrix is None:
+            self._matrix = np.zeros((16, embedding.shape[0]), dtype=self.dtype)
+        elif embedding.shape[0] != self._matrix.shape[1]:
+            raise ValueError(
+                f"嵌入维度不匹配: {embedding.shape[0]} != {self._matrix.shape[1]}"
+            )
+
+        row = self._rows.get(entity_id)
+        replaced = row is not None
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self._ids[row] = entity_id
+            else:
+                row = len(self._ids)
+                self._ids.append(entity_id)
+            self._rows[entity_id] = row
+
+        self._ensure_writable(len(self._ids))
+        self._matrix[row] = embedding
+        self._dirty_rows.add(row)
+        if self._index is not None:
+            if replaced:
+                self._index.remove_ids(np.array([row], dtype=np.int64))
+            self._index.add_with_ids(
+                self._normalize(self._matrix[row : row + 1]),
+                np.array([row], dtype=np.int64),
+            )
+
+    def __delitem__(self, entity_id: str) -> None:
+        row = self._rows.pop(entity_id)
+        self._ids[row] = None
+        self._free_rows.append(row)
+        self._dirty_rows.add(row)
+        if self._index is not None:
+            self._index.remove_ids(np.array([row], dtype=np.int64))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._rows))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, entity_id) -> bool:
+        return entity_id in self._rows
+
+    def clear(self) -> None:
+        """清空所有嵌入"""
+        self._matrix = None
+        self._ids = []
+        self._rows = {}
+        self._free_rows = []
+        self._dirty_rows = set()
+        self._writable = True
+        self._index = None
+
+    def nearest(self, embedding, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        查找与给定向量余弦相似度最高的实体
+
+        第一次调用时由嵌入矩阵建立内积索引，之后随实体的增删改增量维护，
+        每次查询是一次 C 层面的扫描，不再逐个实体计算相似度。
+
+        Args:
+            embedding: 查询向量
+            k: 返回结果数量
+
+        Returns:
+            List[Tuple[str, float]]: (实体ID, 相似度) 列表，按相似度降序
+        """
+        if not self._rows:
+            return []
+        if self._index is None:
+            self._build_index()
+        query = self._normalize(np.asarray(embedding).reshape(1, -1))
+        scores, rows = self._index.search(query, min(k, len(self._rows)))
+        return [
+            (self._ids[row], float(score))
+            for score, row in zip(scores[0], rows[0])
+            if row != -1
+        ]
+
+    def similar_pairs(
+        self, threshold: float, block_size: int = SIMILARITY_BLOCK_SIZE
+    ) -> List[Tuple[str, str, float]]:
+        """
+        找出所有余弦相似度超过阈值的实体对
+
+        相似度矩阵按 (行块 × 列块) 分片计算，只计算列块起点不小于行块起点的分片，
+        对角分片只取 j > i 的部分。每次只把两个块转为 float32 并归一化，
+        内存占用由块大小决定（block_size² 的分数矩阵加两个块的向量），不随实体数增长。
+
+        Args:
+            threshold: 相似度阈值（不含）
+            block_size: 分片的行数和列数
+
+        Returns:
+            List[Tuple[str, str, float]]: (实体ID, 实体ID, 相似度) 列表，按相似度降序
+        """
+        if len(self._rows) < 2:
+            return []
+        # 只取有效行的行号，按块从矩阵中读取，不复制整个矩阵
+        valid_rows = np.array(
+            [row for row, entity_id in enumerate(self._ids) if entity_id is not None],
+            dtype=np.int64,
+        )
+        ids = [self._ids[row] for row in valid_rows.tolist()]
+
+        def read_block(start: int) -> np.ndarray:
+            return np.asarray(
+                self._matrix[valid_rows[start : start + block_size]], dtype=np.float32
+            )
+
+        starts = range(0, len(ids), block_size)
+        norms = np.concatenate(
+            [np.linalg.norm(read_block(start), axis=1) for start in starts]
+        )
+        norms[norms == 0] = 1.0
+
+        def normalized_block(start: int) -> np.ndarray:
+            return read_block(start) / norms[start : start + block_size, None]
+
+        pairs: List[Tuple[str, str, float]] = []
+        for row_start in starts:
+            row_block = normalized_block(row_start)
+            for col_start in range(row_start, len(ids), block_size):
+                col_block = (
+                    row_block if col_start == row_start else normalized_block(col_start)
+                )
+                scores = row_block @ col_block.T
+                if col_start == row_start:
+                    # 对角分片排除自身和 j < i 的重复实体对
+                    scores[np.tril_indices(len(row_block))] = -np.inf
+                rows, cols = np.nonzero(scores > threshold)
+                for row, col in zip(rows.tolist(), cols.tolist()):
+                    pairs.append(
+                        (
+                            ids[row_start + row],
+                            ids[col_start + col],
+                            float(scores[row, col]),
+                        )
+                    )
+        pairs.sort(key=lambda x: x[2], reverse=True)
+        return pairs
+
+    def matrix(self) -> Tuple[List[str], np.ndarray]:
+        """
+        获取所有有效实体及其嵌入矩阵，供向量化的相似度计算使用
+
+        Returns:
+            Tuple[List[str], np.ndarray]: (实体ID列表, 对应行组成的矩阵)
+        """
+        if not self._rows:
+            return [], np.zeros((0, self.dim or 0), dtype=self.dtype)
+        used = len(self._ids)
+        if not self._free_rows:
+            return list(self._ids), self._matrix[:used]
+        rows = [row for row, entity_id in enumerate(self._ids) if entity_id is not None]
+        return [self._ids[row] for row in rows], self._matrix[rows]
+
+    def save(self, matrix_file: str, index_file: str) -> None:
+        """
+        保存嵌入矩阵和行索引
+
+        Args:
+            matrix_file: .npy 矩阵文件路径
+            index_file: 行索引JSON文件路径
+        """
+        if self._matrix is None:
+            return
+        if not self._dirty_rows and os.path.exists(matrix_file):
+            return
+
+        used = len(self._ids)
+        on_disk = self._open_for_update(matrix_file, used)
+        if on_disk is not None:
+            # 原地写回修改过的行
+            for row in sorted(self._dirty_rows):
+                on_disk[row] = self._matrix[row]
+            on_disk.flush()
+            del on_disk
+        else:
+            # 容量不足或格式不符，整体重写（预留扩容空间）
+            capacity = max(used, int(used * self.GROWTH_FACTOR))
+            tmp_file = matrix_file + ".tmp.npy"
+            on_disk = np.lib.format.open_memmap(
+                tmp_file, mode="w+", dtype=self.dtype, shape=(capacity, self.dim)
+            )
+            on_disk[:used] = self._matrix[:used]
+            on_disk.flush()
+            del on_disk
+            os.replace(tmp_file, matrix_file)
+
+        index_data = {"dim": self.dim, "dtype": self.dtype.name, "ids": self._ids}
+        tmp_file = index_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(index_data, f, ensure_ascii=False)
+        os.replace(tmp_file, index_file)
+
+        self._dirty_rows.clear()
+
+    def load(self, matrix_file: str, index_file: str) -> None:
+        """
+        以内存映射方式加载嵌入矩阵
+
+        Args:
+            matrix_file: .npy 矩阵文件路径
+            index_file: 行索引JSON文件路径
+        """
+        with open(index_file, "r", encoding="utf-8") as f:
+            index_data = json.load(f)
+        self.attach(np.load(matrix_file, mmap_mode="r"), index_data["ids"])
+
+    def attach(self, matrix: np.ndarray, ids: List[Optional[str]]) -> None:
+        """
+        直接使用已有的只读矩阵（如内存映射），首次写入时才复制到内存
+
+        Args:
+            matrix: 嵌入矩阵，行数不少于 ids 的长度
+            ids: 行号 -> 实体ID，None 表示空行
+        """
+        self.clear()
+        self._matrix = matrix
+        self.dtype = self._matrix.dtype
+        self._ids = list(ids)
+        self._rows = {
+            entity_id: row
+            for row, entity_id in enumerate(self._ids)
+            if entity_id is not None
+        }
+        self._free_rows = [
+            row for row, entity_id in enumerate(self._ids) if entity_id is None
+        ]
+        self._writable = False
+
+    def load_json(self, json_file: str) -> None:
+        """从旧版 embeddings.json 导入，下次保存时写为矩阵文件"""
+        with open(json_file, "r", encoding="utf-8") as f:
+            embeddings_data = json.load(f)
+        self.clear()
+        for entity_id, embedding in embeddings_data.items():
+            self[entity_id] = embedding
+
+    def _build_index(self) -> None:
+        """由当前的嵌入矩阵建立内积索引"""
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        rows = np.array(sorted(self._rows.values()), dtype=np.int64)
+        if len(rows):
+            self._index.add_with_ids(self._normalize(self._matrix[rows]), rows)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """转为 float32 并按行归一化，内积即余弦相似度"""
+        vectors = np.array(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _ensure_writable(self, rows_needed: int) -> None:
+        """保证矩阵可写且容量足够"""
+        capacity = self._matrix.shape[0]
+        if self._writable and rows_needed <= capacity:
+            return
+        new_capacity = capacity
+        while new_capacity < rows_needed:
+            new_capacity = max(new_capacity + 1, int(new_capacity * self.GROWTH_FACTOR))
+        matrix = np.zeros((new_capacity, self._matrix.shape[1]), dtype=self.dtype)
+        matrix[:capacity] = self._matrix
+        self._matrix = matrix
+        self._writable = True
+
+    def _open_for_update(self, matrix_file: str, used: int) -> Optional[np.ndarray]:
+        """打开可原地更新的矩阵文件，不满足条件时返回 None"""
+        if not os.path.exists(matrix_file):
+            return None
+        try:
+            on_disk = np.load(matrix_file, mmap_mode="r+")
+        except Exception:
+            return None
+        if (
+            on_disk.dtype != self.dtype
+            or on_disk.shape[1] != self.dim
+            or on_disk.shape[0] < used
+        ):
+            del on_disk
+            return None
+        return on_disk
@@ -0,0 +1,411 @@
+import os
+import json
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from embedding_model import EmbeddingModel
+from config import ENTITY_SELECTOR_CACHE_MB
+
+
+class EntitySelectorCache:
+    """
+    按实体懒建立的检索过滤器缓存
+
+    过滤器只记录实体内容块在统一索引中的位置，不复制向量；
+    按内存预算做LRU淘汰，多个检索线程可以同时使用。
+    """
+
+    BYTES_PER_CHUNK = 64  # 过滤器中每个位置的估算内存（哈希集合节点 + 布隆过滤位）
+
+    def __init__(self, max_bytes: int):
+        """
+        初始化缓存
+
+        Args:
+            max_bytes: 过滤器占用的内存上限
+        """
+        self.max_bytes = max_bytes
+        self._selectors: "OrderedDict[str, Tuple[faiss.IDSelectorBatch, int]]" = (
+            OrderedDict()
+        )
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(
+        self, entity_id: str, positions: Callable[[], np.ndarray]
+    ) -> Tuple[faiss.IDSelectorBatch, int]:
+        """
+        获取实体的过滤器，未缓存时建立并放入缓存
+
+        Args:
+            entity_id: 实体ID
+            positions: 返回实体内容块位置的函数，未命中时调用
+
+        Returns:
+            Tuple[faiss.IDSelectorBatch, int]: 过滤器和其中的位置数
+        """
+        with self._lock:
+            entry = self._selectors.get(entity_id)
+            if entry is not None:
+                self._selectors.move_to_end(entity_id)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        chunk_positions = positions()
+        entry = (faiss.IDSelectorBatch(chunk_positions), len(chunk_positions))
+        size = entry[1] * self.BYTES_PER_CHUNK
+        if size > self.max_bytes:
+            return entry  # 单个实体超出预算，只用于这一次检索
+
+        with self._lock:
+            self._pop(entity_id)
+            while self._selectors and self._bytes + size > self.max_bytes:
+                _, (_, count) = self._selectors.popitem(last=False)
+                self._bytes -= count * self.BYTES_PER_CHUNK
+                self.evictions += 1
+            self._selectors[entity_id] = entry
+            self._bytes += size
+        return entry
+
+    def invalidate(self, entity_id: str) -> None:
+        """实体内容变化时移除其过滤器"""
+        with self._lock:
+            self._pop(entity_id)
+
+    def clear(self) -> None:
+        """清空缓存（索引中的位置整体变化时）"""
+        with self._lock:
+            self._selectors.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                "cached_entities": len(self._selectors),
+                "cached_bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _pop(self, entity_id: str) -> None:
+        entry = self._selectors.pop(entity_id, None)
+        if entry is not None:
+            self._bytes -= entry[1] * self.BYTES_PER_CHUNK
+
+
+class EntityChunkIndex:
+    """
+    知识库级别的实体内容向量索引
+
+    内容块按 标题 + 正文 的哈希寻址：相同的内容块无论属于多少个实体，只向量化并存储一次，
+    文档ID即内容哈希，实体只保存对内容块的引用。实体内容变化时只向量化新出现的内容块，
+    没有实体引用的内容块从索引中删除。
+    统一索引以内存映射方式打开，向量只在检索时按需读入；需要修改时才换成内存中的副本。
+    按实体检索时用实体内容块位置的过滤器在统一索引上搜索，不复制向量，
+    过滤器按实体懒建立并在内存预算内做LRU缓存。
+    """
+
+    REFS_FILE = "entity_refs.json"
+    INDEX_FILE = "index.faiss"
+    DOCSTORE_FILE = "index.pkl"  # 与 FAISS.save_local 的文件布局一致
+
+    def __init__(self, cache_mb: int = ENTITY_SELECTOR_CACHE_MB):
+        """
+        初始化实体内容索引
+
+        Args:
+            cache_mb: 单实体过滤器缓存的内存预算（MB）
+        """
+        self.store: Optional[FAISS] = None
+        self._mapped = False  # 统一索引是否仍是只读的内存映射
+        self._store_lock = threading.Lock()
+        self._selectors = EntitySelectorCache(cache_mb * 1024 * 1024)
+        self.entity_chunks: Dict[str, List[str]] = {}  # 实体ID -> 内容哈希列表
+        self.chunk_refs: Dict[str, int] = {}  # 内容哈希 -> 引用它的实体数
+        self._positions: Dict[str, int] = {}  # 内容哈希 -> 索引中的位置
+        self.modified = False  # 是否有未保存的修改
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self.entity_chunks
+
+    def __len__(self) -> int:
+        return len(self.entity_chunks)
+
+    def set_entity(self, entity_id: str, docs: List[Document]) -> None:
+        """
+        将实体引用的内容块更新为给定文档，只向量化索引中还没有的内容块
+
+        Args:
+            entity_id: 实体ID
+            docs: 实体的内容文档
+        """
+        new_docs: Dict[str, Document] = {}
+        for doc in docs:
+            new_docs.setdefault(self.content_hash(doc), doc)
+        self._set_refs(entity_id, new_docs)
+
+    def add_embeddings(
+        self, entity_id: str, docs: List[Document], embeddings: np.ndarray
+    ) -> None:
+        """为实体追加已有向量的文档（用于从旧版向量库迁移，不调用嵌入模型）"""
+        new_docs = {
+            chunk_hash: None for chunk_hash in self.entity_chunks.get(entity_id, [])
+        }
+        known: Dict[str, np.ndarray] = {}
+        for doc, embedding in zip(docs, embeddings):
+            chunk_hash = self.content_hash(doc)
+            if chunk_hash not in new_docs:
+                new_docs[chunk_hash] = doc
+                known[chunk_hash] = embedding
+        self._set_refs(entity_id, new_docs, known)
+
+    def remove_entity(self, entity_id: str) -> None:
+        """删除实体的全部引用"""
+        self._set_refs(entity_id, {})
+
+    def search(
+        self, query: str, entity_id: str, k: int = 3
+    ) -> List[Tuple[Document, float]]:
+        """
+        在指定实体的文档中检索
+
+        Args:
+            query: 查询文本
+            entity_id: 实体ID
+            k: 返回结果数量
+
+        Returns:
+            List[Tuple[Document, float]]: 文档和内积分数
+        """
+        doc_ids = self.entity_chunks.get(entity_id)
+        if not doc_ids or self.store is None:
+            return []
+
+        query_embedding = np.array(
+            [EmbeddingModel.get_instance().embed_query(query)], dtype=np.float32
+        )
+
+        # 只计算实体引用的内容块的分数
+        selector, count = self._selectors.get(
+            entity_id,
+            lambda: np.array(
+                [self._positions[doc_id] for doc_id in doc_ids], dtype=np.int64
+            ),
+        )
+        params = faiss.SearchParameters()
+        params.sel = selector
+        scores, indices = self.store.index.search(
+            query_embedding, min(k, count), params=params
+        )
+        result_doc_ids = [
+            self.store.index_to_docstore_id[i] if i != -1 else None
+            for i in indices[0]
+        ]
+
+        results = []
+        for score, doc_id in zip(scores[0], result_doc_ids):
+            if doc_id is None:
+                continue
+            results.append((self.store.docstore.search(doc_id), float(score)))
+        return results
+
+    def cache_stats(self) -> Dict[str, int]:
+        """获取单实体过滤器缓存的命中统计"""
+        return self._selectors.stats()
+
+    def chunk_count(self) -> int:
+        """索引中（去重后）的内容块数量"""
+        return len(self.chunk_refs)
+
+    def save(self, path: str) -> None:
+        """保存索引和实体引用"""
+        if self.store is None or not self.modified:
+            return
+        # 先写临时文件再替换，正在内存映射旧索引的进程不受影响
+        os.makedirs(path, exist_ok=True)
+        index_file = os.path.join(path, self.INDEX_FILE)
+        faiss.write_index(self.store.index, index_file + ".tmp")
+        os.replace(index_file + ".tmp", index_file)
+        docstore_file = os.path.join(path, self.DOCSTORE_FILE)
+        with open(docstore_file + ".tmp", "wb") as f:
+            pickle.dump((self.store.docstore, self.store.index_to_docstore_id), f)
+        os.replace(docstore_file + ".tmp", docstore_file)
+        refs_file = os.path.join(path, self.REFS_FILE)
+        with open(refs_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.entity_chunks, f, ensure_ascii=False)
+        os.replace(refs_file + ".tmp", refs_file)
+        self.modified = False
+
+    def load(self, path: str) -> None:
+        """加载索引和实体引用，统一索引以只读内存映射方式打开"""
+        index = faiss.read_index(
+            os.path.join(path, self.INDEX_FILE), faiss.IO_FLAG_MMAP_IFC
+        )
+        with open(os.path.join(path, self.DOCSTORE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        self.store = FAISS(
+            EmbeddingModel.get_instance(),
+            index,
+            docstore,
+            index_to_docstore_id,
+            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        )
+        self._mapped = True
+        self._selectors.clear()
+        self._refresh_positions()
+
+        with open(os.path.join(path, self.REFS_FILE), "r", encoding="utf-8") as f:
+            self.entity_chunks = json.load(f)
+        self.chunk_refs = {}
+        for chunk_hashes in self.entity_chunks.values():
+            for chunk_hash in chunk_hashes:
+                self.chunk_refs[chunk_hash] = self.chunk_refs.get(chunk_hash, 0) + 1
+        self.modified = False
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """判断索引文件和实体引用是否都存在"""
+        return all(
+            os.path.exists(os.path.join(path, name))
+            for name in (
+                EntityChunkIndex.INDEX_FILE,
+                EntityChunkIndex.DOCSTORE_FILE,
+                EntityChunkIndex.REFS_FILE,
+            )
+        )
+
+    @staticmethod
+    def content_hash(doc: Document) -> str:
+        """内容块的哈希（标题 + 正文）"""
+        header = doc.metadata.get("Header 1", "")
+        return hashlib.sha1(
+            f"{header}\n{doc.page_content}".encode("utf-8")
+        ).hexdigest()
+
+    def _set_refs(
+        self,
+        entity_id: str,
+        new_docs: Dict[str, Optional[Document]],
+        known_embeddings: Optional[Dict[str, np.ndarray]] = None,
+    ) -> None:
+        """
+        更新实体引用的内容块
+
+        Args:
+            entity_id: 实体ID
+            new_docs: {内容哈希: 文档}，文档为 None 表示沿用已有内容块
+            known_embeddings: 已有向量的内容块，不需要调用嵌入模型
+        """
+        current = self.entity_chunks.get(entity_id, [])
+        if set(current) == set(new_docs):
+            return
+
+        current_set = set(current)
+        released = [h for h in current if h not in new_docs]
+        acquired = [h for h in new_docs if h not in current_set]
+
+        # 新增引用，索引中还没有的内容块才需要向量化
+        missing = {}
+        for chunk_hash in acquired:
+            if chunk_hash in self.chunk_refs:
+                self.chunk_refs[chunk_hash] += 1
+            else:
+                missing[chunk_hash] = new_docs[chunk_hash]
+                self.chunk_refs[chunk_hash] = 1
+        if missing:
+            self._add_chunks(missing, known_embeddings or {})
+
+        # 释放引用，没有实体引用的内容块从索引删除
+        orphaned = []
+        for chunk_hash in released:
+            self.chunk_refs[chunk_hash] -= 1
+            if self.chunk_refs[chunk_hash] == 0:
+                del self.chunk_refs[chunk_hash]
+                orphaned.append(chunk_hash)
+        if orphaned:
+            self._writable_store().delete(orphaned)
+            self._refresh_positions()
+            self._selectors.clear()  # 删除后位置整体前移，所有过滤器失效
+
+        if new_docs:
+            self.entity_chunks[entity_id] = list(new_docs)
+        else:
+            self.entity_chunks.pop(entity_id, None)
+        self._selectors.invalidate(entity_id)
+        self.modified = True
+
+    def _add_chunks(
+        self, docs: Dict[str, Document], known_embeddings: Dict[str, np.ndarray]
+    ) -> None:
+        """把新的内容块加入索引（文档ID即内容哈希）"""
+        doc_ids = list(docs)
+        doc_list = [docs[chunk_hash] for chunk_hash in doc_ids]
+        metadatas = []
+        for chunk_hash, doc in zip(doc_ids, doc_list):
+            metadata = dict(doc.metadata, content_hash=chunk_hash)
+            metadata.pop("entity_id", None)  # 内容块可能被多个实体引用
+            metadatas.append(metadata)
+
+        to_embed = [
+            doc.page_content for h, doc in docs.items() if h not in known_embeddings
+        ]
+        computed = iter(
+            EmbeddingModel.get_instance().embed_many(to_embed) if to_embed else []
+        )
+        embeddings = [
+            known_embeddings[h] if h in known_embeddings else next(computed)
+            for h in doc_ids
+        ]
+        text_embeddings = list(zip([doc.page_content for doc in doc_list], embeddings))
+
+        if self.store is None:
+            self.store = FAISS.from_embeddings(
+                text_embeddings,
+                EmbeddingModel.get_instance(),
+                metadatas=metadatas,
+                ids=doc_ids,
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+            )
+        else:
+            self._writable_store().add_embeddings(
+                text_embeddings, metadatas=metadatas, ids=doc_ids
+            )
+        self._track_added(doc_ids)
+
+    def _writable_store(self) -> FAISS:
+        """修改统一索引前把只读的内存映射换成内存中的副本（内存映射的索引不能修改）"""
+        if self._mapped:
+            with self._store_lock:
+                if self._mapped:
+                    mapped = self.store.index
+                    index = faiss.IndexFlat(mapped.d, mapped.metric_type)
+                    if mapped.ntotal:
+                        index.add(mapped.reconstruct_n(0, mapped.ntotal))
+                    self.store.index = index
+                    self._mapped = False
+        return self.store
+
+    def _track_added(self, doc_ids: List[str]) -> None:
+        """记录新追加文档的位置（追加的文档位于索引末尾）"""
+        start = len(self.store.index_to_docstore_id) - len(doc_ids)
+        for offset, doc_id in enumerate(doc_ids):
+            self._positions[doc_id] = start + offset
+
+    def _refresh_positions(self) -> None:
+        """重建 文档ID -> 索引位置 的映射（删除后位置会整体前移）"""
+        self._positions = {
+            doc_id: index for index, doc_id in self.store.index_to_docstore_id.items()
+        }
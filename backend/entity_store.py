@@ -0,0 +1,403 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import Iterable, List, Tuple
+
+
+def chunk_hash(title: str, content: str) -> str:
+    """内容块的哈希（标题 + 正文）"""
+    return hashlib.sha1(f"{title}\n{content}".encode("utf-8")).hexdigest()
+
+
+def parse_content_units(lines: Iterable[str]) -> List[Tuple[str, str]]:
+    """解析 "# 标题" 分隔的 markdown 文本为内容单元列表"""
+    content_units = []
+    title = ""
+    content = ""
+    for line in lines:
+        if line.startswith("# "):
+            if title and content:
+                content_units.append((title.strip(), content.strip()))
+                content = ""
+            title = line[2:].strip()
+        else:
+            content += line
+    if title and content:
+        content_units.append((title.strip(), content.strip()))
+    return content_units
+
+
+class MarkdownEntityStore:
+    """实体内容存储：每个实体一个 markdown 文件"""
+
+    def __init__(self, entity_path: str):
+        """
+        初始化存储
+
+        Args:
+            entity_path: 实体文档文件夹
+        """
+        self.entity_path = entity_path
+
+    def _file_path(self, entity_id: str) -> str:
+        return os.path.join(self.entity_path, f"{entity_id}.md")
+
+    def save(self, entity_id: str, content_units: List[Tuple[str, str]]) -> None:
+        """用给定内容单元覆盖实体内容"""
+        with open(self._file_path(entity_id), "w", encoding="utf-8") as f:
+            for title, content in content_units:
+                f.write(f"# {title}\n\n{content}\n\n")
+
+    def append(
+        self, entity_id: str, content_units: List[Tuple[str, str]]
+    ) -> List[Tuple[str, str]]:
+        """
+        向实体追加内容单元（去重）
+
+        Returns:
+            List[Tuple[str, str]]: 实际新增的内容单元
+        """
+        existing = self.load(entity_id)
+        seen = set(existing)
+        added = []
+        for title, content in content_units:
+            unit = (title.strip(), content.strip())
+            if unit not in seen:
+                seen.add(unit)
+                added.append(unit)
+        if added:
+            self.save(entity_id, existing + added)
+        return added
+
+    def load(self, entity_id: str) -> List[Tuple[str, str]]:
+        """读取实体的内容单元"""
+        file_path = self._file_path(entity_id)
+        if not os.path.exists(file_path):
+            return []
+
+        with open(file_path, "r", encoding="utf-8") as f:
+            return parse_content_units(f)
+
+    def remove(self, entity_id: str) -> None:
+        """删除实体内容"""
+        file_path = self._file_path(entity_id)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def entity_ids(self) -> List[str]:
+        """获取所有存有内容的实体ID"""
+        if not os.path.isdir(self.entity_path):
+            return []
+        return [
+            name[: -len(".md")]
+            for name in os.listdir(self.entity_path)
+            if name.endswith(".md")
+        ]
+
+    def search(self, keyword: str, limit: int = 10) -> List[Tuple[str, str, str]]:
+        """
+        关键词检索（逐个文件扫描）
+
+        Returns:
+            List[Tuple[str, str, str]]: (实体ID, 标题, 内容) 列表
+        """
+        results = []
+        for entity_id in self.entity_ids():
+            for title, content in self.load(entity_id):
+                if keyword in title or keyword in content:
+                    results.append((entity_id, title, content))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def compact(self) -> None:
+        """回收已删除内容占用的空间（文件删除后空间已释放）"""
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteEntityStore:
+    """
+    实体内容存储：SQLite 数据库
+
+    内容块按 标题 + 正文 的哈希寻址，chunks 表中每个内容块只存一份，
+    entity_chunks 表记录实体对内容块的引用，追加内容即插入引用行。
+    同一个评论簇被多个实体共享时，磁盘占用只随不同内容块的数量增长。
+    同时在 chunks 上维护一个 FTS5 全文索引（优先使用 trigram 分词以支持中文子串检索），
+    SQLite 不支持 FTS5 时退化为 LIKE 查询。
+    """
+
+    def __init__(self, db_file: str):
+        """
+        初始化存储
+
+        Args:
+            db_file: 数据库文件路径
+        """
+        self.db_file = db_file
+        self._conn = None
+        self._fts_tokenizer = None  # trigram / unicode61 / None（不支持FTS5）
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """首次使用时打开数据库并建表"""
+        if self._conn is not None:
+            return self._conn
+
+        os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                chunk_hash TEXT NOT NULL UNIQUE,
+                title TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entity_chunks (
+                id INTEGER PRIMARY KEY,
+                entity_id TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL REFERENCES chunks(id),
+                UNIQUE (entity_id, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS entity_chunks_chunk ON entity_chunks(chunk_id);
+            """
+        )
+        self._fts_tokenizer = self._create_fts(conn)
+        conn.commit()
+        self._conn = conn
+        return conn
+
+    @staticmethod
+    def _create_fts(conn: sqlite3.Connection):
+        """创建全文索引及同步触发器，返回使用的分词器"""
+        row = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'chunks_fts'"
+        ).fetchone()
+        if row is not None:
+            return "trigram" if "trigram" in row[0] else "unicode61"
+
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                conn.execute(
+                    f"""
+                    CREATE VIRTUAL TABLE chunks_fts USING fts5(
+                        title, content,
+                        content='chunks', content_rowid='id',
+                        tokenize='{tokenizer}'
+                    )
+                    """
+                )
+                break
+            except sqlite3.OperationalError:
+                continue
+        else:
+            return None
+
+        conn.executescript(
+            """
+            CREATE TRIGGER chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts(rowid, title, content)
+                VALUES (new.id, new.title, new.content);
+            END;
+            CREATE TRIGGER chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+            END;
+            INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild');
+            """
+        )
+        return tokenizer
+
+    def _insert(
+        self,
+        conn: sqlite3.Connection,
+        entity_id: str,
+        content_units: List[Tuple[str, str]],
+    ) -> List[Tuple[str, str]]:
+        """为实体添加内容块引用（内容块不存在时先写入），返回实际新增的部分"""
+        added = []
+        for title, content in content_units:
+            title, content = title.strip(), content.strip()
+            unit_hash = chunk_hash(title, content)
+            conn.execute(
+                "INSERT OR IGNORE INTO chunks (chunk_hash, title, content)"
+                " VALUES (?, ?, ?)",
+                (unit_hash, title, content),
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO entity_chunks (entity_id, chunk_id)"
+                " SELECT ?, id FROM chunks WHERE chunk_hash = ?",
+                (entity_id, unit_hash),
+            )
+            if cursor.rowcount:
+                added.append((title, content))
+        return added
+
+    @staticmethod
+    def _delete_refs(conn: sqlite3.Connection, entity_id: str) -> None:
+        """删除实体的全部引用，并清理不再被引用的内容块"""
+        chunk_ids = [
+            chunk_id
+            for (chunk_id,) in conn.execute(
+                "SELECT chunk_id FROM entity_chunks WHERE entity_id = ?", (entity_id,)
+            )
+        ]
+        conn.execute("DELETE FROM entity_chunks WHERE entity_id = ?", (entity_id,))
+        conn.executemany(
+            "DELETE FROM chunks WHERE id = ?"
+            " AND NOT EXISTS (SELECT 1 FROM entity_chunks WHERE chunk_id = ?)",
+            [(chunk_id, chunk_id) for chunk_id in chunk_ids],
+        )
+
+    def save(self, entity_id: str, content_units: List[Tuple[str, str]]) -> None:
+        """用给定内容单元覆盖实体内容"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._delete_refs(conn, entity_id)
+                self._insert(conn, entity_id, content_units)
+
+    def append(
+        self, entity_id: str, content_units: List[Tuple[str, str]]
+    ) -> List[Tuple[str, str]]:
+        """
+        向实体追加内容单元（已存在的自动忽略）
+
+        Returns:
+            List[Tuple[str, str]]: 实际新增的内容单元
+        """
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return self._insert(conn, entity_id, content_units)
+
+    def load(self, entity_id: str) -> List[Tuple[str, str]]:
+        """读取实体的内容单元"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT c.title, c.content FROM entity_chunks r"
+                " JOIN chunks c ON c.id = r.chunk_id"
+                " WHERE r.entity_id = ? ORDER BY r.id",
+                (entity_id,),
+            )
+            return [(title, content) for title, content in rows]
+
+    def remove(self, entity_id: str) -> None:
+        """删除实体内容"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._delete_refs(conn, entity_id)
+
+    def entity_ids(self) -> List[str]:
+        """获取所有存有内容的实体ID"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT DISTINCT entity_id FROM entity_chunks"
+            )
+            return [entity_id for (entity_id,) in rows]
+
+    def search(self, keyword: str, limit: int = 10) -> List[Tuple[str, str, str]]:
+        """
+        关键词检索
+
+        Returns:
+            List[Tuple[str, str, str]]: (实体ID, 标题, 内容) 列表，按相关度排序
+        """
+        with self._lock:
+            conn = self._connect()
+            # trigram 分词要求关键词至少3个字符
+            min_length = 3 if self._fts_tokenizer == "trigram" else 1
+            if self._fts_tokenizer and len(keyword) >= min_length:
+                phrase = '"' + keyword.replace('"', '""') + '"'
+                rows = conn.execute(
+                    "SELECT r.entity_id, c.title, c.content FROM chunks_fts f"
+                    " JOIN chunks c ON c.id = f.rowid"
+                    " JOIN entity_chunks r ON r.chunk_id = c.id"
+                    " WHERE chunks_fts MATCH ? ORDER BY f.rank, r.id LIMIT ?",
+                    (phrase, limit),
+                )
+            else:
+                pattern = (
+                    "%"
+                    + keyword.replace("\\", "\\\\")
+                    .replace("%", "\\%")
+                    .replace("_", "\\_")
+                    + "%"
+                )
+                rows = conn.execute(
+                    "SELECT r.entity_id, c.title, c.content FROM chunks c"
+                    " JOIN entity_chunks r ON r.chunk_id = c.id"
+                    " WHERE c.title LIKE ? ESCAPE '\\' OR c.content LIKE ? ESCAPE '\\'"
+                    " ORDER BY r.id LIMIT ?",
+                    (pattern, pattern, limit),
+                )
+            return [tuple(row) for row in rows]
+
+    def chunk_count(self) -> int:
+        """不同内容块的数量"""
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def import_from(self, other: MarkdownEntityStore) -> int:
+        """
+        从 markdown 存储导入全部实体内容
+
+        Returns:
+            int: 导入的实体数量
+        """
+        entity_ids = other.entity_ids()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for entity_id in entity_ids:
+                    self._insert(conn, entity_id, other.load(entity_id))
+        return len(entity_ids)
+
+    def compact(self) -> None:
+        """回收已删除内容占用的空间：合并 WAL 并重写数据库文件"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("VACUUM")
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def create_entity_store(backend: str, base_path: str):
+    """
+    根据配置创建实体内容存储
+
+    Args:
+        backend: markdown 或 sqlite
+        base_path: 知识库路径
+
+    Returns:
+        MarkdownEntityStore | SQLiteEntityStore
+    """
+    entity_path = os.path.join(base_path, "entities")
+    if backend == "markdown":
+        return MarkdownEntityStore(entity_path)
+    if backend != "sqlite":
+        raise ValueError(f"未知的实体存储后端: {backend}")
+
+    db_file = os.path.join(base_path, "entities.db")
+    is_new = not os.path.exists(db_file)
+    store = SQLiteEntityStore(db_file)
+    if is_new and os.path.isdir(entity_path):
+        legacy_store = MarkdownEntityStore(entity_path)
+        if legacy_store.entity_ids():
+            count = store.import_from(legacy_store)
+            print(f"已将 {count} 个实体文档导入 SQLite 实体存储")
+    return store
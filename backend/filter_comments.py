@@ -6,6 +6,9 @@ from typing import Dict, List, Any
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
+from embedding_model import EmbeddingClient
+
+FILTER_MODEL_NAME = 'BAAI/bge-small-zh-v1.5'
 
 # 定义无意义评论的参考样本
 MEANINGLESS_SAMPLES = [
@@ -17,11 +20,16 @@ MEANINGLESS_SAMPLES = [
 ]
 
 def load_model():
-    """加载语义嵌入模型"""
-    print("正在加载语义模型 (BAAI/bge-small-zh-v1.5)...")
+    """加载语义嵌入模型，本机嵌入服务运行时直接使用服务中的模型"""
+    client = EmbeddingClient.connect(model_name=FILTER_MODEL_NAME)
+    if client is not None:
+        print(f"使用本机嵌入服务中的语义模型 ({FILTER_MODEL_NAME})...")
+        return client
+
+    print(f"正在加载语义模型 ({FILTER_MODEL_NAME})...")
     try:
         # 使用较小的中文模型以保证速度和效果的平衡
-        model = SentenceTransformer('BAAI/bge-small-zh-v1.5')
+        model = SentenceTransformer(FILTER_MODEL_NAME)
         return model
     except Exception as e:
         print(f"模型加载失败: {e}")
@@ -1,4 +1,7 @@
-from typing import List, Tuple, Dict, Optional, Any
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Optional, Set, Any
 from openai import OpenAI
 import networkx as nx
 from sklearn.metrics.pairwise import cosine_similarity
@@ -6,25 +9,35 @@ import numpy as np
 
 from graph_storage import GraphStorage
 from embedding_model import EmbeddingModel
+from llm_judge import LLMJudge, load_prompt
+from config import API_KEY, API_BASE_URL, LLM_CONCURRENCY
 
-ENTITY_MERGE_PROMPT = "prompt/entity_merge.txt"
-RELATIONSHIP_MERGE_PROMPT = "prompt/relationship_merge.txt"
 COMMUNITY_SUMMARY_PROMPT = "prompt/community_summary.txt"
+MERGE_CANDIDATE_COUNT = 10  # 添加实体时最多交给大模型判断的相似实体数
+MERGE_JUDGE_WIDTH = 2  # 添加实体时每轮并发判断的候选数，有候选判定可以合并就停止
 
 
 class GraphEntity:
     """实体管理器，处理所有与实体和关系相关的操作"""
 
-    def __init__(self, storage: GraphStorage, llm_client: OpenAI):
+    def __init__(self, storage: GraphStorage, llm_client: Optional[OpenAI] = None):
         """
         初始化实体管理器
 
         Args:
             storage: 存储管理器实例
-            llm_client: LLM客户端实例，用于实体合并判断
+            llm_client: LLM客户端实例，用于实体合并判断；不提供时在首次使用时创建
         """
         self.storage = storage
-        self.llm_client = llm_client
+        self._llm_client = llm_client
+        self.judge = LLMJudge(lambda: self.llm_client)
+
+    @property
+    def llm_client(self) -> OpenAI:
+        """LLM客户端（只做检索时不会创建）"""
+        if self._llm_client is None:
+            self._llm_client = OpenAI(api_key=API_KEY, base_url=API_BASE_URL)
+        return self._llm_client
 
     def add_entity(self, entity_id: str, content_units: List[Tuple[str, str]]) -> str:
         """
@@ -47,14 +60,18 @@ class GraphEntity:
         # 生成新实体的嵌入
         new_embedding = EmbeddingModel.get_instance().embed_query(entity_id)
 
-        # 检查相似实体
-        for existing_id, existing_embedding in self.storage.entity_embeddings.items():
-            similarity = cosine_similarity([new_embedding], [existing_embedding])[0][0]
-            if similarity > 0.85:
+        # 检查相似实体：按相似度从高到低每轮并发判断 MERGE_JUDGE_WIDTH 个候选，
+        # 第一个判定可以合并的候选即为合并目标，后面的候选不再判断
+        candidates = self._merge_candidates(new_embedding)
+        for start in range(0, len(candidates), MERGE_JUDGE_WIDTH):
+            window = candidates[start : start + MERGE_JUDGE_WIDTH]
+            verdicts = self.judge.should_merge_many(
+                [(entity_id, existing_id) for existing_id, _ in window]
+            )
+            for (existing_id, similarity), should_merge in zip(window, verdicts):
                 print(
                     f"发现高相似度实体：'{entity_id}' 与 '{existing_id}' 的相似度为 {similarity:.3f}"
                 )
-                should_merge = self._llm_merge_judgment(entity_id, existing_id)
                 if should_merge:
                     print(
                         f"大模型判定可以合并，正在将 '{entity_id}' 合并到 '{existing_id}'..."
@@ -65,13 +82,58 @@ class GraphEntity:
 
         # 添加为新实体
         print(f"添加新实体：'{entity_id}'")
-        self.storage.graph.add_node(entity_id)
-        self.storage.entity_embeddings[entity_id] = new_embedding
-        self.storage.alias_to_main_id[entity_id] = entity_id
+        self.storage.add_entity_node(entity_id, new_embedding)
         self.storage.save_entity(entity_id, content_units)
 
         return entity_id
 
+    def add_entities(
+        self, entity_contents: Dict[str, List[Tuple[str, str]]]
+    ) -> Dict[str, str]:
+        """
+        批量添加实体
+
+        先为所有新实体找出最相似的 MERGE_JUDGE_WIDTH 个候选，并发完成这些合并判断
+        （结果进入判断缓存），再按顺序逐个添加；添加时第一轮判断直接命中缓存，
+        只有第一轮都判定不合并的实体才继续判断后面的候选。
+
+        Args:
+            entity_contents: {实体ID: [(title, content),...]}
+
+        Returns:
+            Dict[str, str]: 实体ID -> 实体的主ID
+        """
+        new_ids = [
+            entity_id for entity_id in entity_contents if not self._get_main_id(entity_id)
+        ]
+        if new_ids:
+            embeddings = EmbeddingModel.get_instance().embed_many(new_ids)
+            pairs = [
+                (entity_id, existing_id)
+                for entity_id, embedding in zip(new_ids, embeddings)
+                for existing_id, _ in self._merge_candidates(embedding)[
+                    :MERGE_JUDGE_WIDTH
+                ]
+            ]
+            if pairs:
+                print(f"并发判断 {len(pairs)} 对候选相似实体...")
+                self.judge.should_merge_many(pairs)
+
+        return {
+            entity_id: self.add_entity(entity_id, content_units)
+            for entity_id, content_units in entity_contents.items()
+        }
+
+    def _merge_candidates(self, embedding) -> List[Tuple[str, float]]:
+        """与给定向量相似度超过0.85的已有实体，按相似度降序"""
+        return [
+            (existing_id, similarity)
+            for existing_id, similarity in self.storage.entity_embeddings.nearest(
+                embedding, k=MERGE_CANDIDATE_COUNT
+            )
+            if similarity > 0.85
+        ]
+
     def add_relationship(
         self, entity1_id: str, entity2_id: str, relationship_type: str
     ) -> None:
@@ -96,31 +158,26 @@ class GraphEntity:
                 print(f"实体 '{entity2_id}' 不存在")
             return
 
-        # 获取这对实体间的现有同向关系
-        existing_relationships = [
-            (d["type"], k)
-            for u, v, k, d in self.storage.graph.edges(data=True, keys=True)
-            if u == main_id1 and v == main_id2  # 只获取同向的关系
-        ]
+        # 两端是同一实体（或互为别名）时不添加自环
+        if main_id1 == main_id2:
+            print(f"跳过自循环关系: {main_id1} -{relationship_type}-> {main_id2}")
+            return
+
+        existing_relationships = self._existing_relationships(main_id1, main_id2)
 
         # 如果没有现有关系，直接添加
         if not existing_relationships:
-            self.storage.graph.add_edge(main_id1, main_id2, type=relationship_type)
+            self.storage.add_edge(main_id1, main_id2, relationship_type)
             print(f"添加新关系: {main_id1} -{relationship_type}-> {main_id2}")
             return
 
-        # 获取所有关系的嵌入向量（包括新关系）
-        new_embedding = EmbeddingModel.get_instance().embed_query(relationship_type)
-        rel_embeddings = [
-            (rel, key, EmbeddingModel.get_instance().embed_query(rel))
-            for rel, key in existing_relationships
-        ]
+        # 已有完全相同的关系
+        if any(rel == relationship_type for rel, _ in existing_relationships):
+            return
 
-        # 计算与所有现有关系的相似度
-        similarities = []
-        for rel, key, embedding in rel_embeddings:
-            similarity = cosine_similarity([new_embedding], [embedding])[0][0]
-            similarities.append((similarity, rel, key))
+        similarities = self._relationship_similarities(
+            relationship_type, existing_relationships
+        )
 
         # 找出最相似的关系
         if similarities:
@@ -138,20 +195,86 @@ class GraphEntity:
 
             # 如果相似度在0.85-0.95之间，进行合并
             elif max_similarity > 0.85:
-                merged_relation = self._llm_merge_relationships(
+                merged_relation = self.judge.merge_relationship(
                     main_id1, main_id2, relationship_type, most_similar_rel
                 )
                 print(f"合并关系为：'{merged_relation}'")
 
-                # 更新关系
-                self.storage.graph.remove_edge(main_id1, main_id2, edge_key)
-                self.storage.graph.add_edge(main_id1, main_id2, type=merged_relation)
+                # 更新关系（合并结果与另一条现有关系相同时只删除旧关系）
+                self.storage.remove_edge(main_id1, main_id2, edge_key)
+                if not any(
+                    rel == merged_relation and key != edge_key
+                    for rel, key in existing_relationships
+                ):
+                    self.storage.add_edge(main_id1, main_id2, merged_relation)
                 return
 
         # 如果没有相似关系或相似度较低，添加新关系
-        self.storage.graph.add_edge(main_id1, main_id2, type=relationship_type)
+        self.storage.add_edge(main_id1, main_id2, relationship_type)
         print(f"添加新关系: {main_id1} -{relationship_type}-> {main_id2}")
 
+    def add_relationships(self, relations: List[Tuple[str, str, str]]) -> None:
+        """
+        批量添加关系
+
+        先找出需要大模型合并的关系（与最相似的现有关系相似度在0.85-0.95之间），
+        并发完成这些合并（结果进入判断缓存），再按顺序逐个添加，
+        添加过程中的合并直接命中缓存。
+
+        Args:
+            relations: [(起始实体ID, 目标实体ID, 关系类型), ...]
+        """
+        merges = []
+        for entity1_id, entity2_id, relationship_type in relations:
+            main_id1 = self._get_main_id(entity1_id)
+            main_id2 = self._get_main_id(entity2_id)
+            if not (main_id1 and main_id2) or main_id1 == main_id2:
+                continue
+            existing_relationships = self._existing_relationships(main_id1, main_id2)
+            if not existing_relationships or any(
+                rel == relationship_type for rel, _ in existing_relationships
+            ):
+                continue
+            max_similarity, most_similar_rel, _ = max(
+                self._relationship_similarities(
+                    relationship_type, existing_relationships
+                ),
+                key=lambda x: x[0],
+            )
+            if 0.85 < max_similarity <= 0.95:
+                merges.append((main_id1, main_id2, relationship_type, most_similar_rel))
+        if merges:
+            print(f"并发合并 {len(merges)} 组相似关系...")
+            self.judge.merge_relationships_many(merges)
+
+        for entity1_id, entity2_id, relationship_type in relations:
+            self.add_relationship(entity1_id, entity2_id, relationship_type)
+
+    def _existing_relationships(self, main_id1: str, main_id2: str) -> List[Tuple[str, Any]]:
+        """这对实体间现有的同向关系 [(关系类型, 边key)]（只查这一对节点之间的边）"""
+        graph = self.storage.graph
+        if not graph.has_edge(main_id1, main_id2):
+            return []
+        return [(d["type"], k) for k, d in graph[main_id1][main_id2].items()]
+
+    def _relationship_similarities(
+        self, relationship_type: str, existing_relationships: List[Tuple[str, Any]]
+    ) -> List[Tuple[float, str, Any]]:
+        """关系类型与各条现有关系的相似度 [(相似度, 关系类型, 边key)]"""
+        # 关系类型的嵌入来自关系词表，只有词表中没有的类型才需要计算
+        embeddings = self.storage.relation_type_embeddings(
+            [relationship_type] + [rel for rel, _ in existing_relationships]
+        )
+        scores = cosine_similarity(embeddings[:1], embeddings[1:])[0]
+        return [
+            (similarity, rel, key)
+            for similarity, (rel, key) in zip(scores, existing_relationships)
+        ]
+
+    def close(self) -> None:
+        """关闭大模型判断的线程池"""
+        self.judge.close()
+
     def get_entity_info(self, entity_id: str) -> Optional[Dict[str, Any]]:
         """
         获取实体的详细信息
@@ -254,21 +377,22 @@ class GraphEntity:
         """自动检查并合并相似实体"""
         print("\n开始检查和合并相似实体...")
 
-        # 获取所有实体对的相似度
-        entity_pairs = []
-        entities = list(self.storage.graph.nodes())
-
-        for i, entity1 in enumerate(entities):
-            embedding1 = self.storage.entity_embeddings[entity1]
-            for entity2 in entities[i + 1 :]:
-                embedding2 = self.storage.entity_embeddings[entity2]
-                similarity = cosine_similarity([embedding1], [embedding2])[0][0]
-                if similarity > 0.85:
-                    if self._llm_merge_judgment(entity1, entity2):
-                        entity_pairs.append((entity1, entity2, similarity))
+        # 分块矩阵乘法一次找出所有相似度超过阈值的候选实体对，再交给大模型判断
+        nodes = self.storage.graph
+        candidates = [
+            pair
+            for pair in self.storage.entity_embeddings.similar_pairs(0.85)
+            if pair[0] in nodes and pair[1] in nodes
+        ]
+        print(f"找到 {len(candidates)} 对候选相似实体")
 
-        # 按相似度排序
-        entity_pairs.sort(key=lambda x: x[2], reverse=True)
+        # 候选已按相似度降序排列，全部判断在线程池中并发进行
+        verdicts = self.judge.should_merge_many(
+            [(entity1, entity2) for entity1, entity2, _ in candidates]
+        )
+        entity_pairs = [
+            pair for pair, should_merge in zip(candidates, verdicts) if should_merge
+        ]
 
         # 执行合并
         merged_entities = set()
@@ -280,27 +404,13 @@ class GraphEntity:
 
     def _get_main_id(self, entity_id: str) -> Optional[str]:
         """获取实体的主ID"""
-        if entity_id in self.storage.alias_to_main_id:
-            return self.storage.alias_to_main_id[entity_id]
-        if entity_id in self.storage.graph.nodes():
-            return entity_id
-        return None
+        return self.storage.resolve(entity_id)
 
     def _merge_entity_content(
         self, main_id: str, content_units: List[Tuple[str, str]]
     ) -> None:
-        """合并实体内容"""
-        existing_content = self.storage.load_entity(main_id)
-
-        # 使用集合去重
-        existing_set = {
-            (title.strip(), content.strip()) for title, content in existing_content
-        }
-        new_set = {(title.strip(), content.strip()) for title, content in content_units}
-        merged_set = existing_set.union(new_set)
-
-        # 保存合并后的内容
-        self.storage.save_entity(main_id, list(merged_set))
+        """合并实体内容（只追加尚不存在的内容单元）"""
+        self.storage.append_entity_content(main_id, content_units)
 
     def _merge_entity_relationships(self, main_id: str, merged_id: str) -> None:
         """合并实体的关系"""
@@ -323,130 +433,52 @@ class GraphEntity:
                         self.add_relationship(main_id, successor, edge_data["type"])
 
     def _merge_entity_aliases(self, main_id: str, merged_id: str) -> None:
-        """合并实体的别名"""
-        if merged_id in self.storage.entity_aliases:
-            for alias in self.storage.entity_aliases[merged_id]:
-                self._add_alias(main_id, alias)
-            del self.storage.entity_aliases[merged_id]
+        """合并实体的别名（被合并实体的别名集合整体并入主实体）"""
         self._add_alias(main_id, merged_id)
 
     def _add_alias(self, main_id: str, alias: str) -> None:
         """添加别名"""
-        if main_id not in self.storage.entity_aliases:
-            self.storage.entity_aliases[main_id] = set()
-        self.storage.entity_aliases[main_id].add(alias)
-        self.storage.alias_to_main_id[alias] = main_id
+        self.storage.add_alias(main_id, alias)
 
     def _remove_entity(self, entity_id: str) -> None:
-        """删除实体"""
-        self.storage.graph.remove_node(entity_id)
-        if entity_id in self.storage.entity_embeddings:
-            del self.storage.entity_embeddings[entity_id]
+        """删除实体（连同实体内容和向量内容）"""
+        self.storage.remove_entity(entity_id)
 
-    def _llm_merge_relationships(
-        self, entity1: str, entity2: str, rel1: str, rel2: str
-    ) -> str:
+    def remove_duplicates_and_self_loops(self) -> None:
         """
-        使用LLM合并两个关系描述，考虑实体上下文
+        移除重复边和自循环(包括别名)
 
-        Args:
-            entity1: 起始实体
-            entity2: 目标实体
-            rel1: 第一个关系类型
-            rel2: 第二个关系类型
-
-        Returns:
-            str: 合并后的关系描述
+        一次遍历所有边：两端解析为主实体，两端相同的是自环，
+        (起点, 终点, 关系类型) 已出现过的是重复边。
+        add_relationship 写入时已保证同样的规范形式，这里通常没有需要移除的边。
         """
-        try:
-            with open(RELATIONSHIP_MERGE_PROMPT, "r", encoding="utf-8") as file:
-                template = file.read()
-
-            prompt = template.format(
-                entity1=entity1, entity2=entity2, rel1=rel1, rel2=rel2
-            )
-
-            messages = [{"role": "user", "content": prompt}]
-
-            response = self.llm_client.chat.completions.create(
-                model="moonshot-v1-8k", messages=messages, temperature=0.5
-            )
-
-            return response.choices[0].message.content.strip()
-
-        except Exception as e:
-            print(f"LLM合并关系时发生错误: {str(e)}")
-            return rel1  # 出错时保留第一个关系
-
-    def _llm_merge_judgment(self, entity1: str, entity2: str) -> bool:
-        """使用LLM判断两个实体是否应该合并"""
-        try:
-            with open(ENTITY_MERGE_PROMPT, "r", encoding="utf-8") as file:
-                template = file.read()
-
-            prompt = template.format(entity1=entity1, entity2=entity2)
-            messages = [{"role": "user", "content": prompt}]
-
-            response = self.llm_client.chat.completions.create(
-                model="moonshot-v1-8k", messages=messages, temperature=0.5
-            )
-
-            result = response.choices[0].message.content.strip().lower()
-            return result == "yes"
-
-        except Exception as e:
-            print(f"LLM判断发生错误: {str(e)}")
-            return False
-
-    def remove_duplicates_and_self_loops(self) -> None:
-        """移除重复边和自循环(包括别名)"""
-        changes_made = False  # 追踪是否有任何改动
-
-        # 移除直接自循环
-        for u, v, data in list(nx.selfloop_edges(self.storage.graph, data=True)):
-            print(f"移除自循环边: {u} -> {v}, 关系类型: {data.get('type')}")
-            self.storage.graph.remove_edge(u, v)
-            changes_made = True
-
-        # 移除别名导致的自循环
-        for source, target, data in list(self.storage.graph.edges(data=True)):
-            source_main = self.storage.alias_to_main_id.get(source, source)
-            target_main = self.storage.alias_to_main_id.get(target, target)
-
-            if source_main == target_main:
-                print(
-                    f"移除别名自循环边: {source} -> {target}, 关系类型: {data.get('type')}, 主实体: {source_main}"
-                )
-                self.storage.graph.remove_edge(source, target)
-                changes_made = True
-
-        # 移除重复边
         edges_to_remove = []
-        for u, v, keys, data in self.storage.graph.edges(keys=True, data=True):
-            edge_type = data.get("type")
-            edge_data = self.storage.graph.get_edge_data(u, v)
-
-            if edge_data:
-                existing_edges = [
-                    (k, d)
-                    for k, d in edge_data.items()
-                    if k != keys and d.get("type") == edge_type
-                ]
-                for k, _ in existing_edges:
-                    edges_to_remove.append((u, v, k))
-                    print(f"移除重复边: {u} -> {v}, 关系类型: {edge_type}")
+        self_loops = 0
+        seen: Set[Tuple[str, str, str]] = set()
+        for u, v, key, edge_type in self.storage.graph.edges(keys=True, data="type"):
+            source = self.storage.resolve(u) or u
+            target = self.storage.resolve(v) or v
+            if source == target:
+                edges_to_remove.append((u, v, key))
+                self_loops += 1
+                continue
+            edge = (source, target, edge_type)
+            if edge in seen:
+                edges_to_remove.append((u, v, key))
+            else:
+                seen.add(edge)
 
-        for edge in edges_to_remove:
-            self.storage.graph.remove_edge(*edge)
-            changes_made = True
-
-        # 如果有任何改动，保存更新后的图谱
-        if changes_made:
-            print("检测到图谱改动，正在保存更新...")
-            self.storage.save()
-            print("图谱已更新并保存")
-        else:
+        if not edges_to_remove:
             print("未发现重复边或自循环，无需更新")
+            return
+
+        for edge in edges_to_remove:
+            self.storage.remove_edge(*edge)
+        # 删除操作已写入变更日志，提交即可持久化，不需要完整保存
+        self.storage.commit()
+        print(
+            f"已移除 {self_loops} 条自循环边和 {len(edges_to_remove) - self_loops} 条重复边"
+        )
 
     def merge_graphs(self, other_entity: "GraphEntity") -> None:
         """
@@ -471,7 +503,7 @@ class GraphEntity:
 
                     # 合并别名
                     for alias in node_info["aliases"]:
-                        if alias not in self.storage.alias_to_main_id:
+                        if alias not in self.storage.aliases:
                             self._add_alias(main_id, alias)
                             print(f"添加别名: {alias} -> {main_id}")
                 else:
@@ -519,7 +551,7 @@ class GraphEntity:
         print(
             f"- 总别名数: {sum(len(aliases) for aliases in self.storage.entity_aliases.values())}"
         )
-        print(f"- 向量库数量: {len(self.storage.vector_stores)}")
+        print(f"- 向量库数量: {self.storage.get_store_count()}")
 
     def detect_communities(
         self, resolution: float = 1.2, min_community_size: int = 4
@@ -545,8 +577,20 @@ class GraphEntity:
         )
         print("检测到的社区数:", len(raw_communities))
 
+        # 成员和关系都没有变化的社区沿用上次生成的摘要
+        try:
+            prompt_sha = load_prompt(COMMUNITY_SUMMARY_PROMPT)[1]
+        except OSError:
+            prompt_sha = ""
+        previous_summaries = {
+            data["summary_key"]: data["summary"]
+            for data in self.storage.communities.values()
+            if data.get("summary_key") and data.get("summary")
+        }
+
         # 分析每个社区
         communities_data = {}
+        pending = []  # 需要生成摘要的社区
         for idx, members in enumerate(raw_communities):
             if len(members) < min_community_size:
                 print(
@@ -565,19 +609,44 @@ class GraphEntity:
             community_relations = self._get_community_relations(members_list)
             print(f"社区 {idx} 的关系数: {len(community_relations)}")
 
-            # 生成社区摘要
-            summary = self._generate_community_summary(
-                members_list, central_members, community_relations
-            )
-            print(f"社区 {idx} 的摘要: {summary[:200]}...")  # 只打印前200字符
-
             # 创建社区信息字典
+            summary_key = self._community_summary_key(
+                prompt_sha, members_list, community_relations
+            )
             communities_data[idx] = {
                 "members": members_list,
                 "central_members": central_members,
                 "relations": community_relations,
-                "summary": summary,
+                "summary": previous_summaries.get(summary_key),
+                "summary_key": summary_key,
             }
+            if communities_data[idx]["summary"] is None:
+                pending.append(idx)
+
+        # 并发生成有变化的社区的摘要
+        print(
+            f"\n{len(communities_data) - len(pending)} 个社区没有变化，沿用已有摘要；"
+            f"需要生成 {len(pending)} 个社区的摘要"
+        )
+        if pending:
+            with ThreadPoolExecutor(
+                max_workers=LLM_CONCURRENCY, thread_name_prefix="community-summary"
+            ) as executor:
+                summaries = executor.map(
+                    lambda idx: self._generate_community_summary(
+                        communities_data[idx]["members"],
+                        communities_data[idx]["central_members"],
+                        communities_data[idx]["relations"],
+                    ),
+                    pending,
+                )
+                for idx, summary in zip(pending, summaries):
+                    if summary is None:
+                        # 生成失败，下次检测时重新生成
+                        summary = ""
+                        communities_data[idx]["summary_key"] = None
+                    communities_data[idx]["summary"] = summary
+                    print(f"社区 {idx} 的摘要: {summary[:200]}...")  # 只打印前200字符
 
         # 保存社区数据和摘要
         self.storage.save_communities(communities_data)
@@ -586,6 +655,21 @@ class GraphEntity:
 
         return communities_data
 
+    @staticmethod
+    def _community_summary_key(
+        prompt_sha: str, members: List[str], relations: List[Dict]
+    ) -> str:
+        """由提示词模板、成员集合和关系列表计算社区摘要的缓存键"""
+        payload = json.dumps(
+            [
+                prompt_sha,
+                sorted(members),
+                sorted((rel["source"], rel["target"], rel["type"]) for rel in relations),
+            ],
+            ensure_ascii=False,
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
     def _identify_central_members(self, members: List[str]) -> List[str]:
         """
         识别社区的核心成员
@@ -702,8 +786,7 @@ class GraphEntity:
                 relation_info.append(f"- {'; '.join(examples)}")
 
             # 3. 读取并填充提示模板
-            with open(COMMUNITY_SUMMARY_PROMPT, "r", encoding="utf-8") as f:
-                prompt_template = f.read()
+            prompt_template = load_prompt(COMMUNITY_SUMMARY_PROMPT)[0]
 
             # 4. 填充模板
             prompt = prompt_template.format(
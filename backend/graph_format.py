@@ -0,0 +1,294 @@
+import gc
+import os
+import json
+from typing import Any, Dict, List, Set, Tuple
+import networkx as nx
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """把字符串列表打包为 UTF-8 字节块和偏移数组"""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+def unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """从字节块和偏移数组还原字符串列表"""
+    data = blob.tobytes()
+    bounds = offsets.tolist()
+    return [
+        data[bounds[i] : bounds[i + 1]].decode("utf-8")
+        for i in range(len(bounds) - 1)
+    ]
+
+
+class _StringTable:
+    """字符串驻留表，同一个字符串只保存一次"""
+
+    def __init__(self, initial: List[str] = ()):
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for s in initial:
+            self.intern(s)
+
+    def intern(self, s: str) -> int:
+        string_id = self.ids.get(s)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[s] = string_id
+            self.strings.append(s)
+        return string_id
+
+
+def pack_graph(
+    graph: nx.MultiDiGraph,
+    entity_aliases: Dict[str, Set[str]],
+    alias_to_main_id: Dict[str, str],
+) -> Dict[str, np.ndarray]:
+    """
+    把图结构和别名信息打包为一组数组
+
+    节点ID、关系类型和别名统一放入字符串表，边以 (起点, 终点, key, 类型) 四列整数数组保存。
+
+    Args:
+        graph: 图结构
+        entity_aliases: 主实体 -> 别名集合
+        alias_to_main_id: 别名 -> 主实体
+
+    Returns:
+        Dict[str, np.ndarray]: 数组名 -> 数组
+    """
+    nodes = list(graph.nodes())
+    table = _StringTable(nodes)
+    types = _StringTable()
+
+    edges = list(graph.edges(keys=True, data="type"))
+    count = len(edges)
+    edge_src = np.fromiter((table.ids[u] for u, _, _, _ in edges), np.int32, count)
+    edge_dst = np.fromiter((table.ids[v] for _, v, _, _ in edges), np.int32, count)
+    edge_key = np.fromiter((k for _, _, k, _ in edges), np.int32, count)
+    edge_type = np.fromiter((types.intern(t) for _, _, _, t in edges), np.int32, count)
+
+    alias_pairs = [
+        (table.intern(main_id), table.intern(alias))
+        for main_id, aliases in entity_aliases.items()
+        for alias in aliases
+    ]
+    mapping_pairs = [
+        (table.intern(alias), table.intern(main_id))
+        for alias, main_id in alias_to_main_id.items()
+    ]
+
+    string_blob, string_offsets = pack_strings(table.strings)
+    type_blob, type_offsets = pack_strings(types.strings)
+    return {
+        "node_count": np.array(len(nodes)),
+        "string_blob": string_blob,
+        "string_offsets": string_offsets,
+        "type_blob": type_blob,
+        "type_offsets": type_offsets,
+        "edge_src": edge_src,
+        "edge_dst": edge_dst,
+        "edge_key": edge_key,
+        "edge_type": edge_type,
+        "aliases": np.array(alias_pairs, dtype=np.int32).reshape(-1, 2),
+        "alias_to_main": np.array(mapping_pairs, dtype=np.int32).reshape(-1, 2),
+    }
+
+
+def unpack_graph(
+    arrays,
+) -> Tuple[nx.MultiDiGraph, Dict[str, Set[str]], Dict[str, str]]:
+    """
+    从 pack_graph 生成的数组还原图结构和别名信息
+
+    Args:
+        arrays: 数组名 -> 数组（可以是 npz 文件或内存映射的数组）
+
+    Returns:
+        Tuple: (图结构, 主实体 -> 别名集合, 别名 -> 主实体)
+    """
+    strings = unpack_strings(arrays["string_blob"], arrays["string_offsets"])
+    types = unpack_strings(arrays["type_blob"], arrays["type_offsets"])
+    node_count = int(arrays["node_count"])
+    edge_src = arrays["edge_src"].tolist()
+    edge_dst = arrays["edge_dst"].tolist()
+    edge_key = arrays["edge_key"].tolist()
+    edge_type = arrays["edge_type"].tolist()
+    alias_pairs = arrays["aliases"].tolist()
+    mapping_pairs = arrays["alias_to_main"].tolist()
+
+    # 构建期间会创建大量小字典，暂停分代垃圾回收避免反复扫描
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from(strings[:node_count])
+        # 直接填充邻接字典：文件中的 (起点, 终点, key) 唯一且节点都已添加，
+        # 不需要 add_edge 的逐条检查和缓存清理
+        succ, pred = graph._succ, graph._pred
+        for u, v, k, t in zip(edge_src, edge_dst, edge_key, edge_type):
+            u, v = strings[u], strings[v]
+            key_dict = succ[u].get(v)
+            if key_dict is None:
+                key_dict = succ[u][v] = pred[v][u] = {}
+            key_dict[k] = {"type": types[t]}
+
+        entity_aliases: Dict[str, Set[str]] = {}
+        for main_id, alias in alias_pairs:
+            entity_aliases.setdefault(strings[main_id], set()).add(strings[alias])
+        alias_to_main_id = {
+            strings[alias]: strings[main_id] for alias, main_id in mapping_pairs
+        }
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    return graph, entity_aliases, alias_to_main_id
+
+
+def save_graph(
+    path: str,
+    graph: nx.MultiDiGraph,
+    entity_aliases: Dict[str, Set[str]],
+    alias_to_main_id: Dict[str, str],
+    journal_seq: int = 0,
+) -> None:
+    """
+    以二进制格式保存图结构和别名信息
+
+    先写临时文件再重命名，保证文件始终完整。
+
+    Args:
+        path: 文件路径（.npz）
+        graph: 图结构
+        entity_aliases: 主实体 -> 别名集合
+        alias_to_main_id: 别名 -> 主实体
+        journal_seq: 快照包含的最后一条变更日志序号
+    """
+    arrays = pack_graph(graph, entity_aliases, alias_to_main_id)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            version=np.array(FORMAT_VERSION),
+            journal_seq=np.array(journal_seq, dtype=np.int64),
+            **arrays,
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_graph(
+    path: str,
+) -> Tuple[nx.MultiDiGraph, Dict[str, Set[str]], Dict[str, str], int]:
+    """
+    加载二进制格式的图结构和别名信息
+
+    Args:
+        path: 文件路径（.npz）
+
+    Returns:
+        Tuple: (图结构, 主实体 -> 别名集合, 别名 -> 主实体, 变更日志序号)
+    """
+    with np.load(path) as data:
+        version = int(data["version"])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"不支持的图谱文件版本: {version}")
+        journal_seq = int(data["journal_seq"]) if "journal_seq" in data.files else 0
+        graph, entity_aliases, alias_to_main_id = unpack_graph(data)
+
+    return graph, entity_aliases, alias_to_main_id, journal_seq
+
+
+def load_legacy_graph(
+    path: str,
+) -> Tuple[nx.MultiDiGraph, Dict[str, Set[str]], Dict[str, str]]:
+    """
+    加载旧版 graph.json
+
+    不同 networkx 版本导出的边列表键名不同（links / edges），这里两种都支持。
+
+    Args:
+        path: graph.json 路径
+
+    Returns:
+        Tuple: (图结构, 主实体 -> 别名集合, 别名 -> 主实体)
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    graph_data = data["graph"]
+    graph = nx.MultiDiGraph()
+    graph.add_nodes_from(
+        (node["id"], {k: v for k, v in node.items() if k != "id"})
+        for node in graph_data["nodes"]
+    )
+    for link in graph_data.get("links", graph_data.get("edges", [])):
+        attrs = {
+            k: v for k, v in link.items() if k not in ("source", "target", "key")
+        }
+        graph.add_edge(link["source"], link["target"], key=link.get("key"), **attrs)
+
+    entity_aliases = {k: set(v) for k, v in data["aliases"].items()}
+    return graph, entity_aliases, data["alias_to_main_id"]
+
+
+def load_node_link_data(base_path: str) -> Dict[str, Any]:
+    """
+    按需生成知识库图结构的 node-link JSON 数据（供前端展示）
+
+    优先读取二进制图谱文件，不存在时读取旧版 graph.json。
+
+    Args:
+        base_path: 知识库路径
+
+    Returns:
+        Dict[str, Any]: nx.node_link_data 格式的数据
+
+    Raises:
+        FileNotFoundError: 两种图谱文件都不存在
+    """
+    binary_file = os.path.join(base_path, "graph.npz")
+    if os.path.exists(binary_file):
+        with np.load(binary_file) as data:
+            strings = unpack_strings(data["string_blob"], data["string_offsets"])
+            types = unpack_strings(data["type_blob"], data["type_offsets"])
+            node_count = int(data["node_count"])
+            columns = zip(
+                data["edge_src"].tolist(),
+                data["edge_dst"].tolist(),
+                data["edge_key"].tolist(),
+                data["edge_type"].tolist(),
+            )
+            links = [
+                {"type": types[t], "source": strings[u], "target": strings[v], "key": k}
+                for u, v, k, t in columns
+            ]
+        return {
+            "directed": True,
+            "multigraph": True,
+            "graph": {},
+            "nodes": [{"id": node} for node in strings[:node_count]],
+            "links": links,
+        }
+
+    json_file = os.path.join(base_path, "graph.json")
+    if not os.path.exists(json_file):
+        raise FileNotFoundError(f"未找到图谱文件: {base_path}")
+    with open(json_file, "r", encoding="utf-8") as f:
+        graph_data = json.load(f)
+    # 旧版文件把图结构包在顶层的 "graph" 键中
+    if "graph" in graph_data and "nodes" in graph_data["graph"]:
+        graph_data = graph_data["graph"]
+    # 前端读取 links 字段
+    if "links" not in graph_data and "edges" in graph_data:
+        graph_data["links"] = graph_data.pop("edges")
+    return graph_data
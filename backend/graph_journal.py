@@ -0,0 +1,117 @@
+import os
+import json
+import base64
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+
+def encode_vector(vector) -> str:
+    """向量编码为 base64 字符串（float32）"""
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode(
+        "ascii"
+    )
+
+
+def decode_vector(data: str) -> np.ndarray:
+    """从 base64 字符串还原向量"""
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).copy()
+
+
+class GraphJournal:
+    """
+    图谱变更的预写日志
+
+    每条变更追加为一行 JSON（带递增序号），commit 写入提交标记并落盘。
+    恢复时只重放最后一个提交标记之前的记录，之后的记录属于未完成的提交，直接丢弃。
+    检查点（完整保存图谱）完成后清空日志。
+    """
+
+    def __init__(self, path: str):
+        """
+        初始化日志
+
+        Args:
+            path: 日志文件路径
+        """
+        self.path = path
+        self.seq = 0  # 最后一条记录的序号
+        self._file = None
+        self._lock = threading.Lock()
+
+    def append(self, op: str, **args: Any) -> None:
+        """追加一条变更记录（不落盘，由 commit 统一落盘）"""
+        with self._lock:
+            self.seq += 1
+            self._write({"seq": self.seq, "op": op, "args": args})
+
+    def commit(self, tag: Optional[str] = None) -> None:
+        """
+        写入提交标记并落盘，之前的记录在崩溃后可以恢复
+
+        Args:
+            tag: 提交标签（如数据项ID），恢复时返回
+        """
+        with self._lock:
+            self.seq += 1
+            self._write({"seq": self.seq, "op": "commit", "tag": tag})
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def recover(
+        self, after_seq: int
+    ) -> Tuple[List[Dict[str, Any]], List[Optional[str]], bool]:
+        """
+        读取已提交的变更
+
+        Args:
+            after_seq: 快照中已包含的最后序号，只返回之后的记录
+
+        Returns:
+            Tuple: (需要重放的记录, 提交标签列表, 日志是否有任何内容)
+        """
+        self.seq = max(self.seq, after_seq)
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return [], [], False
+
+        records, tags = [], []
+        pending = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # 写到一半的记录
+                self.seq = max(self.seq, record["seq"])
+                if record["seq"] <= after_seq:
+                    continue
+                if record["op"] == "commit":
+                    records.extend(pending)
+                    tags.append(record.get("tag"))
+                    pending = []
+                else:
+                    pending.append(record)
+        return records, tags, True
+
+    def truncate(self) -> None:
+        """清空日志（检查点完成后调用）"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            with open(self.path, "w", encoding="utf-8") as f:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self) -> None:
+        """关闭日志文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -38,24 +38,23 @@ class GraphSearch:
             List[Tuple[Any, float]]: 搜索结果和相似度分数
         """
         try:
-            # 如果指定了实体ID，在实体的向量存储中搜索
+            # 生成查询向量
+            if not isinstance(query, str):
+                raise ValueError("查询必须是字符串")
+
+            # 如果指定了实体ID，在实体内容索引中只检索该实体的文档
             if entity_id:
                 main_id = self.entity_manager._get_main_id(entity_id)
-                if not main_id or main_id not in self.storage.vector_stores:
+                if not main_id:
                     return []
-                vector_store = self.storage.vector_stores[main_id]
+                results = self.storage.entity_index.search(query, main_id, k=k)
             # 否则在全局向量存储中搜索
             else:
                 if not self.storage.global_vector_store:
                     return []
-                vector_store = self.storage.global_vector_store
-
-            # 生成查询向量
-            if not isinstance(query, str):
-                raise ValueError("查询必须是字符串")
-
-            # 执行相似度搜索
-            results = vector_store.similarity_search_with_score(query, k=k)
+                results = self.storage.global_vector_store.similarity_search_with_score(
+                    query, k=k
+                )
 
             # 处理和过滤结果
             valid_results = []
@@ -89,16 +88,14 @@ class GraphSearch:
             if not isinstance(query_embedding, np.ndarray):
                 query_embedding = np.array(query_embedding)
 
-            # 计算相似度
-            similarities = []
-            for entity_id, entity_embedding in self.storage.entity_embeddings.items():
-                if not isinstance(entity_embedding, np.ndarray):
-                    entity_embedding = np.array(entity_embedding)
-                similarity = cosine_similarity([query_embedding], [entity_embedding])[
-                    0
-                ][0]
-                if similarity >= threshold:
-                    similarities.append((entity_id, similarity))
+            # 直接在嵌入矩阵上计算相似度
+            entity_ids, matrix = self.storage.entity_embeddings.matrix()
+            if not entity_ids:
+                return []
+            scores = cosine_similarity([query_embedding], matrix)[0]
+            similarities = [
+                (entity_ids[i], scores[i]) for i in np.flatnonzero(scores >= threshold)
+            ]
 
             # 按相似度排序
             return sorted(similarities, key=lambda x: x[1], reverse=True)[:top_n]
@@ -134,47 +131,44 @@ class GraphSearch:
                 entity: str,
             ) -> List[Tuple[str, str, str, float]]:
                 """处理单个实体的关系"""
-                relations = []
+                candidates = []
 
-                # 处理出边
+                # 收集出边
                 for successor in self.storage.graph.successors(entity):
                     edges_data = self.storage.graph.get_edge_data(entity, successor)
                     if edges_data:
                         for edge_data in edges_data.values():
-                            relation_text = (
-                                f"{entity}与{successor}的关系是{edge_data['type']}"
-                            )
-                            relation_embedding = (
-                                EmbeddingModel.get_instance().embed_query(relation_text)
-                            )
-                            similarity = cosine_similarity(
-                                [query_embedding], [relation_embedding]
-                            )[0][0]
-                            if similarity >= 0.5:
-                                relations.append(
-                                    (entity, edge_data["type"], successor, similarity)
-                                )
-
-                # 处理入边
+                            candidates.append((entity, edge_data["type"], successor))
+
+                # 收集入边
                 for predecessor in self.storage.graph.predecessors(entity):
                     edges_data = self.storage.graph.get_edge_data(predecessor, entity)
                     if edges_data:
                         for edge_data in edges_data.values():
-                            relation_text = (
-                                f"{predecessor}与{entity}的关系是{edge_data['type']}"
-                            )
-                            relation_embedding = (
-                                EmbeddingModel.get_instance().embed_query(relation_text)
-                            )
-                            similarity = cosine_similarity(
-                                [query_embedding], [relation_embedding]
-                            )[0][0]
-                            if similarity >= 0.5:
-                                relations.append(
-                                    (predecessor, edge_data["type"], entity, similarity)
-                                )
-
-                return relations
+                            candidates.append((predecessor, edge_data["type"], entity))
+
+                if not candidates:
+                    return []
+
+                # 批量生成关系描述的嵌入并计算相似度
+                relation_texts = [
+                    f"{source}与{target}的关系是{relation}"
+                    for source, relation, target in candidates
+                ]
+                relation_embeddings = EmbeddingModel.get_instance().embed_many(
+                    relation_texts
+                )
+                similarities = cosine_similarity(
+                    [query_embedding], relation_embeddings
+                )[0]
+
+                return [
+                    (source, relation, target, similarity)
+                    for (source, relation, target), similarity in zip(
+                        candidates, similarities
+                    )
+                    if similarity >= 0.5
+                ]
 
             # 首先处理主实体的关系
             results.extend(process_entity_relationships(main_id))
@@ -182,17 +176,16 @@ class GraphSearch:
 
             # 如果结果不足k个，搜索相似实体的关系
             while len(results) < k:
-                similar_entities = []
                 main_embedding = self.storage.entity_embeddings[main_id]
 
                 # 查找相似实体
-                for entity, embedding in self.storage.entity_embeddings.items():
-                    if entity not in processed_entities:
-                        similarity = cosine_similarity([main_embedding], [embedding])[
-                            0
-                        ][0]
-                        if similarity >= 0.8:
-                            similar_entities.append((entity, similarity))
+                entity_ids, matrix = self.storage.entity_embeddings.matrix()
+                scores = cosine_similarity([main_embedding], matrix)[0]
+                similar_entities = [
+                    (entity_ids[i], scores[i])
+                    for i in np.flatnonzero(scores >= 0.8)
+                    if entity_ids[i] not in processed_entities
+                ]
 
                 if not similar_entities:
                     break
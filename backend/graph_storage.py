@@ -1,34 +1,88 @@
 import os
 import json
+import fcntl
 import base64
 import shutil
-from typing import List, Tuple, Dict, Optional, Set, Any
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Tuple, Dict, Iterator, Optional, Set, Any
 import networkx as nx
 import numpy as np
 from langchain.text_splitter import MarkdownHeaderTextSplitter
+from langchain_core.documents import Document
 from langchain_community.vectorstores.faiss import FAISS
 from langchain_community.vectorstores.utils import DistanceStrategy
 from embedding_model import EmbeddingModel
+from entity_embeddings import EntityEmbeddingStore
+from alias_index import AliasIndex
+from entity_index import EntityChunkIndex
+from graph_format import save_graph, load_graph, load_legacy_graph
+from graph_journal import GraphJournal, encode_vector, decode_vector
+from entity_store import create_entity_store, chunk_hash, parse_content_units
+from config import (
+    ENTITY_CONTENT_CACHE_SIZE,
+    ENTITY_EMBEDDING_DTYPE,
+    ENTITY_STORE_BACKEND,
+    GLOBAL_DELTA_MAX_COUNT,
+)
+
+
+@contextmanager
+def knowledge_base_lock(base_path: str, blocking: bool = True) -> Iterator[None]:
+    """
+    知识库的进程间排他锁，构建、发布和压缩知识库时持有，避免相互覆盖
+
+    Args:
+        base_path: 知识库路径
+        blocking: 锁被占用时是否等待，False 时直接抛出 RuntimeError
+    """
+    os.makedirs(base_path, exist_ok=True)
+    with open(os.path.join(base_path, ".lock"), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            raise RuntimeError(f"知识库正在被其他进程修改: {base_path}")
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
 
 
 class GraphStorage:
     """图谱存储管理器，处理所有与存储相关的操作"""
 
-    def __init__(self, base_path: str):
+    def __init__(self, base_path: str, entity_store=None):
         """
         初始化存储管理器
 
         Args:
             base_path: 基础存储路径
+            entity_store: 可选的实体内容存储，默认按配置创建
         """
         # 基础路径
         self.base_path = base_path
 
         # 核心文件路径（直接在base_path下）
-        self.graph_file = os.path.join(base_path, "graph.json")  # 图结构文件
+        self.graph_file = os.path.join(base_path, "graph.npz")  # 图结构文件
+        self.legacy_graph_file = os.path.join(
+            base_path, "graph.json"
+        )  # 旧版JSON格式的图结构
         self.embeddings_file = os.path.join(
+            base_path, "embeddings.npy"
+        )  # 实体嵌入矩阵
+        self.embedding_ids_file = os.path.join(
+            base_path, "embedding_ids.json"
+        )  # 嵌入矩阵的行索引
+        self.legacy_embeddings_file = os.path.join(
             base_path, "embeddings.json"
-        )  # 实体嵌入文件
+        )  # 旧版JSON格式的实体嵌入
+        self.relation_embeddings_file = os.path.join(
+            base_path, "relation_embeddings.npy"
+        )  # 关系类型嵌入矩阵
+        self.relation_embedding_ids_file = os.path.join(
+            base_path, "relation_embedding_ids.json"
+        )  # 关系类型嵌入矩阵的行索引
         self.global_doc_path = os.path.join(base_path, "global.md")  # 全局文档
 
         # 子文件夹路径
@@ -37,16 +91,35 @@ class GraphStorage:
 
         # 核心组件
         self.graph = nx.MultiDiGraph()
+        self.entity_store = (
+            entity_store
+            if entity_store is not None
+            else create_entity_store(ENTITY_STORE_BACKEND, base_path)
+        )
+        self._entity_cache: "OrderedDict[str, List[Tuple[str, str]]]" = (
+            OrderedDict()
+        )  # 已解析的实体内容（LRU）
+        self._entity_cache_hits = 0
+        self._entity_cache_misses = 0
+        self._entity_cache_lock = threading.Lock()  # 检索线程共享同一个图谱
 
         # 实体管理
-        self.entity_embeddings: Dict[str, np.ndarray] = {}  # 实体嵌入
-        self.entity_aliases: Dict[str, Set[str]] = {}  # 实体别名
-        self.alias_to_main_id: Dict[str, str] = {}  # 别名到主实体的映射
+        self.entity_embeddings = EntityEmbeddingStore(
+            ENTITY_EMBEDDING_DTYPE
+        )  # 实体嵌入
+        self.aliases = AliasIndex()  # 实体别名（并查集）
+        # 关系类型词表：关系类型 -> 嵌入，只是缓存，缺失的类型在用到时重新计算
+        self.relation_embeddings = EntityEmbeddingStore(ENTITY_EMBEDDING_DTYPE)
 
         # 向量存储
-        self.vector_stores: Dict[str, FAISS] = {}  # 实体向量库
+        self.entity_index_path = os.path.join(self.vector_path, "entity_chunks")
+        self.entity_index = EntityChunkIndex()  # 所有实体共用的内容向量索引
+        self.global_store_path = os.path.join(self.vector_path, "global")
+        self.global_delta_path = os.path.join(self.vector_path, "global_deltas")
         self.global_vector_store: Optional[FAISS] = None  # 全局向量库
-        self.global_content: Set[str] = set()  # 全局文档内容
+        self.global_chunks: Set[str] = set()  # 全局文档中已有内容块的哈希
+        self.global_indexed_bytes = 0  # 全局文档中已向量化的字节数
+        self.global_deltas: List[str] = []  # 尚未合并进基础库的增量目录
 
         # 添加社区相关的存储路径
         self.community_file = os.path.join(base_path, "communities.json")
@@ -57,6 +130,11 @@ class GraphStorage:
         # 变更追踪：仅追踪实体修改
         self.modified_entities: Set[str] = set()
 
+        # 变更日志：两次完整保存之间的变更先写入日志，崩溃后重放
+        self.journal = GraphJournal(os.path.join(base_path, "journal.log"))
+        self.recovered_tags: List[str] = []  # 加载时从日志恢复的提交标签
+        self._replaying = False
+
     def _init_storage(self) -> None:
         """初始化存储结构"""
         # 创建必要的目录和文件
@@ -70,81 +148,275 @@ class GraphStorage:
                 pass
 
     def save(self) -> None:
-        """保存图谱数据"""
-        # 保存图结构和别名信息
-        graph_data = {
-            "graph": nx.node_link_data(self.graph),
-            "aliases": {k: list(v) for k, v in self.entity_aliases.items()},
-            "alias_to_main_id": self.alias_to_main_id,
-        }
-        with open(self.graph_file, "w", encoding="utf-8") as f:
-            json.dump(graph_data, f, ensure_ascii=False, indent=2)
-
-        # 保存实体嵌入
-        embeddings_data = {}
-        for k, v in self.entity_embeddings.items():
-            if not isinstance(v, np.ndarray):
-                v = np.array(v)
-            embeddings_data[k] = v.tolist()
-        with open(self.embeddings_file, "w", encoding="utf-8") as f:
-            json.dump(embeddings_data, f)
+        """
+        保存图谱数据（检查点）
+
+        图结构文件最后写入，其中记录了快照包含的日志序号，写入完成后清空变更日志。
+        """
+        # 保存实体嵌入（只写回修改过的行）
+        self.entity_embeddings.save(self.embeddings_file, self.embedding_ids_file)
+        if os.path.exists(self.legacy_embeddings_file) and os.path.exists(
+            self.embeddings_file
+        ):
+            os.remove(self.legacy_embeddings_file)
+        self.relation_embeddings.save(
+            self.relation_embeddings_file, self.relation_embedding_ids_file
+        )
 
         # 更新修改过的实体的向量库
-        for entity_id in self.modified_entities:
-            if entity_id in self.graph.nodes():
-                content = self.load_entity(entity_id)
-                if content:
-                    self._create_entity_vector_store(entity_id, content)
-                    print(f"更新实体 '{entity_id}' 的向量库")
+        self._reindex_modified_entities()
+        self.entity_index.save(self.entity_index_path)
 
-        # 更新全局向量库
-        if os.path.exists(self.global_doc_path):
-            self._create_global_vector_store()
+        # 只向量化全局文档新追加的部分
+        if self._update_global_vector_store():
             print(f"更新全局向量库")
 
+        # 保存图结构和别名信息
+        save_graph(
+            self.graph_file,
+            self.graph,
+            self.aliases.members,
+            self.aliases.mapping(),
+            self.journal.seq,
+        )
+        if os.path.exists(self.legacy_graph_file):
+            os.remove(self.legacy_graph_file)
+        self.journal.truncate()
+
         # 清空变更追踪
         self.modified_entities.clear()
 
-    def load(self) -> None:
-        """加载图谱数据"""
+    def commit(self, tag: Optional[str] = None) -> None:
+        """
+        提交当前变更：变更日志落盘，崩溃后可以恢复到这里
+
+        Args:
+            tag: 提交标签（如数据项ID）
+        """
+        self.journal.commit(tag)
+
+    def load(self, checkpoint: bool = False) -> None:
+        """
+        加载图谱数据
+
+        默认只读加载：变更日志只在内存中重放，不写回任何文件，也不清空日志，
+        可以在构建进程写入的同时安全地加载。只有持有知识库锁的写入方
+        （构建、发布、压缩）才应传入 checkpoint=True，在加载后做检查点并清空日志。
+
+        Args:
+            checkpoint: 是否把重放结果和加载时补建的数据写回磁盘
+        """
+        if checkpoint:
+            self._init_storage()
+
         # 加载图结构和别名
-        if os.path.exists(self.graph_file):
+        journal_seq = 0
+        if os.path.exists(self.graph_file) or os.path.exists(self.legacy_graph_file):
             print(f"检测到已存在的知识图谱在 '{self.base_path}'，正在加载...")
-            with open(self.graph_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            self.graph = nx.node_link_graph(data["graph"], multigraph=True)
-            self.entity_aliases = {k: set(v) for k, v in data["aliases"].items()}
-            self.alias_to_main_id = data["alias_to_main_id"]
+            if os.path.exists(self.graph_file):
+                self.graph, entity_aliases, alias_to_main_id, journal_seq = (
+                    load_graph(self.graph_file)
+                )
+            else:
+                self.graph, entity_aliases, alias_to_main_id = load_legacy_graph(
+                    self.legacy_graph_file
+                )
+            self.aliases = AliasIndex.from_mappings(
+                self.graph.nodes(), entity_aliases, alias_to_main_id
+            )
 
             # 加载实体嵌入
-            if os.path.exists(self.embeddings_file):
+            if os.path.exists(self.embeddings_file) and os.path.exists(
+                self.embedding_ids_file
+            ):
                 print("正在加载实体嵌入...")
-                with open(self.embeddings_file, "r", encoding="utf-8") as f:
-                    embeddings_data = json.load(f)
-                # 直接将列表转换为numpy数组，因为加载的数据已经是列表形式
-                self.entity_embeddings = {
-                    k: np.array(v) for k, v in embeddings_data.items()
-                }
+                self.entity_embeddings.load(
+                    self.embeddings_file, self.embedding_ids_file
+                )
+            elif os.path.exists(self.legacy_embeddings_file):
+                print("正在从旧版 embeddings.json 导入实体嵌入...")
+                self.entity_embeddings.load_json(self.legacy_embeddings_file)
             else:
                 print("未找到实体嵌入文件，正在重新生成...")
                 self._regenerate_embeddings()
+            if os.path.exists(self.relation_embeddings_file) and os.path.exists(
+                self.relation_embedding_ids_file
+            ):
+                self.relation_embeddings.load(
+                    self.relation_embeddings_file, self.relation_embedding_ids_file
+                )
 
             # 加载全局文档内容
             if os.path.exists(self.global_doc_path):
                 with open(self.global_doc_path, "r", encoding="utf-8") as f:
-                    self.global_content = set(f.read().split("\n\n"))
+                    self.global_chunks = {
+                        chunk_hash(title, content)
+                        for title, content in parse_content_units(f)
+                    }
 
             # 加载向量库
-            self._load_vector_stores()
+            self._load_vector_stores(persist=checkpoint)
 
             # 加载社区数据
             self._load_community_data()
         
         else:
-            # 如果graph.json不存在，但可能存在global.md需要生成向量库
+            # 如果图谱文件不存在，但可能存在global.md需要生成向量库
             if os.path.exists(self.global_doc_path):
                  print(f"未找到图谱文件，但发现全局文档，正在初始化向量库...")
-                 self._load_vector_stores()
+                 self._load_vector_stores(persist=checkpoint)
+
+        # 重放上次检查点之后已提交的变更
+        self._recover_journal(journal_seq, checkpoint)
+
+    def _recover_journal(self, journal_seq: int, checkpoint: bool) -> None:
+        """重放变更日志中已提交的记录；checkpoint 为 True 时随后做一次检查点"""
+        records, tags, has_content = self.journal.recover(journal_seq)
+        self.recovered_tags = [tag for tag in tags if tag is not None]
+        if not has_content:
+            return
+
+        if records:
+            print(f"正在从变更日志恢复 {len(records)} 条变更...")
+            self._replaying = True
+            try:
+                for record in records:
+                    self._apply(record["op"], record["args"], persist=checkpoint)
+            finally:
+                self._replaying = False
+
+        if checkpoint:
+            self.save()
+        else:
+            # 只读加载：只更新内存中的向量索引，日志留给持有锁的写入方做检查点
+            self._reindex_modified_entities()
+            self.modified_entities.clear()
+            self._update_global_vector_store(persist=False)
+
+    def _log(self, op: str, **args: Any) -> None:
+        """记录一条变更（重放时不重复记录）"""
+        if not self._replaying:
+            self.journal.append(op, **args)
+
+    def _apply(self, op: str, args: Dict[str, Any], persist: bool = True) -> None:
+        """
+        重放一条变更记录
+
+        实体内容和全局文档在记录日志之前就已写入磁盘，persist 为 False 时
+        内容相关的记录只更新内存状态，不再写文件。
+        """
+        if not persist and op in ("save_entity", "append_entity_content"):
+            self._invalidate_entity_cache(args["entity_id"])
+            self.modified_entities.add(args["entity_id"])
+        elif not persist and op == "remove_entity":
+            self._forget_entity(args["entity_id"])
+        elif op == "add_entity_node":
+            self.add_entity_node(args["entity_id"], decode_vector(args["embedding"]))
+        elif op == "remove_entity_node":
+            self.remove_entity_node(args["entity_id"])
+        elif op == "add_alias":
+            self.add_alias(args["main_id"], args["alias"])
+        elif op == "add_edge":
+            self.add_edge(args["source"], args["target"], args["type"])
+        elif op == "remove_edge":
+            self.remove_edge(args["source"], args["target"], args["key"])
+        elif op == "save_entity":
+            self.save_entity(args["entity_id"], args["content_units"])
+        elif op == "append_entity_content":
+            self.append_entity_content(args["entity_id"], args["content_units"])
+        elif op == "remove_entity":
+            self.remove_entity(args["entity_id"])
+        else:
+            raise ValueError(f"未知的变更日志记录: {op}")
+
+    def add_entity_node(self, entity_id: str, embedding) -> None:
+        """
+        添加实体节点及其嵌入
+
+        Args:
+            entity_id: 实体ID
+            embedding: 实体名称的嵌入向量
+        """
+        self._log(
+            "add_entity_node", entity_id=entity_id, embedding=encode_vector(embedding)
+        )
+        self.graph.add_node(entity_id)
+        self.entity_embeddings[entity_id] = embedding
+        self.aliases.add_main(entity_id)
+
+    def remove_entity_node(self, entity_id: str) -> None:
+        """删除实体节点（连同相关的边）及其嵌入，保留实体内容"""
+        self._log("remove_entity_node", entity_id=entity_id)
+        if entity_id in self.graph:
+            self.graph.remove_node(entity_id)
+        if entity_id in self.entity_embeddings:
+            del self.entity_embeddings[entity_id]
+        self.aliases.remove(entity_id)
+
+    @property
+    def entity_aliases(self) -> Dict[str, Set[str]]:
+        """主实体 -> 别名集合（只读）"""
+        return self.aliases.members
+
+    @property
+    def alias_to_main_id(self) -> Dict[str, str]:
+        """名称 -> 主实体（每次调用重新生成，查找单个名称请用 resolve）"""
+        return self.aliases.mapping()
+
+    def resolve(self, name: str) -> Optional[str]:
+        """
+        查找实体ID或别名对应的主实体
+
+        Args:
+            name: 实体ID或别名
+
+        Returns:
+            Optional[str]: 图谱中的主实体ID，未知名称返回 None
+        """
+        return self.aliases.find(name)
+
+    def add_alias(self, main_id: str, alias: str) -> None:
+        """
+        添加别名
+
+        alias 是另一个主实体时（合并实体），它的整个别名集合一并并入 main_id；
+        alias 已是其他实体的别名时保持原有归属。
+        """
+        self._log("add_alias", main_id=main_id, alias=alias)
+        if alias in self.aliases and not self.aliases.is_main(alias):
+            return
+        self.aliases.union(main_id, alias)
+
+    def relation_type_embeddings(self, relation_types: List[str]) -> np.ndarray:
+        """
+        获取关系类型的嵌入，词表中没有的类型一次批量计算后加入词表
+
+        Args:
+            relation_types: 关系类型列表
+
+        Returns:
+            np.ndarray: 与输入一一对应的嵌入矩阵
+        """
+        missing = list(
+            dict.fromkeys(t for t in relation_types if t not in self.relation_embeddings)
+        )
+        if missing:
+            embeddings = EmbeddingModel.get_instance().embed_many(missing)
+            for relation_type, embedding in zip(missing, embeddings):
+                self.relation_embeddings[relation_type] = embedding
+        return np.array(
+            [self.relation_embeddings[t] for t in relation_types], dtype=np.float32
+        )
+
+    def add_edge(self, source: str, target: str, relationship_type: str) -> None:
+        """添加关系边"""
+        self._log("add_edge", source=source, target=target, type=relationship_type)
+        self.graph.add_edge(source, target, type=relationship_type)
+
+    def remove_edge(self, source: str, target: str, key: Optional[int] = None) -> None:
+        """删除关系边，key 为 None 时删除任意一条"""
+        self._log("remove_edge", source=source, target=target, key=key)
+        self.graph.remove_edge(source, target, key)
 
     def _load_community_data(self) -> None:
         """尝试加载社区相关数据"""
@@ -187,11 +459,9 @@ class GraphStorage:
             entity_id: 实体ID
             content_units: [(title, content),...] 格式的内容单元列表
         """
-        # 保存到markdown文件
-        file_path = os.path.join(self.entity_path, f"{entity_id}.md")
-        with open(file_path, "w", encoding="utf-8") as f:
-            for title, content in content_units:
-                f.write(f"# {title}\n\n{content}\n\n")
+        self._log("save_entity", entity_id=entity_id, content_units=content_units)
+        self.entity_store.save(entity_id, content_units)
+        self._invalidate_entity_cache(entity_id)
 
         # 更新全局文档
         self._update_global_document(content_units)
@@ -199,6 +469,30 @@ class GraphStorage:
         # 标记实体为已修改
         self.modified_entities.add(entity_id)
 
+    def append_entity_content(
+        self, entity_id: str, content_units: List[Tuple[str, str]]
+    ) -> None:
+        """
+        向实体追加内容单元（已有的内容自动去重）
+
+        Args:
+            entity_id: 实体ID
+            content_units: [(title, content),...] 格式的内容单元列表
+        """
+        self._log(
+            "append_entity_content", entity_id=entity_id, content_units=content_units
+        )
+        added = self.entity_store.append(entity_id, content_units)
+        if not added:
+            return
+        self._invalidate_entity_cache(entity_id)
+
+        # 更新全局文档
+        self._update_global_document(added)
+
+        # 标记实体为已修改
+        self.modified_entities.add(entity_id)
+
     def load_entity(self, entity_id: str) -> List[Tuple[str, str]]:
         """
         加载实体数据
@@ -209,26 +503,50 @@ class GraphStorage:
         Returns:
             List[Tuple[str, str]]: 内容单元列表
         """
-        file_path = os.path.join(self.entity_path, f"{entity_id}.md")
-        if not os.path.exists(file_path):
-            return []
+        with self._entity_cache_lock:
+            content_units = self._entity_cache.get(entity_id)
+            if content_units is not None:
+                self._entity_cache.move_to_end(entity_id)
+                self._entity_cache_hits += 1
+                return list(content_units)
+            self._entity_cache_misses += 1
+
+        content_units = self.entity_store.load(entity_id)
+        with self._entity_cache_lock:
+            self._entity_cache[entity_id] = content_units
+            if len(self._entity_cache) > ENTITY_CONTENT_CACHE_SIZE:
+                self._entity_cache.popitem(last=False)
+        return list(content_units)
+
+    def _invalidate_entity_cache(self, entity_id: str) -> None:
+        """实体内容写入或删除后使缓存失效"""
+        with self._entity_cache_lock:
+            self._entity_cache.pop(entity_id, None)
+
+    def entity_cache_stats(self) -> Dict[str, Any]:
+        """获取实体内容缓存的命中统计"""
+        total = self._entity_cache_hits + self._entity_cache_misses
+        return {
+            "cached_entities": len(self._entity_cache),
+            "hits": self._entity_cache_hits,
+            "misses": self._entity_cache_misses,
+            "hit_rate": self._entity_cache_hits / total if total else 0.0,
+        }
 
-        content_units = []
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            title = ""
-            content = ""
-            for line in lines:
-                if line.startswith("# "):
-                    if title and content:
-                        content_units.append((title.strip(), content.strip()))
-                        content = ""
-                    title = line[2:].strip()
-                else:
-                    content += line
-            if title and content:
-                content_units.append((title.strip(), content.strip()))
-        return content_units
+    def search_entity_content(
+        self, keyword: str, limit: int = 10
+    ) -> List[Tuple[str, str, str]]:
+        """
+        按关键词检索实体内容（不需要嵌入模型）
+
+        Args:
+            keyword: 关键词
+            limit: 返回结果数量
+
+        Returns:
+            List[Tuple[str, str, str]]: (实体ID, 标题, 内容) 列表
+        """
+        return self.entity_store.search(keyword, limit)
 
     def save_communities(self, communities_data: Dict[int, Dict]) -> None:
         """保存社区数据到JSON"""
@@ -264,52 +582,85 @@ class GraphStorage:
         return sum(len(aliases) for aliases in self.entity_aliases.values())
 
     def get_store_count(self) -> int:
-        """获取向量存储数量"""
-        return len(self.vector_stores)
+        """获取拥有向量内容的实体数量"""
+        return len(self.entity_index)
 
     def _regenerate_embeddings(self) -> None:
         """重新生成所有实体的嵌入向量"""
-        self.entity_embeddings = {}
-        for node in self.graph.nodes():
-            embedding = EmbeddingModel.get_instance().embed_query(node)
-            if not isinstance(embedding, np.ndarray):
-                embedding = np.array(embedding)
+        self.entity_embeddings.clear()
+        nodes = list(self.graph.nodes())
+        if not nodes:
+            return
+        embeddings = EmbeddingModel.get_instance().embed_many(nodes)
+        for node, embedding in zip(nodes, embeddings):
             self.entity_embeddings[node] = embedding
 
-    def _load_vector_stores(self) -> None:
-        """加载向量存储"""
-        # 加载全局向量库
-        global_store_path = os.path.join(self.vector_path, "global")
-        if os.path.exists(global_store_path):
-            self.global_vector_store = FAISS.load_local(
-                global_store_path,
-                EmbeddingModel.get_instance(),
-                allow_dangerous_deserialization=True,
-            )
-        elif os.path.exists(self.global_doc_path):
-            self._create_global_vector_store()
+    def _load_vector_stores(self, persist: bool = True) -> None:
+        """
+        加载向量存储
 
-        # 加载实体向量库
+        Args:
+            persist: 是否把迁移、补建的向量写回磁盘（只读加载时只保留在内存中）
+        """
+        # 加载全局向量库（基础库 + 增量）
+        self._load_global_vector_store(persist)
+
+        # 加载实体内容索引
+        if EntityChunkIndex.exists(self.entity_index_path):
+            self.entity_index.load(self.entity_index_path)
+        else:
+            self._migrate_entity_vector_stores(persist)
+
+        # 为缺少向量内容的实体补建索引
+        missing = [node for node in self.graph.nodes() if node not in self.entity_index]
+        for node in missing:
+            print(f"实体'{node}'的向量内容不存在，正在生成...")
+            content = self.load_entity(node)
+            if content:
+                self._create_entity_vector_store(node, content)
+        if missing and persist:
+            self.entity_index.save(self.entity_index_path)
+
+    def _reindex_modified_entities(self) -> None:
+        """按最新的实体内容更新修改过的实体在内容索引中的文档（只更新内存）"""
+        updated = 0
+        for entity_id in self.modified_entities:
+            if entity_id in self.graph.nodes():
+                content = self.load_entity(entity_id)
+                if content:
+                    self._create_entity_vector_store(entity_id, content)
+                    updated += 1
+        if updated:
+            print(f"已更新 {updated} 个实体的向量内容")
+
+    def _migrate_entity_vector_stores(self, persist: bool = True) -> None:
+        """将旧版每个实体一个目录的向量库合并到实体内容索引（直接复用已有向量）"""
+        migrated = 0
         for node in self.graph.nodes():
             store_path = os.path.join(self.vector_path, self._encode_filename(node))
-            if os.path.exists(store_path):
-                try:
-                    vector_store = FAISS.load_local(
-                        store_path,
-                        EmbeddingModel.get_instance(),
-                        allow_dangerous_deserialization=True,
-                    )
-                    self.vector_stores[node] = vector_store
-                except Exception as e:
-                    print(f"加载实体'{node}'的向量库失败: {str(e)}")
-                    content = self.load_entity(node)
-                    if content:
-                        self._create_entity_vector_store(node, content)
-            else:
-                print(f"实体'{node}'的向量库不存在，正在生成...")
-                content = self.load_entity(node)
-                if content:
-                    self._create_entity_vector_store(node, content)
+            if not os.path.exists(store_path):
+                continue
+            try:
+                vector_store = FAISS.load_local(
+                    store_path,
+                    EmbeddingModel.get_instance(),
+                    allow_dangerous_deserialization=True,
+                )
+                index = vector_store.index
+                embeddings = index.reconstruct_n(0, index.ntotal)
+                docs = [
+                    vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+                    for i in range(index.ntotal)
+                ]
+                self.entity_index.add_embeddings(node, docs, embeddings)
+                migrated += 1
+            except Exception as e:
+                print(f"迁移实体'{node}'的向量库失败: {str(e)}")
+
+        if migrated:
+            print(f"已将 {migrated} 个实体向量库合并为统一索引")
+            if persist:
+                self.entity_index.save(self.entity_index_path)
 
     def _create_community_summary_store(self) -> None:
         """为社区摘要创建向量存储"""
@@ -344,63 +695,188 @@ class GraphStorage:
         self, entity_id: str, content_units: List[Tuple[str, str]]
     ) -> None:
         """
-        为实体创建向量存储
+        更新实体在内容索引中的文档
 
         Args:
             entity_id: 实体ID
             content_units: 内容单元列表
         """
-        store_path = os.path.join(self.vector_path, self._encode_filename(entity_id))
+        self.entity_index.set_entity(entity_id, self._split_content_units(content_units))
 
-        # 构建markdown文本
+    @staticmethod
+    def _split_content_units(content_units: List[Tuple[str, str]]) -> List[Document]:
+        """将内容单元按一级标题分割为文档"""
         markdown_text = ""
         for title, content in content_units:
             markdown_text += f"# {title}\n\n{content}\n\n"
+        return GraphStorage._split_markdown(markdown_text)
 
-        # 分割文档
+    @staticmethod
+    def _split_markdown(markdown_text: str) -> List[Document]:
+        """按一级标题分割 markdown 文本"""
+        if not markdown_text.strip():
+            return []
         headers_to_split_on = [("#", "Header 1")]
         md_splitter = MarkdownHeaderTextSplitter(
             headers_to_split_on=headers_to_split_on
         )
-        docs = md_splitter.split_text(markdown_text)
-
-        # 创建向量存储
-        vector_store = FAISS.from_documents(
-            documents=docs,
-            embedding=EmbeddingModel.get_instance(),
-            distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
-        )
-
-        # 保存
-        vector_store.save_local(store_path)
-        self.vector_stores[entity_id] = vector_store
+        return md_splitter.split_text(markdown_text)
 
     def _create_global_vector_store(self) -> None:
-        """创建全局向量存储"""
+        """根据完整的全局文档重建全局向量存储"""
         if not os.path.exists(self.global_doc_path):
             return
 
-        store_path = os.path.join(self.vector_path, "global")
-
-        # 读取和分割文档
-        with open(self.global_doc_path, "r", encoding="utf-8") as f:
+        with open(self.global_doc_path, "rb") as f:
             content = f.read()
 
-        headers_to_split_on = [("#", "Header 1")]
-        md_splitter = MarkdownHeaderTextSplitter(
-            headers_to_split_on=headers_to_split_on
+        docs = self._split_markdown(content.decode("utf-8"))
+        self.global_vector_store = (
+            FAISS.from_documents(
+                documents=docs,
+                embedding=EmbeddingModel.get_instance(),
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+            )
+            if docs
+            else None
         )
-        docs = md_splitter.split_text(content)
+        self.global_indexed_bytes = len(content)
+        self._fold_global_deltas()
 
-        # 创建向量存储
-        self.global_vector_store = FAISS.from_documents(
+    def _update_global_vector_store(self, persist: bool = True) -> bool:
+        """
+        把全局文档中尚未向量化的新内容加入全局向量库，并保存为一个增量
+
+        Args:
+            persist: 是否保存增量，只读加载时新内容只加入内存中的向量库
+
+        Returns:
+            bool: 是否有新内容被加入
+        """
+        if not os.path.exists(self.global_doc_path):
+            return False
+
+        with open(self.global_doc_path, "rb") as f:
+            f.seek(self.global_indexed_bytes)
+            new_content = f.read()
+        if not new_content:
+            return False
+
+        start = self.global_indexed_bytes
+        end = start + len(new_content)
+        docs = self._split_markdown(new_content.decode("utf-8"))
+        if not docs:
+            self.global_indexed_bytes = end
+            return False
+
+        delta_store = FAISS.from_documents(
             documents=docs,
             embedding=EmbeddingModel.get_instance(),
             distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
         )
+        if persist:
+            name = f"{int(self.global_deltas[-1]) + 1 if self.global_deltas else 0:06d}"
+            self._save_global_part(
+                delta_store, os.path.join(self.global_delta_path, name), start, end
+            )
+            self.global_deltas.append(name)
+        self.global_indexed_bytes = end
+
+        if self.global_vector_store is None:
+            self.global_vector_store = delta_store
+        else:
+            self.global_vector_store.merge_from(delta_store)
+
+        if persist and len(self.global_deltas) >= GLOBAL_DELTA_MAX_COUNT:
+            self._fold_global_deltas()
+        return True
 
-        # 保存
-        self.global_vector_store.save_local(store_path)
+    def _load_global_vector_store(self, persist: bool = True) -> None:
+        """
+        加载全局向量基础库，按顺序合并增量，再补上全局文档中未向量化的部分
+
+        Args:
+            persist: 是否写回补全的元数据、新增量并清理无效增量
+        """
+        self.global_vector_store = None
+        self.global_indexed_bytes = 0
+        self.global_deltas = []
+
+        if os.path.exists(self.global_store_path):
+            self.global_vector_store = self._load_faiss(self.global_store_path)
+            meta = self._read_global_meta(self.global_store_path)
+            if meta is not None:
+                self.global_indexed_bytes = meta["end"]
+            elif os.path.exists(self.global_doc_path):
+                # 旧版基础库没有记录位置，它总是由完整的全局文档生成
+                self.global_indexed_bytes = os.path.getsize(self.global_doc_path)
+                if persist:
+                    meta_file = os.path.join(self.global_store_path, "meta.json")
+                    with open(meta_file, "w", encoding="utf-8") as f:
+                        json.dump({"start": 0, "end": self.global_indexed_bytes}, f)
+
+        if os.path.isdir(self.global_delta_path):
+            for name in sorted(os.listdir(self.global_delta_path)):
+                delta_path = os.path.join(self.global_delta_path, name)
+                meta = self._read_global_meta(delta_path)
+                if meta is None or meta["start"] != self.global_indexed_bytes:
+                    # 未写完的、或已经合并进基础库的增量
+                    if persist:
+                        shutil.rmtree(delta_path, ignore_errors=True)
+                    continue
+                delta_store = self._load_faiss(delta_path)
+                if self.global_vector_store is None:
+                    self.global_vector_store = delta_store
+                else:
+                    self.global_vector_store.merge_from(delta_store)
+                self.global_indexed_bytes = meta["end"]
+                self.global_deltas.append(name)
+
+        self._update_global_vector_store(persist)
+
+    def _fold_global_deltas(self) -> None:
+        """把内存中的全局向量库保存为新的基础库，并删除已合并的增量"""
+        if self.global_vector_store is not None:
+            self._save_global_part(
+                self.global_vector_store,
+                self.global_store_path,
+                0,
+                self.global_indexed_bytes,
+            )
+        if os.path.isdir(self.global_delta_path):
+            shutil.rmtree(self.global_delta_path)
+        self.global_deltas = []
+
+    @staticmethod
+    def _save_global_part(store: FAISS, path: str, start: int, end: int) -> None:
+        """保存全局向量库的一部分，并记录其对应的全局文档字节范围"""
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        store.save_local(tmp_path)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"start": start, "end": end}, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+
+    @staticmethod
+    def _read_global_meta(path: str) -> Optional[Dict[str, int]]:
+        """读取全局向量库部分的字节范围，不存在时返回 None"""
+        meta_file = os.path.join(path, "meta.json")
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _load_faiss(path: str) -> FAISS:
+        """加载本地 FAISS 向量库"""
+        return FAISS.load_local(
+            path,
+            EmbeddingModel.get_instance(),
+            allow_dangerous_deserialization=True,
+        )
 
     def _update_global_document(self, content_units: List[Tuple[str, str]]) -> None:
         """
@@ -409,16 +885,18 @@ class GraphStorage:
         Args:
             content_units: 新的内容单元列表
         """
-        new_content = set()
+        # 相同的内容块（如多个实体共享的评论簇）只写入一次
+        new_entries = []
         for title, content in content_units:
-            new_content.add(f"# {title}\n\n{content}\n\n")
+            title, content = title.strip(), content.strip()
+            unit_hash = chunk_hash(title, content)
+            if unit_hash not in self.global_chunks:
+                self.global_chunks.add(unit_hash)
+                new_entries.append(f"# {title}\n\n{content}\n\n")
 
-        new_entries = new_content - self.global_content
         if new_entries:
             with open(self.global_doc_path, "a", encoding="utf-8") as f:
-                for entry in new_entries:
-                    f.write(entry)
-            self.global_content.update(new_entries)
+                f.writelines(new_entries)
 
     @staticmethod
     def _encode_filename(filename: str) -> str:
@@ -447,15 +925,21 @@ class GraphStorage:
             self.save()
 
             # 清空内存中的向量存储引用
-            self.vector_stores.clear()
+            self.entity_index = EntityChunkIndex()
             self.global_vector_store = None
+            self.global_indexed_bytes = 0
+            self.global_deltas = []
             self.community_vector_store = None
 
             # 清空其他内存缓存
             self.entity_embeddings.clear()
-            self.global_content.clear()
+            self.relation_embeddings.clear()
+            self.global_chunks.clear()
             self.modified_entities.clear()
             self.communities.clear()
+            self.entity_store.close()
+            self._entity_cache.clear()
+            self.journal.close()
 
         except Exception as e:
             print(f"清理资源时发生错误: {str(e)}")
@@ -468,44 +952,42 @@ class GraphStorage:
             entity_id: 实体ID
         """
         try:
-            # 从修改追踪中移除
-            self.modified_entities.discard(entity_id)
+            self._log("remove_entity", entity_id=entity_id)
 
             # 删除实体文档
-            file_path = os.path.join(self.entity_path, f"{entity_id}.md")
-            if os.path.exists(file_path):
-                os.remove(file_path)
-
-            # 删除向量存储
+            self.entity_store.remove(entity_id)
             store_path = os.path.join(
                 self.vector_path, self._encode_filename(entity_id)
             )
             if os.path.exists(store_path):
-                shutil.rmtree(store_path)  # 直接删除向量库文件夹
-                if entity_id in self.vector_stores:
-                    del self.vector_stores[entity_id]  # 从内存中移除引用
-
-            # 删除实体嵌入
-            if entity_id in self.entity_embeddings:
-                del self.entity_embeddings[entity_id]
-
-            # 从图中移除节点（这会自动移除相关的边）
-            if entity_id in self.graph:
-                self.graph.remove_node(entity_id)
-
-            # 更新别名
-            if entity_id in self.entity_aliases:
-                aliases = self.entity_aliases[entity_id]
-                for alias in aliases:
-                    if alias in self.alias_to_main_id:
-                        del self.alias_to_main_id[alias]
-                del self.entity_aliases[entity_id]
+                shutil.rmtree(store_path)  # 旧版的单实体向量库
 
+            self._forget_entity(entity_id)
             print(f"成功删除实体 '{entity_id}' 及其相关数据")
 
         except Exception as e:
             print(f"删除实体 '{entity_id}' 时发生错误: {str(e)}")
 
+    def _forget_entity(self, entity_id: str) -> None:
+        """从内存中的图、嵌入、向量内容和别名中删除实体"""
+        # 从修改追踪中移除
+        self.modified_entities.discard(entity_id)
+        self._invalidate_entity_cache(entity_id)
+
+        # 删除向量内容
+        self.entity_index.remove_entity(entity_id)
+
+        # 删除实体嵌入
+        if entity_id in self.entity_embeddings:
+            del self.entity_embeddings[entity_id]
+
+        # 从图中移除节点（这会自动移除相关的边）
+        if entity_id in self.graph:
+            self.graph.remove_node(entity_id)
+
+        # 删除别名集合（已被合并的实体不是主实体，别名保留在新的主实体下）
+        self.aliases.remove(entity_id)
+
     def __enter__(self):
         """上下文管理器入口"""
         return self
@@ -0,0 +1,591 @@
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+from collections.abc import Sequence
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores.faiss import FAISS
+
+from graph_storage import GraphStorage, knowledge_base_lock
+from graph_format import pack_graph, unpack_graph, pack_strings
+from alias_index import AliasIndex
+from embedding_model import EmbeddingModel
+from config import EMBEDDING_MODEL_NAME, KB_KEEP_VERSIONS
+
+BUNDLE_DIR = "bundles"  # 知识库目录下存放各版本服务包的子目录
+CURRENT_FILE = "CURRENT"  # 记录当前发布版本号的文件
+BUNDLE_MAGIC = b"KBBUNDLE"
+BUNDLE_VERSION = 1
+ALIGNMENT = 64  # 各数据段按 64 字节对齐，便于直接内存映射
+
+
+def write_bundle(
+    path: str, sections: Dict[str, np.ndarray], meta: Dict[str, Any]
+) -> None:
+    """
+    写入服务包文件
+
+    文件结构：魔数 + 头部长度 + JSON头部（各数据段的位置、类型和形状）+ 对齐的原始数组数据。
+    先写临时文件再重命名，正在使用旧服务包的进程不受影响。
+
+    Args:
+        path: 输出文件路径
+        sections: 数据段名 -> 数组
+        meta: 附加信息
+    """
+    layout = {}
+    offset = 0
+    for name, array in sections.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[name] = {
+            "offset": offset,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+        offset += array.nbytes
+
+    header = json.dumps(
+        {"version": BUNDLE_VERSION, "meta": meta, "sections": layout},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    data_start = -(-(len(BUNDLE_MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in sections.items():
+            f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class BundleFile:
+    """内存映射的服务包文件，数据段以只读数组视图的形式访问（不复制）"""
+
+    def __init__(self, path: str):
+        """
+        打开服务包
+
+        Args:
+            path: 服务包文件路径
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                raise ValueError(f"不是有效的服务包文件: {path}")
+            (header_size,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_size).decode("utf-8"))
+        if header["version"] != BUNDLE_VERSION:
+            raise ValueError(f"不支持的服务包版本: {header['version']}")
+
+        self.meta: Dict[str, Any] = header["meta"]
+        self._sections: Dict[str, Dict[str, Any]] = header["sections"]
+        self._data_start = (
+            -(-(len(BUNDLE_MAGIC) + 8 + header_size) // ALIGNMENT) * ALIGNMENT
+        )
+        self._raw = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        section = self._sections[name]
+        dtype = np.dtype(section["dtype"])
+        shape = tuple(section["shape"])
+        start = self._data_start + section["offset"]
+        size = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        return self._raw[start : start + size].view(dtype).reshape(shape)
+
+    def group(self, prefix: str) -> Dict[str, np.ndarray]:
+        """获取某一组数据段（去掉前缀后的名字 -> 数组）"""
+        return {
+            name[len(prefix) :]: self[name]
+            for name in self._sections
+            if name.startswith(prefix)
+        }
+
+    def strings(self, name: str) -> "LazyStrings":
+        """按需解码的字符串列表数据段"""
+        return LazyStrings(self[f"{name}_blob"], self[f"{name}_offsets"])
+
+    def close(self) -> None:
+        """释放内存映射"""
+        self._raw = None
+
+
+class LazyStrings(Sequence):
+    """字节块 + 偏移数组形式的字符串列表，访问时才解码"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+
+class BundleVectorStore:
+    """
+    服务包中的只读向量库
+
+    向量矩阵直接使用内存映射，检索时做一次矩阵-向量内积，
+    与 MAX_INNER_PRODUCT 的 FAISS 平坦索引结果一致。
+    提供检索用到的 similarity_search_with_score 接口。
+    """
+
+    def __init__(
+        self, vectors: np.ndarray, texts: LazyStrings, metadatas: LazyStrings
+    ):
+        """
+        初始化向量库
+
+        Args:
+            vectors: (文档数, 维度) 的向量矩阵
+            texts: 文档正文
+            metadatas: 文档元数据（JSON字符串）
+        """
+        self.vectors = vectors
+        self.texts = texts
+        self.metadatas = metadatas
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def get_document(self, position: int) -> Document:
+        """获取指定位置的文档"""
+        return Document(
+            page_content=self.texts[position],
+            metadata=json.loads(self.metadatas[position]),
+        )
+
+    def search_by_vector(
+        self, embedding: np.ndarray, k: int, positions: Optional[np.ndarray] = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        按向量检索
+
+        Args:
+            embedding: 查询向量
+            k: 返回结果数量
+            positions: 只在这些位置的文档中检索，None 表示全部
+
+        Returns:
+            List[Tuple[Document, float]]: 文档和内积分数
+        """
+        vectors = self.vectors if positions is None else self.vectors[positions]
+        k = min(k, len(vectors))
+        if k <= 0:
+            return []
+        scores = vectors @ embedding.astype(vectors.dtype, copy=False)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        candidates = top if positions is None else positions[top]
+        return [
+            (self.get_document(int(position)), float(score))
+            for position, score in zip(candidates, scores[top])
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        """按查询文本检索"""
+        return self.search_by_vector(_embed_query(query), k)
+
+
+class BundleEntityIndex:
+    """服务包中的只读实体内容索引，实体对内容块的引用以 CSR 数组保存"""
+
+    def __init__(
+        self,
+        store: BundleVectorStore,
+        entity_ids: LazyStrings,
+        ref_offsets: np.ndarray,
+        ref_positions: np.ndarray,
+    ):
+        """
+        初始化索引
+
+        Args:
+            store: 去重后的内容块向量库
+            entity_ids: 行号 -> 实体ID
+            ref_offsets: 每个实体的引用在 ref_positions 中的起止位置
+            ref_positions: 内容块在向量库中的位置
+        """
+        self.store = store
+        self._rows = {entity_ids[row]: row for row in range(len(entity_ids))}
+        self._ref_offsets = ref_offsets
+        self._ref_positions = ref_positions
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def entity_ids(self) -> List[str]:
+        """所有拥有内容的实体ID"""
+        return list(self._rows)
+
+    def positions(self, entity_id: str) -> np.ndarray:
+        """实体引用的内容块位置"""
+        row = self._rows.get(entity_id)
+        if row is None:
+            return np.zeros(0, dtype=np.int64)
+        start, end = int(self._ref_offsets[row]), int(self._ref_offsets[row + 1])
+        return np.asarray(self._ref_positions[start:end], dtype=np.int64)
+
+    def documents(self, entity_id: str) -> List[Document]:
+        """实体的全部内容文档"""
+        return [
+            self.store.get_document(int(position))
+            for position in self.positions(entity_id)
+        ]
+
+    def search(
+        self, query: str, entity_id: str, k: int = 3
+    ) -> List[Tuple[Document, float]]:
+        """在指定实体的文档中检索"""
+        positions = self.positions(entity_id)
+        if not len(positions):
+            return []
+        return self.store.search_by_vector(_embed_query(query), k, positions)
+
+    def chunk_count(self) -> int:
+        """索引中（去重后）的内容块数量"""
+        return len(self.store)
+
+
+class BundleEntityStore:
+    """由实体内容索引还原实体内容单元的只读实体存储"""
+
+    def __init__(self):
+        self.index: Optional[BundleEntityIndex] = None
+
+    def load(self, entity_id: str) -> List[Tuple[str, str]]:
+        """加载实体内容单元"""
+        if self.index is None:
+            return []
+        return [
+            (doc.metadata.get("Header 1", ""), doc.page_content)
+            for doc in self.index.documents(entity_id)
+        ]
+
+    def entity_ids(self) -> List[str]:
+        """获取所有存有内容的实体ID"""
+        return [] if self.index is None else self.index.entity_ids()
+
+    def search(self, keyword: str, limit: int = 10) -> List[Tuple[str, str, str]]:
+        """
+        关键词检索（逐个实体扫描）
+
+        Returns:
+            List[Tuple[str, str, str]]: (实体ID, 标题, 内容) 列表
+        """
+        results = []
+        for entity_id in self.entity_ids():
+            for title, content in self.load(entity_id):
+                if keyword in title or keyword in content:
+                    results.append((entity_id, title, content))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def close(self) -> None:
+        pass
+
+
+class BundleStorage(GraphStorage):
+    """
+    只读的图谱存储，全部数据来自服务包
+
+    加载时只做内存映射和图结构还原，不读取 FAISS 文件、不调用嵌入模型和LLM，
+    也不会补建缺失的向量库。所有修改操作都会抛出异常。
+    """
+
+    def __init__(self, bundle_file: str):
+        """
+        初始化只读存储
+
+        Args:
+            bundle_file: 服务包文件路径
+        """
+        self.bundle_file = os.path.abspath(bundle_file)
+        super().__init__(
+            os.path.dirname(self.bundle_file), entity_store=BundleEntityStore()
+        )
+        self.bundle: Optional[BundleFile] = None
+
+    def load(self) -> None:
+        """内存映射服务包并还原图谱"""
+        start = time.perf_counter()
+        bundle = BundleFile(self.bundle_file)
+        model_name = bundle.meta.get("embedding_model")
+        if model_name and model_name != EMBEDDING_MODEL_NAME:
+            print(
+                f"警告：服务包使用嵌入模型 {model_name} 构建，当前配置为 {EMBEDDING_MODEL_NAME}"
+            )
+
+        self.graph, entity_aliases, alias_to_main_id = unpack_graph(
+            bundle.group("graph.")
+        )
+        self.aliases = AliasIndex.from_mappings(
+            self.graph.nodes(), entity_aliases, alias_to_main_id
+        )
+        self.entity_embeddings.attach(
+            bundle["embeddings"], list(bundle.strings("embedding_ids"))
+        )
+
+        self.entity_index = BundleEntityIndex(
+            self._vector_store(bundle, "entity_chunks"),
+            bundle.strings("entity_ids"),
+            bundle["entity_ref_offsets"],
+            bundle["entity_ref_positions"],
+        )
+        self.entity_store.index = self.entity_index
+        self.global_vector_store = self._vector_store(bundle, "global")
+        self.community_vector_store = self._vector_store(bundle, "community")
+        self.communities = json.loads(bundle["communities"].tobytes().decode("utf-8"))
+        self.bundle = bundle
+
+        print(
+            f"已加载服务包 {self.bundle_file}（{len(self.graph)} 个实体，"
+            f"{time.perf_counter() - start:.2f} 秒）"
+        )
+
+    @staticmethod
+    def _vector_store(bundle: BundleFile, name: str) -> Optional[BundleVectorStore]:
+        """还原一个向量库，服务包中没有时返回 None"""
+        if f"{name}.vectors" not in bundle:
+            return None
+        return BundleVectorStore(
+            bundle[f"{name}.vectors"],
+            bundle.strings(f"{name}.texts"),
+            bundle.strings(f"{name}.metadatas"),
+        )
+
+    def save(self) -> None:
+        raise RuntimeError("服务包是只读的，请修改知识库后重新构建服务包")
+
+    def commit(self, tag: Optional[str] = None) -> None:
+        raise RuntimeError("服务包是只读的，请修改知识库后重新构建服务包")
+
+    def _log(self, op: str, **args: Any) -> None:
+        # 所有修改操作都先写变更日志，在这里统一拒绝
+        raise RuntimeError("服务包是只读的，请修改知识库后重新构建服务包")
+
+    def cleanup(self) -> None:
+        """释放内存映射"""
+        self.entity_index = None
+        self.entity_store.index = None
+        self.global_vector_store = None
+        self.community_vector_store = None
+        self.entity_embeddings.clear()
+        self.communities = {}
+        if self.bundle is not None:
+            self.bundle.close()
+            self.bundle = None
+
+
+def _embed_query(query: str) -> np.ndarray:
+    """生成查询向量（首次检索时才加载嵌入模型）"""
+    return np.asarray(EmbeddingModel.get_instance().embed_query(query), dtype=np.float32)
+
+
+def _string_sections(name: str, strings: List[str]) -> Dict[str, np.ndarray]:
+    blob, offsets = pack_strings(strings)
+    return {f"{name}_blob": blob, f"{name}_offsets": offsets}
+
+
+def _faiss_sections(
+    store: Optional[FAISS], name: str
+) -> Tuple[Dict[str, np.ndarray], List[str]]:
+    """导出 FAISS 向量库的向量、正文和元数据，同时返回按位置排列的文档ID"""
+    if store is None:
+        return {}, []
+    index = store.index
+    doc_ids = [store.index_to_docstore_id[i] for i in range(index.ntotal)]
+    docs = [store.docstore.search(doc_id) for doc_id in doc_ids]
+    vectors = (
+        index.reconstruct_n(0, index.ntotal)
+        if index.ntotal
+        else np.zeros((0, index.d), dtype=np.float32)
+    )
+    sections = {f"{name}.vectors": np.asarray(vectors, dtype=np.float32)}
+    sections.update(_string_sections(f"{name}.texts", [d.page_content for d in docs]))
+    sections.update(
+        _string_sections(
+            f"{name}.metadatas",
+            [json.dumps(d.metadata, ensure_ascii=False) for d in docs],
+        )
+    )
+    return sections, doc_ids
+
+
+def build_bundle(base_path: str, output: str, checkpoint: bool = False) -> str:
+    """
+    把构建完成的知识库打包为服务包
+
+    通过 GraphStorage 完整加载一次知识库（重放变更日志、迁移旧版文件、补建缺失的向量），
+    这些工作都在构建阶段完成，服务进程加载服务包时不再需要。
+
+    Args:
+        base_path: 知识库路径
+        output: 输出文件路径
+        checkpoint: 是否把加载结果写回知识库，只有持有知识库锁时才应设为 True
+
+    Returns:
+        str: 服务包文件路径
+    """
+    storage = GraphStorage(base_path)
+    if not (
+        os.path.exists(storage.graph_file) or os.path.exists(storage.legacy_graph_file)
+    ):
+        raise FileNotFoundError(f"未找到图谱文件: {base_path}")
+    storage.load(checkpoint)
+
+    sections: Dict[str, np.ndarray] = {}
+    for name, array in pack_graph(
+        storage.graph, storage.entity_aliases, storage.alias_to_main_id
+    ).items():
+        sections[f"graph.{name}"] = array
+
+    entity_ids, matrix = storage.entity_embeddings.matrix()
+    sections["embeddings"] = np.ascontiguousarray(matrix)
+    sections.update(_string_sections("embedding_ids", entity_ids))
+
+    # 实体内容索引：内容块向量 + 实体对内容块位置的引用（CSR）
+    chunk_sections, chunk_ids = _faiss_sections(
+        storage.entity_index.store, "entity_chunks"
+    )
+    sections.update(chunk_sections)
+    chunk_positions = {chunk_id: i for i, chunk_id in enumerate(chunk_ids)}
+    ref_entities = list(storage.entity_index.entity_chunks)
+    refs = [
+        [chunk_positions[h] for h in storage.entity_index.entity_chunks[entity_id]]
+        for entity_id in ref_entities
+    ]
+    ref_offsets = np.zeros(len(refs) + 1, dtype=np.int64)
+    if refs:
+        ref_offsets[1:] = np.cumsum([len(r) for r in refs])
+    sections.update(_string_sections("entity_ids", ref_entities))
+    sections["entity_ref_offsets"] = ref_offsets
+    sections["entity_ref_positions"] = np.array(
+        [p for r in refs for p in r], dtype=np.int32
+    )
+
+    sections.update(_faiss_sections(storage.global_vector_store, "global")[0])
+    sections.update(_faiss_sections(storage.community_vector_store, "community")[0])
+    sections["communities"] = np.frombuffer(
+        json.dumps(storage.communities, ensure_ascii=False).encode("utf-8"),
+        dtype=np.uint8,
+    )
+
+    meta = {
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "embedding_model": EMBEDDING_MODEL_NAME,
+        "entities": storage.get_entity_count(),
+        "relationships": storage.get_relationship_count(),
+        "chunks": len(chunk_ids),
+    }
+    write_bundle(output, sections, meta)
+    storage.entity_store.close()
+    storage.journal.close()
+
+    print(
+        f"服务包已生成: {output}（{meta['entities']} 个实体，{meta['relationships']} 条关系，"
+        f"{meta['chunks']} 个内容块，{os.path.getsize(output) / 1024 / 1024:.1f} MB）"
+    )
+    return output
+
+
+def bundle_path(base_path: str, version: str) -> str:
+    """指定版本服务包的路径"""
+    return os.path.join(base_path, BUNDLE_DIR, f"{version}.bundle")
+
+
+def current_version(base_path: str) -> Optional[str]:
+    """读取知识库当前发布的服务包版本，未发布过时返回 None"""
+    current_file = os.path.join(base_path, BUNDLE_DIR, CURRENT_FILE)
+    try:
+        with open(current_file, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_bundle(base_path: str, keep: int = KB_KEEP_VERSIONS) -> str:
+    """
+    把知识库打包为一个新版本的服务包并发布
+
+    新版本写完后才原子地更新 CURRENT，服务进程只会看到完整的版本；
+    只保留最近的 keep 个版本，正在使用旧版本的检索不受删除影响（内存映射仍然有效）。
+
+    Args:
+        base_path: 知识库路径
+        keep: 保留的版本数量
+
+    Returns:
+        str: 新版本号
+    """
+    bundle_dir = os.path.join(base_path, BUNDLE_DIR)
+    os.makedirs(bundle_dir, exist_ok=True)
+    with knowledge_base_lock(base_path):
+        versions = _list_versions(base_path)
+        version = f"{int(versions[-1]) + 1 if versions else 1:06d}"
+        build_bundle(base_path, bundle_path(base_path, version), checkpoint=True)
+
+        current_file = os.path.join(bundle_dir, CURRENT_FILE)
+        with open(current_file + ".tmp", "w", encoding="utf-8") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(current_file + ".tmp", current_file)
+        print(f"已发布服务包版本 {version}: {base_path}")
+
+        for old_version in _list_versions(base_path)[: -max(1, keep)]:
+            os.remove(bundle_path(base_path, old_version))
+    return version
+
+
+def _list_versions(base_path: str) -> List[str]:
+    """按版本号排序的已有服务包版本"""
+    bundle_dir = os.path.join(base_path, BUNDLE_DIR)
+    if not os.path.isdir(bundle_dir):
+        return []
+    return sorted(
+        name[: -len(".bundle")]
+        for name in os.listdir(bundle_dir)
+        if name.endswith(".bundle") and name[: -len(".bundle")].isdigit()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="把知识库打包为只读服务包")
+    parser.add_argument("knowledge_base", help="知识库路径，如 bilibili_knowledge_base")
+    parser.add_argument("-o", "--output", help="只生成服务包文件到指定路径，不发布新版本")
+    args = parser.parse_args()
+
+    try:
+        if args.output:
+            build_bundle(args.knowledge_base, args.output)
+        else:
+            publish_bundle(args.knowledge_base)
+    except Exception as e:
+        print(f"生成服务包失败: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import os
+import sys
+import shutil
+import argparse
+from typing import Dict, List, Set
+import numpy as np
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+from graph_storage import GraphStorage, knowledge_base_lock
+from entity_index import EntityChunkIndex
+from entity_store import chunk_hash, parse_content_units
+from embedding_model import EmbeddingModel
+
+# vectors/ 下当前版本使用的目录，其余目录是旧版的单实体向量库
+KNOWN_VECTOR_DIRS = {"entity_chunks", "global", "global_deltas", "community_summaries"}
+
+
+def compact_knowledge_base(base_path: str) -> Dict[str, int]:
+    """
+    压缩知识库：删除孤立的实体内容和向量、旧版向量库和临时文件，
+    重写全局文档去掉不再被任何实体引用的内容块
+
+    压缩期间持有知识库锁，与构建、发布互斥；服务进程使用的是已发布的服务包快照，不受影响。
+
+    Args:
+        base_path: 知识库路径
+
+    Returns:
+        Dict[str, int]: 各项清理的数量和回收的字节数
+    """
+    if not os.path.isdir(base_path):
+        raise FileNotFoundError(f"知识库不存在: {base_path}")
+
+    with knowledge_base_lock(base_path, blocking=False):
+        size_before = _dir_size(base_path)
+        storage = GraphStorage(base_path)
+        stats = {"temp_files": _remove_temp_files(storage)}
+
+        # 完整加载一次（重放变更日志并做检查点），保证磁盘上的状态与图谱一致
+        storage.load(checkpoint=True)
+
+        stats["orphan_entities"] = _remove_orphan_entities(storage)
+        stats["legacy_vector_stores"] = _remove_legacy_vector_stores(storage)
+        stats["unused_relation_types"] = _remove_unused_relation_types(storage)
+        stats["dead_global_chunks"] = _rewrite_global_document(storage)
+        storage.save()
+        storage.entity_store.compact()
+        storage.entity_store.close()
+        storage.journal.close()
+
+        stats["bytes_reclaimed"] = size_before - _dir_size(base_path)
+
+    print(f"\n知识库压缩完成: {base_path}")
+    print(f"- 临时文件: {stats['temp_files']}")
+    print(f"- 孤立实体: {stats['orphan_entities']}")
+    print(f"- 旧版向量库: {stats['legacy_vector_stores']}")
+    print(f"- 不再使用的关系类型嵌入: {stats['unused_relation_types']}")
+    print(f"- 全局文档中的无效内容块: {stats['dead_global_chunks']}")
+    print(f"- 回收空间: {stats['bytes_reclaimed'] / 1024 / 1024:.2f} MB")
+    return stats
+
+
+def _remove_orphan_entities(storage: GraphStorage) -> int:
+    """删除图谱中已不存在的实体（如被合并掉的实体）残留的内容、向量和嵌入"""
+    live = set(storage.graph.nodes())
+    orphans: Set[str] = set(storage.entity_store.entity_ids())
+    orphans.update(storage.entity_index.entity_chunks)
+    orphans.update(storage.entity_embeddings)
+    orphans -= live
+    for entity_id in sorted(orphans):
+        storage.remove_entity(entity_id)
+    return len(orphans)
+
+
+def _remove_unused_relation_types(storage: GraphStorage) -> int:
+    """删除关系词表中图谱里已没有任何边使用的关系类型"""
+    used = {data for _, _, data in storage.graph.edges(data="type")}
+    unused = [t for t in storage.relation_embeddings if t not in used]
+    for relation_type in unused:
+        del storage.relation_embeddings[relation_type]
+    return len(unused)
+
+
+def _remove_legacy_vector_stores(storage: GraphStorage) -> int:
+    """删除已合并进实体内容索引的旧版单实体向量库目录"""
+    if not EntityChunkIndex.exists(storage.entity_index_path):
+        return 0  # 尚未迁移，旧版目录仍然是唯一的数据来源
+    if not os.path.isdir(storage.vector_path):
+        return 0
+    removed = 0
+    for name in os.listdir(storage.vector_path):
+        path = os.path.join(storage.vector_path, name)
+        if name not in KNOWN_VECTOR_DIRS and os.path.isdir(path):
+            shutil.rmtree(path)
+            removed += 1
+    return removed
+
+
+def _remove_temp_files(storage: GraphStorage) -> int:
+    """
+    删除中断的写入留下的临时文件和目录
+
+    只清理存储层和本模块在固定位置使用的临时名称；bundles/ 下的服务包
+    由不持有知识库锁的 build_bundle 写入，不在清理范围内。
+    """
+    paths = [
+        storage.graph_file + ".tmp",
+        storage.embeddings_file + ".tmp.npy",
+        storage.embedding_ids_file + ".tmp",
+        storage.relation_embeddings_file + ".tmp.npy",
+        storage.relation_embedding_ids_file + ".tmp",
+        storage.global_store_path + ".tmp",
+        storage.global_store_path + ".compact",
+    ]
+    paths.extend(
+        os.path.join(storage.entity_index_path, name + ".tmp")
+        for name in (
+            EntityChunkIndex.INDEX_FILE,
+            EntityChunkIndex.DOCSTORE_FILE,
+            EntityChunkIndex.REFS_FILE,
+        )
+    )
+    if os.path.isdir(storage.global_delta_path):
+        paths.extend(
+            os.path.join(storage.global_delta_path, name)
+            for name in os.listdir(storage.global_delta_path)
+            if name.endswith(".tmp")
+        )
+
+    removed = 0
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        else:
+            continue
+        removed += 1
+    return removed
+
+
+def _rewrite_global_document(storage: GraphStorage) -> int:
+    """
+    重写全局文档，只保留仍被实体引用的内容块，并据此重建全局向量库（复用已有向量）
+
+    Returns:
+        int: 删除的内容块数量
+    """
+    if not os.path.exists(storage.global_doc_path):
+        return 0
+
+    live_chunks: Set[str] = set()
+    for entity_id in storage.graph.nodes():
+        for title, content in storage.load_entity(entity_id):
+            live_chunks.add(chunk_hash(title.strip(), content.strip()))
+
+    with open(storage.global_doc_path, "r", encoding="utf-8") as f:
+        content_units = parse_content_units(f)
+    kept_chunks: Set[str] = set()
+    kept_entries: List[str] = []
+    for title, content in content_units:
+        unit_hash = chunk_hash(title, content)
+        if unit_hash in live_chunks and unit_hash not in kept_chunks:
+            kept_chunks.add(unit_hash)
+            kept_entries.append(f"# {title}\n\n{content}\n\n")
+
+    removed = len(content_units) - len(kept_entries)
+    if removed == 0:
+        return 0
+
+    text = "".join(kept_entries)
+    store = _build_global_store(storage, text)
+    new_size = len(text.encode("utf-8"))
+
+    # 新文档和新向量库都准备好后再替换；中途中断时基础库缺失，下次加载会按全局文档完整重建
+    tmp_doc = storage.global_doc_path + ".tmp"
+    with open(tmp_doc, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    compact_store_path = storage.global_store_path + ".compact"
+    if store is not None:
+        storage._save_global_part(store, compact_store_path, 0, new_size)
+    for path in (storage.global_store_path, storage.global_delta_path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+    os.replace(tmp_doc, storage.global_doc_path)
+    if store is not None:
+        os.rename(compact_store_path, storage.global_store_path)
+
+    storage.global_vector_store = store
+    storage.global_indexed_bytes = new_size
+    storage.global_deltas = []
+    storage.global_chunks = kept_chunks
+    return removed
+
+
+def _build_global_store(storage: GraphStorage, text: str):
+    """为重写后的全局文档建立向量库，已有的向量直接复用，只向量化缺失的内容块"""
+    docs = storage._split_markdown(text)
+    if not docs:
+        return None
+
+    known: Dict[str, np.ndarray] = {}
+    old_store = storage.global_vector_store
+    if old_store is not None and old_store.index.ntotal:
+        vectors = old_store.index.reconstruct_n(0, old_store.index.ntotal)
+        for position, doc_id in old_store.index_to_docstore_id.items():
+            doc = old_store.docstore.search(doc_id)
+            known[EntityChunkIndex.content_hash(doc)] = vectors[position]
+
+    doc_hashes = [EntityChunkIndex.content_hash(doc) for doc in docs]
+    missing = [doc.page_content for doc, h in zip(docs, doc_hashes) if h not in known]
+    computed = iter(
+        EmbeddingModel.get_instance().embed_many(missing) if missing else []
+    )
+    embeddings = [known[h] if h in known else next(computed) for h in doc_hashes]
+
+    return FAISS.from_embeddings(
+        list(zip([doc.page_content for doc in docs], embeddings)),
+        EmbeddingModel.get_instance(),
+        metadatas=[doc.metadata for doc in docs],
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
+
+def _dir_size(path: str) -> int:
+    """目录下所有文件的总字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩知识库，回收无用数据占用的空间")
+    parser.add_argument("knowledge_base", help="知识库路径，如 bilibili_knowledge_base")
+    args = parser.parse_args()
+
+    try:
+        compact_knowledge_base(args.knowledge_base)
+    except Exception as e:
+        print(f"压缩知识库失败: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
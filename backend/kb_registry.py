@@ -0,0 +1,138 @@
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from knowledgeGraph import KnowledgeGraph
+from kb_bundle import bundle_path, current_version
+from config import KB_WATCH_INTERVAL
+
+
+def warm_up(kg: KnowledgeGraph) -> None:
+    """对知识图谱的每个向量库各跑一次查询"""
+    kg.search_vector_store("预热", k=1)
+    kg.search_communities("预热")
+    for node in kg.storage.graph.nodes():
+        kg.search_vector_store("预热", entity_id=node, k=1)
+        break
+
+
+class KnowledgeBaseRegistry:
+    """
+    进程内的知识库注册表
+
+    同一知识库只加载一次，由所有检索器共享。知识库发布了新的服务包版本后，
+    在后台加载并预热新版本，再原子地替换注册表中的引用：之后开始的检索使用新版本，
+    正在进行的检索仍持有旧版本直到结束，整个过程不需要重启服务。
+    """
+
+    # 知识库路径 -> (版本号, 知识图谱)，版本号为 None 表示直接从知识库目录加载
+    _graphs: Dict[str, Tuple[Optional[str], KnowledgeGraph]] = {}
+    _load_locks: Dict[str, threading.Lock] = {}
+    _failed_versions: Dict[str, str] = {}  # 加载失败的版本，不再重试
+    _lock = threading.Lock()
+    _watcher: Optional[threading.Thread] = None
+    _stop_event = threading.Event()
+
+    @classmethod
+    def get(cls, knowledge_base_path: str) -> KnowledgeGraph:
+        """获取知识库当前版本的图谱（首次访问时加载）"""
+        key = os.path.abspath(knowledge_base_path)
+        entry = cls._graphs.get(key)
+        if entry is not None:
+            return entry[1]
+
+        # 按路径加锁，预热线程和请求同时加载同一知识库时只加载一次
+        with cls._path_lock(key):
+            if key not in cls._graphs:
+                cls._graphs[key] = cls._load(
+                    knowledge_base_path, current_version(knowledge_base_path)
+                )
+            return cls._graphs[key][1]
+
+    @classmethod
+    def version(cls, knowledge_base_path: str) -> Optional[str]:
+        """知识库已加载的版本号"""
+        entry = cls._graphs.get(os.path.abspath(knowledge_base_path))
+        return entry[0] if entry is not None else None
+
+    @classmethod
+    def refresh(cls, knowledge_base_path: str) -> bool:
+        """
+        检查知识库是否发布了新版本，有则加载、预热并替换
+
+        Args:
+            knowledge_base_path: 知识库路径
+
+        Returns:
+            bool: 是否切换到了新版本
+        """
+        key = os.path.abspath(knowledge_base_path)
+        with cls._path_lock(key):
+            entry = cls._graphs.get(key)
+            version = current_version(knowledge_base_path)
+            if entry is None or version is None or version == entry[0]:
+                return False
+            if cls._failed_versions.get(key) == version:
+                return False
+
+            print(f"检测到知识库新版本 {version}，正在后台加载: {knowledge_base_path}")
+            try:
+                loaded = cls._load(knowledge_base_path, version)
+                warm_up(loaded[1])
+            except Exception as e:
+                print(f"加载知识库版本 {version} 失败，继续使用当前版本: {str(e)}")
+                cls._failed_versions[key] = version
+                return False
+
+            # 替换引用即完成切换，旧版本在最后一个使用者结束后被回收
+            cls._graphs[key] = loaded
+            print(f"知识库已切换到版本 {version}: {knowledge_base_path}")
+            return True
+
+    @classmethod
+    def refresh_all(cls) -> None:
+        """检查所有已加载的知识库"""
+        for key in list(cls._graphs):
+            try:
+                cls.refresh(key)
+            except Exception as e:
+                print(f"检查知识库 {key} 的新版本时出错: {str(e)}")
+
+    @classmethod
+    def start_watcher(cls, interval: float = KB_WATCH_INTERVAL) -> None:
+        """启动后台线程，定期检查已加载的知识库是否发布了新版本"""
+        if interval <= 0:
+            return
+        with cls._lock:
+            if cls._watcher is not None and cls._watcher.is_alive():
+                return
+            cls._stop_event.clear()
+            cls._watcher = threading.Thread(
+                target=cls._watch, args=(interval,), name="kb-watcher", daemon=True
+            )
+            cls._watcher.start()
+
+    @classmethod
+    def stop_watcher(cls) -> None:
+        """停止后台检查线程"""
+        cls._stop_event.set()
+
+    @classmethod
+    def _watch(cls, interval: float) -> None:
+        while not cls._stop_event.wait(interval):
+            cls.refresh_all()
+
+    @classmethod
+    def _path_lock(cls, key: str) -> threading.Lock:
+        with cls._lock:
+            return cls._load_locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _load(
+        knowledge_base_path: str, version: Optional[str]
+    ) -> Tuple[Optional[str], KnowledgeGraph]:
+        """加载指定版本，未发布过服务包时直接加载知识库目录"""
+        if version is not None:
+            path = bundle_path(knowledge_base_path, version)
+            if os.path.exists(path):
+                return version, KnowledgeGraph.from_bundle(path)
+        return None, KnowledgeGraph(knowledge_base_path)
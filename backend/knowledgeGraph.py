@@ -7,40 +7,64 @@ from graph_storage import GraphStorage
 from graph_entity import GraphEntity
 from graph_search import GraphSearch
 from graph_visualization import GraphVisualization
-from config import API_KEY, API_BASE_URL
+from kb_bundle import BundleStorage
 
 
 class KnowledgeGraph:
     """知识图谱主类，整合所有功能组件"""
 
-    def __init__(self, base_path: str):
+    def __init__(
+        self,
+        base_path: str,
+        storage: Optional[GraphStorage] = None,
+        checkpoint: bool = False,
+    ):
         """
         初始化知识图谱
 
         Args:
             base_path: 知识图谱数据的基础路径
+            storage: 可选的已加载存储（如服务包），提供时不再从 base_path 加载
+            checkpoint: 加载后是否做检查点，只有持有知识库锁的写入方才应设为 True
         """
-        # 初始化LLM客户端
-        self.llm_client = OpenAI(api_key=API_KEY, base_url=API_BASE_URL)
-
-        # 初始化各个组件
-        self.storage = GraphStorage(base_path)
-        self.entity = GraphEntity(self.storage, self.llm_client)
+        # 初始化各个组件（LLM客户端在首次需要时才创建）
+        self.storage = storage if storage is not None else GraphStorage(base_path)
+        self.entity = GraphEntity(self.storage)
         self.search = GraphSearch(self.storage, self.entity)
         self.visualization = GraphVisualization(self.storage)
 
+        if storage is not None:
+            return
+
         # 加载现有图谱
         if os.path.exists(base_path):
-            self._load_existing_graph()
+            self._load_existing_graph(checkpoint)
             print(f"成功加载已存在的图谱：{base_path}")
         else:
             self._initialize_new_graph()
             print(f"创建新的图谱：{base_path}")
 
-    def _load_existing_graph(self) -> None:
+    @classmethod
+    def from_bundle(cls, bundle_file: str) -> "KnowledgeGraph":
+        """
+        从服务包加载只读知识图谱（启动时不调用嵌入模型和LLM）
+
+        Args:
+            bundle_file: 服务包文件路径
+        """
+        storage = BundleStorage(bundle_file)
+        storage.load()
+        return cls(storage.base_path, storage=storage)
+
+    @property
+    def llm_client(self) -> OpenAI:
+        """LLM客户端"""
+        return self.entity.llm_client
+
+    def _load_existing_graph(self, checkpoint: bool = False) -> None:
         """加载现有图谱数据"""
         try:
-            self.storage.load()
+            self.storage.load(checkpoint)
         except Exception as e:
             print(f"加载图谱时发生错误: {str(e)}")
             print("初始化新的图谱...")
@@ -61,6 +85,10 @@ class KnowledgeGraph:
         except Exception as e:
             print(f"保存图谱时发生错误: {str(e)}")
 
+    def commit(self, tag: Optional[str] = None) -> None:
+        """提交当前变更到变更日志（比完整保存代价小，崩溃后可恢复）"""
+        self.storage.commit(tag)
+
     # 实体管理方法
     def add_entity(self, entity_id: str, content_units: List[Tuple[str, str]]) -> str:
         """
@@ -75,12 +103,22 @@ class KnowledgeGraph:
         """
         return self.entity.add_entity(entity_id, content_units)
 
+    def add_entities(
+        self, entity_contents: Dict[str, List[Tuple[str, str]]]
+    ) -> Dict[str, str]:
+        """批量添加实体，合并判断并发进行"""
+        return self.entity.add_entities(entity_contents)
+
     def add_relationship(
         self, entity1_id: str, entity2_id: str, relationship_type: str
     ) -> None:
         """添加实体间关系"""
         self.entity.add_relationship(entity1_id, entity2_id, relationship_type)
 
+    def add_relationships(self, relations: List[Tuple[str, str, str]]) -> None:
+        """批量添加实体间关系，关系合并并发进行"""
+        self.entity.add_relationships(relations)
+
     def get_entity_info(self, entity_id: str) -> Optional[Dict]:
         """获取实体信息"""
         return self.entity.get_entity_info(entity_id)
@@ -116,6 +154,12 @@ class KnowledgeGraph:
         """搜索相似关系"""
         return self.search.search_similar_relationships(query, entity_id, k)
 
+    def search_entity_content(
+        self, keyword: str, limit: int = 10
+    ) -> List[Tuple[str, str, str]]:
+        """按关键词检索实体内容"""
+        return self.storage.search_entity_content(keyword, limit)
+
     def search_all_paths(
         self,
         start_entity: str,
@@ -192,8 +236,13 @@ class KnowledgeGraph:
             print(f"生成统计信息时发生错误: {str(e)}")
             return ""
 
+    def close_llm_pool(self) -> None:
+        """关闭大模型判断的线程池，之后再判断时会重新创建"""
+        self.entity.close()
+
     def cleanup(self) -> None:
         """清理资源"""
+        self.entity.close()
         self.storage.cleanup()
 
     def __enter__(self):
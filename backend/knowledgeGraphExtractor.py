@@ -4,6 +4,7 @@ import json
 import re
 from openai import OpenAI
 from knowledgeGraph import KnowledgeGraph
+from graph_storage import knowledge_base_lock
 from config import *
 
 client = OpenAI(api_key=API_KEY, base_url=API_BASE_URL)
@@ -11,8 +12,10 @@ client = OpenAI(api_key=API_KEY, base_url=API_BASE_URL)
 
 class KnowledgeGraphExtractor:
     def __init__(self, knowledge_base_path="./knowledge_base"):
-        # 初始化知识图谱
-        self.kg = KnowledgeGraph(knowledge_base_path)
+        # 知识图谱在 process_data 取得知识库锁之后才加载，
+        # 避免加载之后、加锁之前知识库被压缩等操作修改，再用过期的状态覆盖回去
+        self.knowledge_base_path = knowledge_base_path
+        self.kg = None
 
         # 读取提示词模板
         self.entity_prompt = self.read_prompt("prompt/entity_extraction.txt")
@@ -20,8 +23,19 @@ class KnowledgeGraphExtractor:
 
         # 已处理文件记录
         self.progress_file = os.path.join(knowledge_base_path, "processed_files.txt")
+        self.processed_files = set()
+
+    def load_knowledge_base(self):
+        """加载知识图谱和处理进度（调用方需持有知识库锁）"""
+        self.kg = KnowledgeGraph(self.knowledge_base_path, checkpoint=True)
         self.processed_files = self.load_progress()
 
+        # 变更日志中已提交、但未写入进度文件的数据项
+        for item_id in self.kg.storage.recovered_tags:
+            if item_id not in self.processed_files:
+                self.save_progress(item_id)
+                self.processed_files.add(item_id)
+
     def load_progress(self):
         """加载已处理的文件列表"""
         if os.path.exists(self.progress_file):
@@ -161,13 +175,14 @@ class KnowledgeGraphExtractor:
                 f"向知识图谱添加 {len(entity_contents)} 个实体和 {len(all_relations)} 个关系"
             )
 
-            for entity, content_units in entity_contents.items():
-                self.kg.add_entity(entity, content_units)
+            self.kg.add_entities(entity_contents)
 
-            for relation in all_relations:
-                self.kg.add_relationship(
-                    relation["source"], relation["target"], relation["relation"]
-                )
+            self.kg.add_relationships(
+                [
+                    (relation["source"], relation["target"], relation["relation"])
+                    for relation in all_relations
+                ]
+            )
 
             return True
 
@@ -183,28 +198,39 @@ class KnowledgeGraphExtractor:
             else:
                 data = input_data_or_file
 
-            unprocessed_items = [
-                (item_id, data)
-                for item_id, data in list(data.items())
-                if item_id not in self.processed_files
-            ]
+            # 从加载到处理完成都持有知识库锁，避免与压缩、发布等操作同时修改
+            with knowledge_base_lock(self.knowledge_base_path):
+                self.load_knowledge_base()
 
-            if not unprocessed_items:
-                print("没有新的数据需要处理")
-                return self.kg
-
-            print(f"将处理 {len(unprocessed_items)} 个数据项")
-
-            for item_id, item_data in unprocessed_items:
-                if self.process_item(item_id, item_data):
-                    self.save_progress(item_id)
-                    self.processed_files.add(item_id)
-                    self.kg.save()
-                    print(f"数据 {item_id} 处理完成并保存")
+                unprocessed_items = [
+                    (item_id, data)
+                    for item_id, data in list(data.items())
+                    if item_id not in self.processed_files
+                ]
 
-            self.kg.merge_similar_entities()
-            self.kg.remove_duplicates()
-            self.kg.visualize()
+                if not unprocessed_items:
+                    print("没有新的数据需要处理")
+                    return self.kg
+
+                print(f"将处理 {len(unprocessed_items)} 个数据项")
+
+                committed = 0
+                for item_id, item_data in unprocessed_items:
+                    if self.process_item(item_id, item_data):
+                        # 每个数据项提交到变更日志，定期做一次完整保存
+                        self.kg.commit(item_id)
+                        self.save_progress(item_id)
+                        self.processed_files.add(item_id)
+                        committed += 1
+                        if committed % JOURNAL_CHECKPOINT_ITEMS == 0:
+                            self.kg.save()
+                        print(f"数据 {item_id} 处理完成并提交")
+                self.kg.save()
+
+                self.kg.merge_similar_entities()
+                self.kg.remove_duplicates()
+                self.kg.commit()
+                self.kg.visualize()
 
             print("\n数据处理完成")
             return self.kg
@@ -212,6 +238,10 @@ class KnowledgeGraphExtractor:
         except Exception as e:
             print(f"处理文件出错: {str(e)}")
             raise
+        finally:
+            # 合并判断都已完成，释放大模型判断的线程池
+            if self.kg is not None:
+                self.kg.close_llm_pool()
 
 
 def main():
@@ -1,8 +1,11 @@
 from typing import List, Dict, Optional, Tuple, Any
 from enum import Enum
+import os
 import json
 import re
 from knowledgeGraph import KnowledgeGraph
+from kb_registry import KnowledgeBaseRegistry
+from kb_bundle import current_version
 
 
 class RetrievalMode(Enum):
@@ -15,16 +18,44 @@ class RetrievalMode(Enum):
 class KnowledgeRetriever:
     def __init__(self, knowledge_base_path: str = "./knowledge_base"):
         """初始化知识检索服务"""
+        self.knowledge_base_path = knowledge_base_path
         self.retrieval_cache: Dict[str, int] = {}  # 检索结果缓存
         self.initial_cache_rounds = 5  # 缓存初始轮数
+        self.kg: Optional[KnowledgeGraph] = None
+        self._load_failed = False  # 上次加载是否失败
+        self._failed_version: Optional[str] = None  # 加载失败时知识库发布的版本
 
-        try:
-            print(f"\n[Info] 正在加载知识图谱...")
-            self.kg = KnowledgeGraph(knowledge_base_path)
+        print(f"\n[Info] 正在加载知识图谱...")
+        if self.snapshot() is not None:
             print(f"[Info] 知识图谱加载成功！")
-        except Exception as e:
-            print(f"加载知识图谱时出错: {str(e)}")
-            self.kg = None
+
+    @classmethod
+    def get_shared_graph(cls, knowledge_base_path: str) -> KnowledgeGraph:
+        """获取（必要时加载）进程内共享的知识图谱的当前版本"""
+        return KnowledgeBaseRegistry.get(knowledge_base_path)
+
+    def snapshot(self) -> Optional[KnowledgeGraph]:
+        """
+        取知识图谱的当前版本，一轮对话内的所有检索都应使用同一个快照
+
+        加载失败后，只有知识库发布了新版本才会重新尝试加载
+        """
+        if self.kg is None:
+            version = current_version(self.knowledge_base_path)
+            if self._load_failed and version == self._failed_version:
+                return None
+            try:
+                self.kg = self.get_shared_graph(self.knowledge_base_path)
+            except Exception as e:
+                print(f"加载知识图谱时出错: {str(e)}")
+                self._load_failed = True
+                self._failed_version = version
+                return None
+            self._load_failed = False
+            return self.kg
+
+        self.kg = self.get_shared_graph(self.knowledge_base_path)
+        return self.kg
 
     def _get_cached_results(self, results: List[Tuple[Any, float]]) -> List[str]:
         """处理检索结果的缓存逻辑
@@ -419,10 +450,20 @@ class KnowledgeRetriever:
         return None
 
     def retrieve(
-        self, mode: RetrievalMode, query: str, entities: List[str]
+        self,
+        mode: RetrievalMode,
+        query: str,
+        entities: List[str],
+        kg: Optional[KnowledgeGraph] = None,
     ) -> Optional[str]:
-        """统一的检索接口"""
-        if not self.kg:
+        """
+        统一的检索接口
+
+        kg 为本轮对话开始时 snapshot() 得到的快照，同一轮的多次检索传入同一个快照，
+        期间发布的新版本从下一轮开始生效；不传时取当前版本
+        """
+        self.kg = kg if kg is not None else self.snapshot()
+        if self.kg is None:
             return None
 
         self.update_cache_counts()
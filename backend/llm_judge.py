@@ -0,0 +1,233 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from openai import OpenAI
+
+from config import LLM_CACHE_DIR, LLM_CONCURRENCY
+
+ENTITY_MERGE_PROMPT = "prompt/entity_merge.txt"
+RELATIONSHIP_MERGE_PROMPT = "prompt/relationship_merge.txt"
+JUDGE_MODEL = "moonshot-v1-8k"
+
+_prompts: Dict[str, Tuple[str, str]] = {}  # 路径 -> (模板, 模板sha)
+_prompts_lock = threading.Lock()
+
+
+def load_prompt(path: str) -> Tuple[str, str]:
+    """读取提示词模板（每个文件只读一次），返回模板和模板内容的sha"""
+    if path not in _prompts:
+        with _prompts_lock:
+            if path not in _prompts:
+                with open(path, "r", encoding="utf-8") as f:
+                    template = f.read()
+                digest = hashlib.sha1(template.encode("utf-8")).hexdigest()
+                _prompts[path] = (template, digest)
+    return _prompts[path]
+
+
+class VerdictCache:
+    """
+    大模型判断结果的持久化缓存
+
+    以 (模型名, 提示词模板sha, 判断参数) 为键，追加写入 JSONL 文件。
+    提示词修改后键随之改变，旧结果自然失效；重建知识库时同样的判断直接复用。
+    """
+
+    CACHE_FILE = "verdicts.jsonl"
+
+    def __init__(self, cache_dir: str):
+        """
+        初始化判断缓存
+
+        Args:
+            cache_dir: 缓存目录
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_file = os.path.join(cache_dir, self.CACHE_FILE)
+        self._entries: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def key(model: str, prompt_sha: str, args: Sequence[str]) -> str:
+        """计算缓存键"""
+        payload = json.dumps([model, prompt_sha, *args], ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """查询缓存，未命中时返回 None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key: str, value) -> None:
+        """写入缓存并立即追加到文件"""
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            # 单行追加写入，多个进程同时写也不会交错
+            with open(self.cache_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "value": value}, ensure_ascii=False) + "\n")
+
+    def stats(self) -> Dict[str, int]:
+        """获取缓存统计信息"""
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _load(self) -> None:
+        """加载已有缓存，跳过写入中断留下的不完整行"""
+        if not os.path.exists(self.cache_file):
+            return
+        with open(self.cache_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._entries[entry["key"]] = entry["value"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+        print(f"已加载大模型判断缓存，共 {len(self._entries)} 条")
+
+
+class LLMJudge:
+    """
+    实体合并判断和关系合并的大模型调用
+
+    相同的判断只调用一次大模型，结果写入持久化缓存；批量判断时
+    在线程池中并发调用，并发数由 LLM_CONCURRENCY 限制。
+    """
+
+    _cache: Optional[VerdictCache] = None
+    _cache_lock = threading.Lock()
+
+    def __init__(self, client: Callable[[], OpenAI], max_workers: int = LLM_CONCURRENCY):
+        """
+        初始化判断器
+
+        Args:
+            client: 返回LLM客户端的函数，首次调用大模型时才会执行
+            max_workers: 批量判断时的最大并发数
+        """
+        self._client = client
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def get_cache(cls) -> Optional[VerdictCache]:
+        """获取进程内共享的判断缓存，LLM_CACHE_DIR 为空时不使用缓存"""
+        if cls._cache is None and LLM_CACHE_DIR:
+            with cls._cache_lock:
+                if cls._cache is None:
+                    try:
+                        cls._cache = VerdictCache(LLM_CACHE_DIR)
+                    except Exception as e:
+                        print(f"创建大模型判断缓存失败，将不使用缓存: {str(e)}")
+        return cls._cache
+
+    def should_merge(self, entity1: str, entity2: str) -> bool:
+        """判断两个实体是否应该合并"""
+        return self._ask(ENTITY_MERGE_PROMPT, (entity1, entity2))
+
+    def should_merge_many(self, pairs: Sequence[Tuple[str, str]]) -> List[bool]:
+        """
+        并发判断多对实体是否应该合并
+
+        Args:
+            pairs: [(实体1, 实体2), ...]
+
+        Returns:
+            List[bool]: 与输入一一对应的判断结果
+        """
+        return self._map(self.should_merge, pairs)
+
+    def merge_relationship(self, entity1: str, entity2: str, rel1: str, rel2: str) -> str:
+        """合并两个关系描述，出错时保留第一个关系"""
+        return self._ask(RELATIONSHIP_MERGE_PROMPT, (entity1, entity2, rel1, rel2))
+
+    def merge_relationships_many(
+        self, items: Sequence[Tuple[str, str, str, str]]
+    ) -> List[str]:
+        """并发合并多组关系描述，items 为 [(起始实体, 目标实体, 关系1, 关系2), ...]"""
+        return self._map(self.merge_relationship, items)
+
+    def _map(self, func, items: Sequence[tuple]) -> list:
+        """在线程池中执行判断，相同的参数只执行一次"""
+        unique = list(dict.fromkeys(items))
+        if len(unique) <= 1:
+            results = {item: func(*item) for item in unique}
+        else:
+            results = dict(
+                zip(unique, self._get_executor().map(lambda item: func(*item), unique))
+            )
+        return [results[item] for item in items]
+
+    def close(self) -> None:
+        """关闭线程池（之后再批量判断时会重新创建）"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="llm-judge"
+                    )
+        return self._executor
+
+    def _ask(self, prompt_path: str, args: Tuple[str, ...]):
+        """带缓存的单次判断"""
+        try:
+            template, prompt_sha = load_prompt(prompt_path)
+        except Exception as e:
+            print(f"读取提示词模板 {prompt_path} 失败: {str(e)}")
+            return self._fallback(prompt_path, args)
+
+        cache = self.get_cache()
+        key = VerdictCache.key(JUDGE_MODEL, prompt_sha, args)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+
+        if prompt_path == ENTITY_MERGE_PROMPT:
+            prompt = template.format(entity1=args[0], entity2=args[1])
+        else:
+            prompt = template.format(
+                entity1=args[0], entity2=args[1], rel1=args[2], rel2=args[3]
+            )
+
+        try:
+            response = self._client().chat.completions.create(
+                model=JUDGE_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.5,
+            )
+            answer = response.choices[0].message.content.strip()
+        except Exception as e:
+            if prompt_path == ENTITY_MERGE_PROMPT:
+                print(f"LLM判断发生错误: {str(e)}")
+            else:
+                print(f"LLM合并关系时发生错误: {str(e)}")
+            return self._fallback(prompt_path, args)  # 出错的结果不写入缓存
+
+        value = answer.lower() == "yes" if prompt_path == ENTITY_MERGE_PROMPT else answer
+        if cache is not None:
+            cache.put(key, value)
+        return value
+
+    @staticmethod
+    def _fallback(prompt_path: str, args: Tuple[str, ...]):
+        """调用失败时的默认结果：不合并实体，保留第一个关系"""
+        return False if prompt_path == ENTITY_MERGE_PROMPT else args[2]
@@ -99,6 +99,10 @@ for PLATFORM in bilibili weibo zhihu; do
         
         python knowledgeGraphExtractor.py "$INPUT_FILE" "$KB_DIR"
         check_status "生成 $PLATFORM 知识图谱失败"
+
+        # 发布服务包，运行中的服务会自动切换到新版本
+        python kb_bundle.py "$KB_DIR"
+        check_status "发布 $PLATFORM 服务包失败"
         
         # 清理临时文件
         rm "$INPUT_FILE"
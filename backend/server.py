@@ -6,19 +6,37 @@ import asyncio
 import json
 import os
 import shutil
+import threading
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse
 from web_engine import WebPlatformWar
+from chat import PLATFORM_KNOWLEDGE_BASE
+from embedding_model import EmbeddingModel
+from knowledge_retriever import KnowledgeRetriever
+from kb_registry import KnowledgeBaseRegistry, warm_up
+from kb_bundle import publish_bundle
+from graph_format import load_node_link_data
 from config import PLATFORM_NAME, API_KEY, API_BASE_URL
 from openai import OpenAI
 from knowledgeGraphExtractor import KnowledgeGraphExtractor
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时在后台预热，关闭时停止知识库检查线程
+    threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    # 定期检查知识库是否发布了新版本
+    KnowledgeBaseRegistry.start_watcher()
+    yield
+    KnowledgeBaseRegistry.stop_watcher()
+
+app = FastAPI(lifespan=lifespan)
 
 # 知识库上传目录
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# 处理知识库的后台任务
-async def process_knowledge_base_task(file_path: str, platform_name: str):
+# 处理知识库的后台任务（普通函数在线程池中执行，不阻塞事件循环）
+def process_knowledge_base_task(file_path: str, platform_name: str):
     try:
         print(f"开始处理 {platform_name} 的知识库: {file_path}")
         
@@ -37,6 +55,10 @@ async def process_knowledge_base_task(file_path: str, platform_name: str):
         # 注意：这里我们直接传入数据对象，而不是文件路径
         extractor.process_data(data)
         
+        # 发布新版本的服务包，已加载该知识库的进程在后台加载后无缝切换
+        publish_bundle(kb_path)
+        KnowledgeBaseRegistry.refresh(kb_path)
+        
         print(f"{platform_name} 知识库处理完成！")
         
         # 更新全局配置，让前端能感知到新平台 (虽然这里是硬编码的PLATFORM_NAME，但我们可以动态添加)
@@ -168,17 +190,16 @@ async def get_platform_data(platform: str):
         raise HTTPException(status_code=404, detail=f"Platform data not found for {platform}")
     
     try:
-        graph_path = os.path.join(base_path, "graph.json")
         communities_path = os.path.join(base_path, "communities.json")
         
-        if not os.path.exists(graph_path) or not os.path.exists(communities_path):
+        if not os.path.exists(communities_path):
              raise HTTPException(status_code=404, detail="Data files missing")
 
-        with open(graph_path, "r", encoding="utf-8") as f:
-            graph_data = json.load(f)
-            # Check if data is wrapped in a top-level "graph" key (common in some NetworkX exports)
-            if "graph" in graph_data and "nodes" in graph_data["graph"]:
-                graph_data = graph_data["graph"]
+        try:
+            # 图结构以二进制保存，这里按需转换为 node-link JSON
+            graph_data = load_node_link_data(base_path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="Data files missing")
                 
         with open(communities_path, "r", encoding="utf-8") as f:
             communities_data = json.load(f)
@@ -191,6 +212,66 @@ async def get_platform_data(platform: str):
         print(f"Error loading data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# 启动预热状态
+warmup_state = {
+    "ready": False,
+    "steps": {},  # 步骤名 -> pending / running / done / skipped / failed
+    "errors": {},
+}
+
+def _run_warmup_step(name: str, step) -> None:
+    warmup_state["steps"][name] = "running"
+    try:
+        if step() is False:
+            warmup_state["steps"][name] = "skipped"
+        else:
+            warmup_state["steps"][name] = "done"
+    except Exception as e:
+        print(f"预热步骤 {name} 失败: {e}")
+        warmup_state["steps"][name] = "failed"
+        warmup_state["errors"][name] = str(e)
+
+def _warmup_embedding_model():
+    # 加载嵌入模型并完成一次前向计算
+    EmbeddingModel.get_instance().embed_query("预热")
+
+def _warmup_knowledge_base(kb_path: str):
+    if not os.path.exists(kb_path):
+        return False
+    # 每个向量库各跑一次查询
+    warm_up(KnowledgeRetriever.get_shared_graph(kb_path))
+
+def warmup():
+    """后台预热：加载嵌入模型和各平台知识库"""
+    steps = [("embedding_model", _warmup_embedding_model)]
+    steps += [
+        (f"kb:{platform}", lambda path=kb_path: _warmup_knowledge_base(path))
+        for platform, kb_path in PLATFORM_KNOWLEDGE_BASE.items()
+    ]
+    for name, _ in steps:
+        warmup_state["steps"][name] = "pending"
+
+    for name, step in steps:
+        _run_warmup_step(name, step)
+
+    # 有步骤失败时保持未就绪，由 /api/ready 返回失败原因
+    warmup_state["ready"] = not warmup_state["errors"]
+    if warmup_state["ready"]:
+        print("预热完成")
+    else:
+        print(f"预热失败: {', '.join(warmup_state['errors'])}")
+
+@app.get("/api/ready")
+async def ready():
+    # 预热完成前或有步骤失败时返回503（附带 errors），负载均衡只把流量发给已预热的实例
+    status_code = 200 if warmup_state["ready"] else 503
+    steps = warmup_state["steps"]
+    finished = sum(1 for status in steps.values() if status not in ("pending", "running"))
+    return JSONResponse(
+        status_code=status_code,
+        content={**warmup_state, "progress": f"{finished}/{len(steps)}"},
+    )
+
 @app.get("/")
 async def root():
     return {